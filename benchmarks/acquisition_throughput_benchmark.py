@@ -0,0 +1,65 @@
+"""
+Throughput of ModbusHardware.data_acquisition against the device simulator: transactions/s, cycle time and
+CPU per cycle, for one of our register maps served by many slaves over Modbus TCP or an RTU pty link.
+
+    python benchmarks/acquisition_throughput_benchmark.py --map tristar --slaves 8 --latency 0.005
+    python benchmarks/acquisition_throughput_benchmark.py --transport rtu --baudrate 19200 --map renogy
+"""
+import argparse
+import statistics
+import time
+
+from hardware.modbus.client_pool import ModbusClientPool
+from hardware.modbus.modbus_hardware import ModbusHardware, ModbusClientType
+from hardware.modbus.simulator import ModbusSimulator, SimulatedBus, SIMULATED_MAPS
+
+
+def run(args) -> dict:
+    bus = SimulatedBus.from_map(args.map, slave_ids=range(1, args.slaves + 1), jitter=2, latency=args.latency,
+                                baudrate=args.baudrate if args.transport == "rtu" else None)
+    simulator = ModbusSimulator.tcp(bus) if args.transport == "tcp" else ModbusSimulator.rtu(bus)
+    with simulator:
+        hardware = ModbusHardware(client_type=ModbusClientType[args.transport.upper()], host=simulator.host,
+                                  port=simulator.port, baudrate=args.baudrate or 9600,
+                                  modbus_map_path=str(SIMULATED_MAPS[args.map]))
+        registers = list(hardware.modbus_map.registers.keys())
+        devices = [{"slave_id": s, "mac": f"sim-{s}"} for s in range(1, args.slaves + 1)]
+        hardware.data_acquisition(devices, registers, None)  # connect outside of the timing
+        requests = bus.requests
+        cycles, cpu = [], []
+        process_start = time.process_time()
+        for _ in range(args.cycles):
+            start, cpu_start = time.perf_counter(), time.thread_time()
+            hardware.data_acquisition(devices, registers, None)
+            cycles.append(time.perf_counter() - start)
+            cpu.append(time.thread_time() - cpu_start)
+        process_cpu = time.process_time() - process_start
+        ModbusClientPool().close_all()
+    transactions = bus.requests - requests
+    return {
+        "transactions/s": transactions / sum(cycles),
+        "transactions/cycle": transactions / args.cycles,
+        "cycle mean ms": 1000 * statistics.mean(cycles),
+        "cycle p95 ms": 1000 * sorted(cycles)[int(0.95 * (len(cycles) - 1))],
+        "acquisition cpu ms/cycle": 1000 * statistics.mean(cpu),
+        "process cpu ms/cycle": 1000 * process_cpu / args.cycles,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--map", choices=sorted(SIMULATED_MAPS), default="esslix")
+    parser.add_argument("--transport", choices=["tcp", "rtu"], default="tcp")
+    parser.add_argument("--slaves", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--baudrate", type=int, default=None, help="RTU link speed, adds the frame times")
+    parser.add_argument("--cycles", type=int, default=50)
+    args = parser.parse_args()
+    print(f"{args.map} over {args.transport.upper()}, {args.slaves} slaves, latency {args.latency}s, "
+          f"baudrate {args.baudrate or '-'}, {args.cycles} cycles")
+    for name, value in run(args).items():
+        print(f"  {name:>26}: {value:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Micro-benchmark: reference nested dict averaging vs the ColumnarAggregator.
+
+    python benchmarks/aggregation_benchmark.py --samples 10 --devices 16 --points 120
+"""
+import argparse
+import random
+import timeit
+
+from telemetry.aggregation import ColumnarAggregator, average_synchronized_samples
+
+
+def build_samples(n_samples: int, n_systems: int, n_devices: int, n_points: int) -> list:
+    rng = random.Random(42)
+    samples = []
+    for _ in range(n_samples):
+        sample = {}
+        for s in range(n_systems):
+            devices = {f"dev{d}": {f"point_{p}": rng.uniform(0, 1000) for p in range(n_points)}
+                       for d in range(n_devices)}
+            sample[f"system_{s}"] = {f"hw_{s}": devices}
+        samples.append(sample)
+    return samples
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark telemetry sample aggregation')
+    parser.add_argument('--samples', type=int, default=10, help="Samples per interval")
+    parser.add_argument('--systems', type=int, default=4, help="Number of systems (one hardware each)")
+    parser.add_argument('--devices', type=int, default=8, help="Devices per hardware")
+    parser.add_argument('--points', type=int, default=80, help="Points (registers) per device")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed repetitions")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    samples = build_samples(args.samples, args.systems, args.devices, args.points)
+    aggregator = ColumnarAggregator()
+    values = args.samples * args.systems * args.devices * args.points
+    print(f"{values} values: {args.samples} samples x {args.systems} systems x "
+          f"{args.devices} devices x {args.points} points")
+    for method in ["mean", "median", "last"]:
+        reference = timeit.timeit(lambda: average_synchronized_samples(samples, method), number=args.repeat)
+        columnar = timeit.timeit(lambda: aggregator.aggregate(samples, method), number=args.repeat)
+        print(f"{method:>7}: reference {reference / args.repeat * 1000:8.2f}ms  "
+              f"columnar {columnar / args.repeat * 1000:8.2f}ms  speedup {reference / columnar:5.1f}x")
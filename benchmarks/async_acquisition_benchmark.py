@@ -0,0 +1,95 @@
+"""
+Acquisition wall time of a multi-gateway Modbus TCP site: sequential reads, the threaded AcquisitionScheduler
+and the asyncio path.  Every gateway is a local pymodbus server answering after --latency seconds, like an
+RTU bus behind a TCP gateway.
+
+    python benchmarks/async_acquisition_benchmark.py --gateways 4 --devices 2 --latency 0.02
+"""
+import argparse
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusSlaveContext, ModbusServerContext
+from pymodbus.server import StartTcpServer
+
+from hardware.acquisition_scheduler import AcquisitionScheduler
+from hardware.hardware_deployment import HardwareDeployment
+from hardware.modbus.eve_battery import EveBattery
+from hardware.modbus.modbus_hardware import ModbusClientType
+
+MAP_PATH = Path(__file__).parents[1] / "data" / "Esslix" / "esslix_modbus_map.json"
+
+
+class SlowDataBlock(ModbusSequentialDataBlock):
+    """ Answers after a fixed delay, the server thread blocks like a slow serial bus """
+
+    def __init__(self, latency: float):
+        super().__init__(0, list(range(1, 501)))
+        self.latency = latency
+
+    def getValues(self, address, count=1):
+        time.sleep(self.latency)
+        return super().getValues(address, count)
+
+
+def start_gateway(port: int, latency: float):
+    block = SlowDataBlock(latency)
+    context = ModbusServerContext(slaves=ModbusSlaveContext(hr=block, ir=block), single=True)
+    threading.Thread(target=StartTcpServer, kwargs={"context": context, "address": ("127.0.0.1", port)},
+                     daemon=True).start()
+
+
+def build_site(n_gateways: int, n_devices: int, base_port: int) -> dict:
+    deployments = {}
+    registers = None
+    for g in range(n_gateways):
+        hardware = EveBattery(client_type=ModbusClientType.TCP, host="127.0.0.1", port=base_port + g,
+                              modbus_map_path=str(MAP_PATH))
+        hardware.client_type = ModbusClientType.TCP
+        registers = registers or list(hardware.modbus_map.registers.keys())
+        devices = [{"slave_id": d + 1, "mac": f"gw{g}-dev{d}"} for d in range(n_devices)]
+        deployments[f"gw{g}"] = HardwareDeployment(hardware, devices, {"DATA": {"registers": registers}}, f"gw{g}")
+    return {"BMS": deployments}
+
+
+async def timed(scheduler: AcquisitionScheduler, site: dict, repeat: int) -> float:
+    await scheduler.acquire(site)  # connect outside of the timing
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await scheduler.acquire(site)
+    return (time.perf_counter() - start) / repeat
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark threaded vs asyncio Modbus acquisition')
+    parser.add_argument('--gateways', type=int, default=4, help="Number of Modbus TCP gateways")
+    parser.add_argument('--devices', type=int, default=2, help="Slaves behind each gateway")
+    parser.add_argument('--latency', type=float, default=0.02, help="Gateway response time per read (s)")
+    parser.add_argument('--workers', type=int, default=2, help="Threads of the threaded scheduler")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed repetitions")
+    parser.add_argument('--port', type=int, default=15020, help="First gateway port")
+    return parser.parse_args()
+
+
+async def main(args):
+    for g in range(args.gateways):
+        start_gateway(args.port + g, args.latency)
+    await asyncio.sleep(1.0)
+    site = build_site(args.gateways, args.devices, args.port)
+
+    print(f"{args.gateways} gateways x {args.devices} devices, {args.latency * 1000:.0f}ms per read")
+    results = {
+        "sequential": await timed(AcquisitionScheduler(max_workers=1), site, args.repeat),
+        f"threaded ({args.workers} workers)": await timed(AcquisitionScheduler(max_workers=args.workers),
+                                                          site, args.repeat),
+        "asyncio": await timed(AcquisitionScheduler(max_workers=1, use_async=True), site, args.repeat),
+    }
+    baseline = results["sequential"]
+    for name, elapsed in results.items():
+        print(f"{name:>22}: {elapsed * 1000:8.1f}ms  speedup {baseline / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,67 @@
+"""
+Micro-benchmark: per-register convert_register_value vs the compiled BlockDecoder on the blocks planned
+for a whole Modbus map.
+
+    python benchmarks/decode_benchmark.py --map data/MorningStar/tristar_v11_modbus_map.json --gap 4
+"""
+import argparse
+import random
+import timeit
+from pathlib import Path
+
+from hardware.modbus.block_decoder import decoder_for
+from hardware.modbus.modbus_hardware import convert_register_value
+from hardware.modbus.modbus_map import ModbusMap
+from hardware.modbus.read_planner import plan_reads
+
+DATA_PATH = Path(__file__).parents[1] / "data"
+
+
+def decode_registers(values, block, raw, registers):
+    for register in registers:
+        try:
+            values[register.name] = convert_register_value(block.slice(raw, register), register)
+        except (ValueError, TypeError):
+            pass
+
+
+def per_register(blocks, words):
+    values = {}
+    for block, raw in zip(blocks, words):
+        decode_registers(values, block, raw, block.registers)
+    return values
+
+
+def vectorized(blocks, words):
+    values = {}
+    for block, raw in zip(blocks, words):
+        decoder = decoder_for(block)
+        values.update(decoder.decode(raw))
+        decode_registers(values, block, raw, decoder.fallback)
+    return values
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Modbus block decoding')
+    parser.add_argument('--map', default=str(DATA_PATH / "MorningStar" / "tristar_v11_modbus_map.json"),
+                        help="Modbus map (JSON)")
+    parser.add_argument('--gap', type=int, default=4, help="Read planner max_gap")
+    parser.add_argument('--repeat', type=int, default=2000, help="Timed repetitions")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    registers = list(ModbusMap.from_json(args.map).registers.values())
+    # Named conversions ("BCD", ...) are outside of the decoder, and costly enough to hide the comparison
+    registers = [r for r in registers if isinstance(r.conversion_factor, (int, float))]
+    blocks = plan_reads(registers, max_gap=args.gap)
+    rng = random.Random(42)
+    words = [[rng.randrange(0x10000) for _ in range(block.count)] for block in blocks]
+    assert per_register(blocks, words) == vectorized(blocks, words)
+
+    print(f"{len(registers)} registers in {len(blocks)} blocks ({sum(b.count for b in blocks)} words)")
+    reference = timeit.timeit(lambda: per_register(blocks, words), number=args.repeat)
+    compiled = timeit.timeit(lambda: vectorized(blocks, words), number=args.repeat)
+    print(f"per register {reference / args.repeat * 1e6:8.1f}us  block decoder {compiled / args.repeat * 1e6:8.1f}us"
+          f"  speedup {reference / compiled:5.1f}x")
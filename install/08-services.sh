@@ -59,6 +59,33 @@ fi
 
 
 
+echo "bus-broker setup"
+if [ -f "/etc/systemd/system/bus-broker.service" ]; then
+    echo "bus-broker service already exists. Skipping creation."
+else
+
+    # Setup the Modbus bus broker, the services reach the buses through it when BUS_BROKER_SOCKET is set
+    echo "Setting up bus-broker service..."
+    cat > "/etc/systemd/system/bus-broker.service" << EOF
+[Unit]
+Description=Modbus Bus Broker Service
+After=network.target
+Before=iot-controller.service vmc-ui.service cmd-controller.service
+
+[Service]
+Type=simple
+User=root
+WorkingDirectory=$APP_DIR
+ExecStart=$APP_DIR/venv/bin/python $APP_DIR/src/jobs/bus_broker.py
+Restart=always
+RestartSec=10
+
+[Install]
+WantedBy=multi-user.target
+EOF
+fi
+
+
 echo "iot-controller setup"
 if [ -f "/etc/systemd/system/iot-controller.service" ]; then
     echo "iot-controller service already exists. Skipping creation."
@@ -134,6 +161,22 @@ if [ $? -ne 0 ]; then
 fi
 
 
+# Bus Broker Service, started before the services using it
+echo "Enabling bus-broker service..."
+systemctl enable bus-broker.service
+if [ $? -ne 0 ]; then
+    echo "ERROR: Failed to enable bus-broker service"
+    exit 1
+fi
+
+echo "Starting bus-broker service..."
+systemctl start bus-broker.service
+if [ $? -ne 0 ]; then
+    echo "ERROR: Failed to start bus-broker service"
+    exit 1
+fi
+
+
 # VMC UI Service
 echo "Enabling vmc-ui service..."
 systemctl enable vmc-ui.service
@@ -186,6 +229,7 @@ systemctl status vmc-ui.service --no-pager
 systemctl status iot-controller.service --no-pager
 systemctl status cmd-controller --no-pager
 systemctl status network-watchdog --no-pager
+systemctl status bus-broker --no-pager
 
 echo "Service setup complete!"
 exit 0
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Tuple
+
+from database.database_manager import DatabaseManager
+from hardware.hardware_deployment import instantiate_hardware_from_dict
+from hardware.modbus.modbus import modbus_data_write_many
+from hardware.modbus.modbus_hardware import ModbusHardware
+from .base_action import Action
+from .action_status import ActionStatus
+from config.telemetry_config import TelemetryConfig
+from config.mqtt_config import MQTTConfig
+from utils import JSON, LogManager, EnvVars
+
+
+class ModbusWriteAction(Action):
+    """
+    Bulk Modbus parameter push:
+        {"system": "BMS", "hardware_id": "<external_ref>", "slave_id": 1, "values": {"register": raw value},
+         "verify": true}
+    hardware_id may be omitted when the system has a single hardware entry.
+    """
+
+    async def execute(self, telemetry_config: TelemetryConfig,
+                      mqtt_config: MQTTConfig) -> Tuple[ActionStatus, JSON]:
+        logger = LogManager().get_logger("ModbusWriteAction")
+
+        system = self.params.get("system")
+        values = self.params.get("values")
+        slave_id = self.params.get("slave_id")
+        if not system or not isinstance(values, dict) or not values or slave_id is None:
+            return ActionStatus.INVALID_PARAMS, {"error": "system, slave_id and values are required"}
+
+        hardware_rows = list(DatabaseManager(EnvVars().db_path).get_hardware_systems(system))
+        hardware_id = self.params.get("hardware_id")
+        if hardware_id:
+            hardware_rows = [h for h in hardware_rows if h["external_ref"] == hardware_id]
+        if len(hardware_rows) != 1:
+            return ActionStatus.INVALID_PARAMS, {"error": f"{len(hardware_rows)} {system} hardware entries match, "
+                                                          f"expected one"}
+        try:
+            deployment = instantiate_hardware_from_dict(hardware_rows[0], logger)
+        except Exception as e:
+            logger.error(f"Unable to build the {system} hardware: {e}")
+            return ActionStatus.FAILED, {"error": str(e)}
+        hardware = deployment.hardware
+        if not isinstance(hardware, ModbusHardware):
+            return ActionStatus.INVALID_PARAMS, {"error": f"{system} is not Modbus hardware"}
+
+        logger.info(f"Writing {len(values)} registers to {system} slave {slave_id}")
+        result = await asyncio.to_thread(modbus_data_write_many, hardware, hardware.modbus_map, int(slave_id),
+                                         values, bool(self.params.get("verify", True)), logger)
+        if result.errors and not result.written:
+            return ActionStatus.INVALID_PARAMS, result.to_dict()
+        return (ActionStatus.SUCCESS if result.success else ActionStatus.FAILED), result.to_dict()
@@ -134,7 +134,7 @@ async def get_bms_data(hardware: Annotated[HardwareDeploymentRoute, Depends(get_
     try:
         # Update each unit
         batteries = get_batteries(hardware)
-        values = batteries.data_acquisition()
+        values = await batteries.async_data_acquisition()
         for device in batteries.devices:
             unit_id = device["mac"]
             filename = f"{BMS_SYSTEM}_{unit_id}.csv"
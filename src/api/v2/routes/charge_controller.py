@@ -30,7 +30,7 @@ async def get_bms_data(hardware: Annotated[HardwareDeploymentRoute, Depends(get_
         cc = get_charge_controller(hardware)
         if not cc:
             return JSONResponse(content={"data": {}, "error": "No charge controller configured"})
-        values = cc.data_acquisition()
+        values = await cc.async_data_acquisition()
         for device in cc.devices:
             unit_id = device["mac"]
             if isinstance(values, dict):  # Ensure values is a dictionary
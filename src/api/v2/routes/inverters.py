@@ -67,7 +67,7 @@ async def inverters(request: Request, deployment: Annotated[HardwareDeploymentRo
 async def get_inverter_data(deployment: Annotated[HardwareDeploymentRoute, Depends(get_hardware)]):
     try:
         hardware = get_inverter(deployment)
-        values = hardware.data_acquisition()
+        values = await hardware.async_data_acquisition()
 
         # Update each unit
         for device in hardware.devices:
@@ -1,12 +1,14 @@
 import json
-from typing import Annotated
-from fastapi import APIRouter, Depends
+from typing import Annotated, Optional
+from fastapi import APIRouter, Depends, Body
+from fastapi.concurrency import run_in_threadpool
 
-from hardware.modbus.modbus import modbus_data_write
-from hardware.modbus.modbus_hardware import modbus_data_acquisition
+from hardware.modbus.modbus import modbus_data_write, modbus_data_write_many
+from hardware.modbus.modbus_hardware import ModbusHardware, async_modbus_data_acquisition
 from .hardware_deployment_route import HardwareDeploymentRoute, get_hardware
 from hardware.modbus.modbus_map import ModbusMap
-from utils import LogManager
+from hardware.modbus.transaction_stats import ModbusTransactionStats, load_summary
+from utils import LogManager, EnvVars
 
 
 DATA_PATH = "/root/raptor/data"
@@ -28,7 +30,7 @@ async def write_modbus_register(data: str, hardware_def: Annotated[HardwareDeplo
             "units": "",
             "conversion_factor": 1.0,
             "description": "On demand write",
-            "read_write": "RW"
+            "access": "RW"
         }
     }})
     if page == "BMS":
@@ -41,6 +43,28 @@ async def write_modbus_register(data: str, hardware_def: Annotated[HardwareDeplo
     return {"success": True, "value": values}
 
 
+@router.post("/write_registers")
+async def write_modbus_registers(hardware_def: Annotated[HardwareDeploymentRoute, Depends(get_hardware)],
+                                 page: str = Body(...), unit_id: int = Body(...), values: dict = Body(...),
+                                 verify: bool = Body(True)):
+    """
+    Bulk parameter push, {register_name: raw value} of the page's register map.  Contiguous registers are
+    written in one transaction and, with verify, read back.
+    """
+    deployment = hardware_def.get_hardware(page)
+    if deployment is None:
+        return {"success": False, "error": f"No {page} hardware configured"}
+    # The actuators and some generation hardware are not Modbus
+    hardware = getattr(deployment, "hardware", None)
+    if not isinstance(hardware, ModbusHardware):
+        return {"success": False, "error": f"{page} is not Modbus hardware"}
+    logger.info(f"Writing {len(values)} registers of {page} unit {unit_id}")
+    # The writes block on the bus, keep them off the event loop
+    result = await run_in_threadpool(modbus_data_write_many, hardware, hardware.modbus_map, int(unit_id), values,
+                                     verify)
+    return result.to_dict()
+
+
 @router.get("/modbus_register/{data}")
 async def read_modbus_register(data: str, hardware_def: Annotated[HardwareDeploymentRoute, Depends(get_hardware)]):
     parsed_data = json.loads(data)
@@ -67,6 +91,22 @@ async def read_modbus_register(data: str, hardware_def: Annotated[HardwareDeploy
         hardware = hardware_def.inverter.hardware
     elif page == "Charge Controller":
         hardware = hardware_def.charge_controller.hardware
-    values = modbus_data_acquisition(hardware, m_map.get_registers(["ODQ"]), slave_id=unit_id)
+    values = await async_modbus_data_acquisition(hardware, m_map.get_registers(["ODQ"]), slave_id=unit_id)
     logger.info(values)
     return {"success": True, "value": values['ODQ']}
+
+
+@router.get("/transaction_stats")
+async def transaction_stats(resource: Optional[str] = None, slave_id: Optional[int] = None, top: int = 50,
+                            sort: str = "p95_ms"):
+    """ Latency, timeouts, exceptions and retries per Modbus block read by the IoT controller, slowest first """
+    snapshot = load_summary(EnvVars().modbus_stats_path)
+    if snapshot is None:
+        # The controller has not written any yet, show the reads made from the UI
+        return {"success": True, "source": "ui",
+                "blocks": ModbusTransactionStats().summary(resource, slave_id, top, sort),
+                "dropped": ModbusTransactionStats().dropped}
+    blocks = [row for row in snapshot["blocks"] if (resource is None or row["resource"] == resource)
+              and (slave_id is None or row["slave_id"] == slave_id)]
+    blocks.sort(key=lambda row: row.get(sort, 0), reverse=True)
+    return {"success": True, "source": "iot-controller", "blocks": blocks[:top], "dropped": snapshot["dropped"]}
@@ -5,18 +5,21 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from contextlib import asynccontextmanager
-from utils import LogManager
+from utils import LogManager, EnvVars
 lm = LogManager("vmc-ui.log")
 logger = lm.get_logger("VMC")
 lm.configure_library_loggers()
 from routes import (actuator, bms, configuration, analysis, inverters,
                     modbus, system_status, generation, charge_controller)
 from api.v2.routes.hardware_deployment_route import HardwareDeploymentRoute
+from hardware.modbus.bus_broker import BusBrokerSettings, PRIORITY_UI, UI_MAX_AGE
 
 
 @asynccontextmanager
 async def lifespan(fastapp: FastAPI):
     # Startup
+    # Pages may show registers the IoT controller read a moment ago instead of polling the bus again
+    BusBrokerSettings().configure(EnvVars().bus_broker_socket, PRIORITY_UI, max_age=UI_MAX_AGE)
     fastapp.state.hardware = HardwareDeploymentRoute()
     yield
     # Shutdown
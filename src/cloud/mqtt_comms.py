@@ -1,14 +1,18 @@
 import json
+import os
 import aiomqtt
 import asyncio
 import time
-from typing import AsyncGenerator, Optional
+from dataclasses import dataclass
+from typing import AsyncGenerator, Optional, List, Tuple
 from config.telemetry_config import TelemetryConfig
 from config.mqtt_config import MQTTConfig
 from database.database_manager import DatabaseManager
+from database.telemetry_queue import QueuedFrame
 from utils.envvars import EnvVars
 from logging import Logger
 from utils import JSON
+from utils.singleton import Singleton
 
 
 # Track last connection attempt time and backoff parameters
@@ -51,57 +55,208 @@ async def _should_attempt_connection() -> bool:
     return time_since_last_attempt >= backoff_time
 
 
-async def publish_payload(mqtt_config: MQTTConfig, topic: str, payload: JSON, logger: Logger) -> bool:
-    """Publish payload to MQTT broker with backoff strategy"""
-    global _last_connection_attempt, _connection_failures
+def _connection_restored(logger: Logger):
+    """Reset connection failures on success"""
+    global _connection_failures
+    if _connection_failures > 0:
+        logger.info(f"MQTT connection restored after {_connection_failures} failed attempts")
+        _connection_failures = 0
 
-    # Check if we should attempt connection based on backoff strategy
-    if not await _should_attempt_connection():
-        logger.info(f"Skipping MQTT connection attempt due to backoff (waiting for {_get_backoff_time()}s)")
-        return False
 
-    # Update last connection attempt time
-    _last_connection_attempt = time.time()
+def _connection_failed(e: Exception, logger: Logger):
+    global _connection_failures
+    # Increment connection failures
+    _connection_failures += 1
+    backoff_time = _get_backoff_time()
 
-    try:
-        async with aiomqtt.Client(
-                hostname=mqtt_config.broker,
-                port=mqtt_config.port,
-                username=mqtt_config.username,
-                password=mqtt_config.password
-        ) as client:
-            # Publish to telemetry topic
-            await client.publish(topic=topic, payload=payload.encode(), qos=1)
+    # Log with different levels based on failure count
+    if _connection_failures == 1:
+        logger.warning(f"Error communicating to MQTT broker: {e}. Will retry in {backoff_time}s")
+    elif _connection_failures % 10 == 0:  # Log only every 10 failures to reduce log spam
+        logger.error(
+            f"Still unable to connect to MQTT broker after {_connection_failures} attempts: {e}. Next retry in {backoff_time}s")
+
+
+@dataclass
+class _Publish:
+    topic: str
+    payload: bytes
+    result: asyncio.Future
+    retried: bool = False
+
+
+class MqttPublisher(metaclass=Singleton):
+    """
+    The MQTT session the process publishes through: opened by the first publish, then kept up with keepalive
+    instead of connecting per message.  After a loss the next publish reconnects, with the backoff above.
+    Publishes are queued to the session task and sent in order, each caller awaits its own acknowledgment.
+    The services share the MQTT configuration, each process connects with its own client id (identifier).
+    """
+
+    def __init__(self):
+        self.service: Optional[str] = None
+        self.mqtt_config: Optional[MQTTConfig] = None
+        self.logger: Optional[Logger] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.connected = False
+        self.sessions = 0
+
+    def configure(self, service: Optional[str]):
+        """ Name of the service publishing, part of the client id; the process id is used without one """
+        self.service = service
+
+    def identifier(self, mqtt_config: MQTTConfig) -> str:
+        """ Client id of the session, the listener owns client_id itself and its persistent session """
+        return f"{mqtt_config.client_id or 'raptor'}-{self.service or os.getpid()}-pub"
+
+    async def publish(self, mqtt_config: MQTTConfig, topic: str, payload: bytes, logger: Logger) -> bool:
+        """ :return: whether the broker acknowledged the message (QoS 1) """
+        self._start(mqtt_config, logger)
+        if not self.connected and not await _should_attempt_connection():
+            logger.info(f"Skipping MQTT connection attempt due to backoff (waiting for {_get_backoff_time()}s)")
+            return False
+        message = _Publish(topic, payload, asyncio.get_running_loop().create_future())
+        self.queue.put_nowait(message)
+        return await message.result
+
+    def _start(self, mqtt_config: MQTTConfig, logger: Logger):
+        """ (Re)start the session task in the running loop, a new configuration opens a new session """
+        if self.task is not None and not self.task.done() and self.mqtt_config == mqtt_config and \
+                self.task.get_loop() is asyncio.get_running_loop():
+            return
+        self.cleanup()
+        self.mqtt_config, self.logger = mqtt_config, logger
+        self.connected = False
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run(mqtt_config, self.queue))
+
+    async def _run(self, mqtt_config: MQTTConfig, queue: asyncio.Queue):
+        global _last_connection_attempt
+        message: Optional[_Publish] = None
+        try:
+            while True:
+                if message is None:
+                    message = await queue.get()
+                if not await _should_attempt_connection():
+                    self._fail(message, queue)
+                    message = None
+                    continue
+                _last_connection_attempt = time.time()
+                established = False
+                try:
+                    async with aiomqtt.Client(
+                            hostname=mqtt_config.broker,
+                            port=mqtt_config.port,
+                            username=mqtt_config.username,
+                            password=mqtt_config.password,
+                            keepalive=mqtt_config.keepalive,
+                            identifier=self.identifier(mqtt_config)
+                    ) as client:
+                        established = self.connected = True
+                        self.sessions += 1
+                        _connection_restored(self.logger)
+                        while True:
+                            if not message.result.done():
+                                await client.publish(topic=message.topic, payload=message.payload, qos=1)
+                                if not message.result.done():
+                                    message.result.set_result(True)
+                            message = await queue.get()
+                except Exception as e:
+                    self.connected = False
+                    if established and not message.retried:
+                        # The session dropped while idle, the message goes out on a new one
+                        self.logger.info(f"MQTT publisher session lost ({e}), reconnecting")
+                        message.retried = True
+                        continue
+                    _connection_failed(e, self.logger)
+                    self._fail(message, queue)
+                    message = None
+        finally:
+            if queue is self.queue:
+                self.connected = False
+            self._fail(message, queue)
+
+    @staticmethod
+    def _fail(message: Optional[_Publish], queue: asyncio.Queue):
+        """ Fail the message and the ones queued behind it, their callers retry from the telemetry queue """
+        while message is not None:
+            if not message.result.done():
+                message.result.set_result(False)
+            message = queue.get_nowait() if not queue.empty() else None
+
+    async def close(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    def cleanup(self):
+        if self.task is not None and not self.task.done() and not self.task.get_loop().is_closed():
+            self.task.cancel()
+        self.task = None
 
-        # Reset connection failures on success
-        if _connection_failures > 0:
-            logger.info(f"MQTT connection restored after {_connection_failures} failed attempts")
-            _connection_failures = 0
 
-        return True
+async def publish_payload(mqtt_config: MQTTConfig, topic: str, payload: JSON, logger: Logger) -> bool:
+    """Publish payload to MQTT broker through the process session, with backoff strategy"""
+    try:
+        return await MqttPublisher().publish(mqtt_config, topic, payload.encode(), logger)
     except Exception as e:
-        # Increment connection failures
-        _connection_failures += 1
-        backoff_time = _get_backoff_time()
+        logger.error(f"Error publishing to MQTT broker: {e}")
+        return False
 
-        # Log with different levels based on failure count
-        if _connection_failures == 1:
-            logger.warning(f"Error communicating to MQTT broker: {e}. Will retry in {backoff_time}s")
-        elif _connection_failures % 10 == 0:  # Log only every 10 failures to reduce log spam
-            logger.error(
-                f"Still unable to connect to MQTT broker after {_connection_failures} attempts: {e}. Next retry in {backoff_time}s")
 
-        return False
+def batch_payload(frames: List[QueuedFrame], max_bytes: int) -> Tuple[str, int]:
+    """
+    JSON list of the first frames that fit in max_bytes, at least one.
+    :return: (payload, number of frames in it)
+    """
+    parts = []
+    size = 2
+    for frame in frames:
+        part = json.dumps(frame.to_payload())
+        if parts and size + len(part) + 1 > max_bytes:
+            break
+        parts.append(part)
+        size += len(part) + 1
+    return f"[{','.join(parts)}]", len(parts)
+
+
+async def upload_telemetry_batches(mqtt_config: MQTTConfig, telemetry_config: TelemetryConfig, logger: Logger,
+                                   after_id: int = 0, until_id: Optional[int] = None,
+                                   max_batches: Optional[int] = None) -> Tuple[bool, int]:
+    """
+    Upload the stored frames after after_id up to until_id oldest first in bounded batches.  Each batch is
+    deleted from the queue once its publish is acknowledged, a failure keeps the rest for the next attempt.
+    :return: (whether every batch was published, payload bytes published)
+    """
+    queue = DatabaseManager(EnvVars().db_path).telemetry_queue
+    until_id = queue.last_id() if until_id is None else until_id
+    cursor = after_id
+    uploaded = batches = sent = 0
+    while (max_batches is None or batches < max_batches) and \
+            (frames := queue.read_batch(cursor, telemetry_config.upload_batch_frames, until_id)):
+        payload, count = batch_payload(frames, telemetry_config.upload_batch_bytes)
+        if not await publish_payload(mqtt_config, telemetry_config.telemetry_topic, payload, logger):
+            if batches:
+                logger.warning(f"Telemetry upload stopped after {uploaded} frames, {queue.frames} left")
+            return False, sent
+        queue.delete([frame.id for frame in frames[:count]])
+        cursor = frames[count - 1].id
+        uploaded += count
+        batches += 1
+        sent += len(payload)
+    if batches > 1:
+        logger.info(f"Uploaded {uploaded} frames in {batches} batches")
+    return True, sent
 
 
 async def upload_telemetry_data_mqtt(mqtt_config: MQTTConfig, telemetry_config: TelemetryConfig,
                                      logger: Logger) -> bool:
-    """Upload telemetry data with backoff strategy"""
+    """ Upload all the stored telemetry, frames stored during the upload wait for the next one """
     try:
-        db = DatabaseManager(EnvVars().db_path)
-        payload = db.get_stored_telemetry_data()
-        payload = json.dumps(payload)
-        return await publish_payload(mqtt_config, telemetry_config.telemetry_topic, payload, logger)
+        success, _ = await upload_telemetry_batches(mqtt_config, telemetry_config, logger)
+        return success
     except Exception as e:
         logger.error(f"Error uploading telemetry data: {e}")
         return False
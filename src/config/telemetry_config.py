@@ -1,7 +1,10 @@
 from dataclasses import dataclass
+from typing import Tuple
 
 MQTT_MODE = "mqtt"
 REST_MODE = "rest"
+# Stored frames older than the age (seconds) are rolled up to one frame per resolution (seconds)
+DEFAULT_COMPACTION_LEVELS = ((3600, 60), (86400, 900))
 
 
 @dataclass(frozen=True)
@@ -16,6 +19,17 @@ class TelemetryConfig:
     response_path: str
     sampling: int
     averaging_method: str
+    acquisition_workers: int = 4
+    async_acquisition: bool = False  # opt in to reading Modbus hardware with the pymodbus asyncio clients
+    pipeline_queue_size: int = 8
+    deadband_max_silence: int = 900  # heartbeat of points with a deadband, seconds
+    modbus_stats_interval: int = 300  # period of the Modbus latency measurement, seconds, 0 disables it
+    store_max_bytes: int = 64 * 1024 * 1024  # compressed size budget of the telemetry waiting for upload
+    store_eviction: str = "oldest"  # over budget drop the "oldest" frames or "downsample" the oldest first
+    upload_batch_frames: int = 100  # stored frames published per MQTT message
+    upload_batch_bytes: int = 256 * 1024  # JSON size a batch stops growing at
+    backfill_rate: int = 16 * 1024  # backlog upload budget, payload bytes per second, 0 for no limit
+    compaction_levels: Tuple[Tuple[int, int], ...] = DEFAULT_COMPACTION_LEVELS  # (min age, resolution) pairs
 
     @classmethod
     def from_dict(cls, data: dict) -> 'TelemetryConfig':
@@ -30,7 +44,19 @@ class TelemetryConfig:
             messages_path=data['messages_path'],
             response_path=data.get("response_path", "cmd_response"),
             sampling=data.get("sampling", 3),
-            averaging_method=data.get('averaging_method', "mean")
+            averaging_method=data.get('averaging_method', "mean"),
+            acquisition_workers=int(data.get('acquisition_workers', 4)),
+            async_acquisition=bool(data.get('async_acquisition', False)),
+            pipeline_queue_size=int(data.get('pipeline_queue_size', 8)),
+            deadband_max_silence=int(data.get('deadband_max_silence', 900)),
+            modbus_stats_interval=int(data.get('modbus_stats_interval', 300)),
+            store_max_bytes=int(data.get('store_max_bytes', 64 * 1024 * 1024)),
+            store_eviction=data.get('store_eviction', "oldest"),
+            upload_batch_frames=int(data.get('upload_batch_frames', 100)),
+            upload_batch_bytes=int(data.get('upload_batch_bytes', 256 * 1024)),
+            backfill_rate=int(data.get('backfill_rate', 16 * 1024)),
+            compaction_levels=tuple((int(age), int(resolution)) for age, resolution
+                                    in data.get('compaction_levels', DEFAULT_COMPACTION_LEVELS))
         )
 
     @property
@@ -7,6 +7,7 @@ import time
 import shutil
 
 from utils import LogManager
+from database.telemetry_queue import TelemetryQueue
 import json
 
 
@@ -142,31 +143,21 @@ class DatabaseManager(metaclass=Singleton):
             raise
 
 
+    @property
+    def telemetry_queue(self) -> TelemetryQueue:
+        """ The telemetry frames waiting for upload, compressed and size capped, see TelemetryQueue """
+        return TelemetryQueue(str(self.db_path))
+
     def clear_telemetry_data(self):
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("DELETE FROM telemetry_data")
-            self.connection.commit()
+            self.telemetry_queue.clear()
         except sqlite3.Error as e:
-            self.connection.rollback()
             self.logger.error(f"Error clearing telemetry data: {e}")
             raise
 
-
-
     def get_stored_telemetry_data(self) -> List[Dict[str, Any]]:
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT data, timestamp FROM telemetry_data ORDER BY timestamp DESC")
-            rows = cursor.fetchall()
-
-            result = []
-            for row in rows:
-                data_json, timestamp = row
-                telemetry_data = json.loads(data_json)
-                # Add metadata from the database
-                telemetry_data['timestamp'] = timestamp
-                result.append(telemetry_data)
+            result = self.telemetry_queue.read_all()
             lr = len(result)
             if lr > 1:
                 self.logger.info(f"Collected backlog {lr} rows of telemetry data.")
@@ -180,19 +171,11 @@ class DatabaseManager(metaclass=Singleton):
 
     def store_telemetry_data(self, telemetry_data: Dict[str, Any]):
         try:
-            cursor = self.connection.cursor()
-            data_json = json.dumps(telemetry_data)
-            cursor.execute(
-                "INSERT INTO telemetry_data (data) VALUES (?)",
-                (data_json,)
-            )
-            self.connection.commit()
+            self.telemetry_queue.put(telemetry_data)
         except sqlite3.Error as e:
-            self.connection.rollback()
             self.logger.error(f"Database error writing telemetry data: {e}")
             raise
         except Exception as e:
-            self.connection.rollback()
             self.logger.error(f"Error writing telemetry data: {e}")
             raise
 
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
 import sqlite3
-from typing import List, Tuple
+from typing import Callable, List, Tuple, Union
+
+# A migration step: an SQL statement, or a function of the cursor for the steps depending on the schema found
+MigrationStep = Union[str, Callable[[sqlite3.Cursor], None]]
 
 from utils import EnvVars, LogManager
 
@@ -52,7 +55,7 @@ class DatabaseMigrator:
 
 
 
-    def apply_migration(self, version: int, description: str, sql_statements: List[str]) -> bool:
+    def apply_migration(self, version: int, description: str, sql_statements: List[MigrationStep]) -> bool:
         """Apply a single migration"""
         try:
             conn = sqlite3.connect(self.db_path)
@@ -66,7 +69,9 @@ class DatabaseMigrator:
 
             # Apply migration statements
             for sql in sql_statements:
-                if sql.strip():  # Skip empty statements
+                if callable(sql):
+                    sql(cursor)
+                elif sql.strip():  # Skip empty statements
                     cursor.execute(sql)
 
             # Record migration
@@ -111,7 +116,7 @@ class DatabaseMigrator:
 
 
 
-    def get_migrations(self) -> List[Tuple[int, str, List[str]]]:
+    def get_migrations(self) -> List[Tuple[int, str, List[MigrationStep]]]:
         """Define all database migrations"""
         return [
             # Migration 1: Add network tables
@@ -215,10 +220,45 @@ class DatabaseMigrator:
                     FOREIGN KEY (interface_name) REFERENCES network_interfaces(interface_name),
                     FOREIGN KEY (tunnel_name) REFERENCES ssh_tunnel_config(tunnel_name)
                 )"""
-            ])
+            ]),
+
+            # Migration 4: Learned Modbus block layouts
+            (4, "Add Modbus block layout table", [
+                """CREATE TABLE IF NOT EXISTS modbus_block_layouts (
+                    resource TEXT NOT NULL,
+                    slave_id INTEGER NOT NULL,
+                    map_version TEXT NOT NULL,
+                    layout TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (resource, slave_id, map_version)
+                )"""
+            ]),
+
+            # Migration 5: Compressed store-and-forward telemetry queue, telemetry_data rows are moved to it
+            # by TelemetryQueue on first use
+            (5, "Add telemetry queue table", [
+                """CREATE TABLE IF NOT EXISTS telemetry_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    weight INTEGER NOT NULL DEFAULT 1,
+                    lines INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    payload BLOB NOT NULL
+                )"""
+            ]),
+
+            # Migration 6: Resolution of the compacted telemetry frames.  schema.sql and TelemetryQueue create
+            # the table with the column already, it is only added to the tables of migration 5.
+            (6, "Add resolution to the telemetry queue", [_add_telemetry_queue_resolution])
         ]
 
 
+def _add_telemetry_queue_resolution(cursor: sqlite3.Cursor):
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(telemetry_queue)")}
+    if "resolution" not in columns:
+        cursor.execute("ALTER TABLE telemetry_queue ADD COLUMN resolution INTEGER NOT NULL DEFAULT 0")
+
+
 # Example usage and migration runner
 def run_migrations(db_path: str = "/opt/iot_device/data/device.db"):
     """Run database migrations"""
@@ -25,6 +25,7 @@ CREATE TABLE IF NOT EXISTS hardware (
     external_ref TEXT NOT NULL
 );
 
+-- Uncompressed telemetry of older versions, TelemetryQueue moves its rows to telemetry_queue
 CREATE TABLE IF NOT EXISTS telemetry_data (
     id  INTEGER PRIMARY KEY,
     data TEXT,
@@ -35,7 +36,28 @@ CREATE TABLE IF NOT EXISTS firmware_status (
     id  INTEGER PRIMARY KEY,
     version_tag TEXT,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-)
+);
+
+-- Learned Modbus block layouts: the joins and registers a device refuses to read, per register map version
+CREATE TABLE IF NOT EXISTS modbus_block_layouts (
+    resource TEXT NOT NULL,
+    slave_id INTEGER NOT NULL,
+    map_version TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (resource, slave_id, map_version)
+);
+
+-- Telemetry frames waiting for upload, msgpack encoded and zlib compressed (see TelemetryQueue)
+CREATE TABLE IF NOT EXISTS telemetry_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    weight INTEGER NOT NULL DEFAULT 1,          -- frames a downsampled frame stands for
+    resolution INTEGER NOT NULL DEFAULT 0,      -- seconds a compacted frame rolls up, 0 for raw frames
+    lines INTEGER NOT NULL,
+    size INTEGER NOT NULL,                      -- compressed bytes
+    payload BLOB NOT NULL
+);
 -- Devices (specific devices on a hardware instance)
 --CREATE TABLE IF NOT EXISTS devices (
 --    id INTEGER PRIMARY KEY,
@@ -0,0 +1,333 @@
+import calendar
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+
+from telemetry.compaction import FrameCompactor
+from utils import LogManager
+from utils.singleton import Singleton
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS telemetry_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    weight INTEGER NOT NULL DEFAULT 1,
+    resolution INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    payload BLOB NOT NULL
+)"""
+
+EVICT_OLDEST = "oldest"
+EVICT_DOWNSAMPLE = "downsample"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Downsampling halves the oldest frames until each stands for this many, then the oldest are dropped
+MAX_WEIGHT = 8
+EVICTION_BATCH = 256
+COMPRESSION_LEVEL = 6
+# Periods rolled up per compaction step, the queue is locked that long
+COMPACTION_PERIODS = 16
+MAX_ID = 2 ** 63 - 1
+
+
+def encode_frame(telemetry_data: Dict[str, Any]) -> bytes:
+    return zlib.compress(msgpack.packb(telemetry_data, use_bin_type=True), COMPRESSION_LEVEL)
+
+
+def decode_frame(payload: bytes) -> Dict[str, Any]:
+    return msgpack.unpackb(zlib.decompress(payload), raw=False)
+
+
+def format_timestamp(created_at: float) -> str:
+    """ Same text as the SQLite CURRENT_TIMESTAMP the telemetry_data rows were stamped with """
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(created_at))
+
+
+@dataclass
+class QueuedFrame:
+    id: int
+    created_at: float
+    weight: int
+    telemetry_data: Dict[str, Any]
+
+    def to_payload(self) -> Dict[str, Any]:
+        """ The frame as uploaded, stamped like the telemetry_data rows """
+        return {**self.telemetry_data, "timestamp": format_timestamp(self.created_at)}
+
+
+class TelemetryQueue(metaclass=Singleton):
+    """
+    Store-and-forward queue of the telemetry frames waiting for upload, in the telemetry_queue table.
+    Frames are stored msgpack encoded and zlib compressed, and the compressed bytes are kept under max_bytes:
+    EVICT_OLDEST drops the oldest frames, EVICT_DOWNSAMPLE first drops every other frame of the oldest part of
+    the backlog (down to one in MAX_WEIGHT) so a long outage keeps a coarser but complete history.
+    The totals are kept up to date in memory, reporting the backlog costs no query.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES, eviction: str = EVICT_OLDEST):
+        self.logger = LogManager().get_logger("TelemetryQueue")
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.frames = 0
+        self.bytes = 0
+        self.lines = 0
+        self.evicted_frames = 0
+        self.oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def configure(self, max_bytes: int, eviction: str):
+        if eviction not in (EVICT_OLDEST, EVICT_DOWNSAMPLE):
+            raise ValueError(f"Unknown telemetry eviction policy {eviction}")
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.eviction = eviction
+            if self._conn is not None:
+                self._evict(self._conn)
+                self._conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Used from the event loop and the pipeline threads, always under the lock
+            self._conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # Also created by the schema and migration 5
+            self._conn.execute(CREATE_TABLE)
+            self._import_legacy(self._conn)
+            self._load_totals(self._conn)
+            if self.frames:
+                self.logger.info(f"Telemetry backlog of {self.frames} frames, {self.bytes} bytes")
+            self._evict(self._conn)
+            self._conn.commit()
+        return self._conn
+
+    def _load_totals(self, conn: sqlite3.Connection):
+        self.frames, self.bytes, self.lines, self.oldest = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(lines), 0), MIN(created_at) "
+            "FROM telemetry_queue").fetchone()
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """ Move the frames of the uncompressed telemetry_data table, if any, to the queue """
+        if not conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='telemetry_data'").fetchone():
+            return
+        rows = conn.execute("SELECT data, timestamp FROM telemetry_data ORDER BY id").fetchall()
+        if not rows:
+            return
+        for data, timestamp in rows:
+            try:
+                created_at = calendar.timegm(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+            except (TypeError, ValueError):
+                created_at = time.time()
+            self._insert(conn, json.loads(data), created_at)
+        conn.execute("DELETE FROM telemetry_data")
+        conn.commit()
+        self.logger.info(f"Moved {len(rows)} stored telemetry frames to the telemetry queue")
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, telemetry_data: Dict[str, Any], created_at: float) -> Tuple[int, int, int]:
+        """ :return: (id, lines, compressed size) of the new frame """
+        payload = encode_frame(telemetry_data)
+        lines = len(telemetry_data.get("data", []))
+        cursor = conn.execute("INSERT INTO telemetry_queue (created_at, lines, size, payload) VALUES (?, ?, ?, ?)",
+                              (created_at, lines, len(payload), payload))
+        return cursor.lastrowid, lines, len(payload)
+
+    def put(self, telemetry_data: Dict[str, Any], created_at: Optional[float] = None) -> int:
+        """ Queue a frame, evicting older ones over the byte budget.  :return: its id """
+        created_at = time.time() if created_at is None else created_at
+        with self._lock:
+            conn = self._connection()
+            try:
+                frame_id, lines, size = self._insert(conn, telemetry_data, created_at)
+                self.frames += 1
+                self.bytes += size
+                self.lines += lines
+                if self.oldest is None:
+                    self.oldest = created_at
+                self._evict(conn)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                self._load_totals(conn)
+                raise
+            return frame_id
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        """ Every queued frame, newest first, stamped like the telemetry_data rows """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, created_at, weight, payload FROM telemetry_queue ORDER BY id DESC").fetchall()
+        return [QueuedFrame(frame_id, created_at, weight, decode_frame(payload)).to_payload()
+                for frame_id, created_at, weight, payload in rows]
+
+    def last_id(self) -> int:
+        """ Id of the newest frame, 0 when empty """
+        with self._lock:
+            return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM telemetry_queue").fetchone()[0]
+
+    def read_batch(self, after_id: int, limit: int, until_id: Optional[int] = None) -> List[QueuedFrame]:
+        """ Up to limit frames oldest first, from the first id after after_id up to until_id """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, created_at, weight, payload FROM telemetry_queue WHERE id > ? AND id <= ? "
+                "ORDER BY id LIMIT ?", (after_id, MAX_ID if until_id is None else until_id, limit)).fetchall()
+        return [QueuedFrame(frame_id, created_at, weight, decode_frame(payload))
+                for frame_id, created_at, weight, payload in rows]
+
+    def delete(self, ids: List[int]):
+        """ Drop uploaded frames, the ones evicted meanwhile are ignored """
+        if not ids:
+            return
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            conn = self._connection()
+            try:
+                frames, size, lines = conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(lines), 0) FROM telemetry_queue "
+                    f"WHERE id IN ({marks})", ids).fetchone()
+                conn.execute(f"DELETE FROM telemetry_queue WHERE id IN ({marks})", ids)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            self.frames -= frames
+            self.bytes -= size
+            self.lines -= lines
+            row = conn.execute("SELECT created_at FROM telemetry_queue ORDER BY id LIMIT 1").fetchone()
+            self.oldest = row[0] if row else None
+
+    def compact(self, resolution: int, min_age: float, now: Optional[float] = None,
+                periods: int = COMPACTION_PERIODS) -> int:
+        """
+        One compaction step: the frames of the oldest periods of resolution seconds ended min_age ago are rolled
+        into one frame per period (FrameCompactor), in place of the oldest frame of each period so the ids stay
+        in time order.  The queue is locked one period at a time, puts wait for one period at most.
+        :return: the number of frames merged away
+        """
+        now = time.time() if now is None else now
+        cutoff = now - min_age
+        merged = 0
+        for _ in range(periods):
+            with self._lock:
+                conn = self._connection()
+                try:
+                    row = conn.execute("SELECT created_at FROM telemetry_queue WHERE resolution < ? "
+                                       "ORDER BY id LIMIT 1", (resolution,)).fetchone()
+                    start = row[0] // resolution * resolution if row else None
+                    if start is None or start + resolution > cutoff:
+                        break
+                    rows = conn.execute("SELECT id, created_at, weight, lines, size, payload FROM telemetry_queue "
+                                        "WHERE resolution < ? AND created_at >= ? AND created_at < ? ORDER BY id",
+                                        (resolution, start, start + resolution)).fetchall()
+                    rolled = self._roll_up(conn, rows, start, resolution)
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    self._load_totals(conn)
+                    raise
+                if rolled:
+                    self.oldest = conn.execute("SELECT created_at FROM telemetry_queue ORDER BY id "
+                                               "LIMIT 1").fetchone()[0]
+                merged += rolled
+        return merged
+
+    def _roll_up(self, conn: sqlite3.Connection, rows: list, start: float, resolution: int) -> int:
+        first_id = rows[0][0]
+        if len(rows) == 1:
+            # Nothing to merge, the frame is only marked so it is not read again at this resolution
+            conn.execute("UPDATE telemetry_queue SET resolution = ? WHERE id = ?", (resolution, first_id))
+            return 0
+        compactor = FrameCompactor(resolution)
+        for _, _, weight, _, _, payload in rows:
+            compactor.add(decode_frame(payload), weight)
+        telemetry_data = compactor.frame(start)
+        payload = encode_frame(telemetry_data)
+        lines = len(telemetry_data["data"])
+        # The frames merged are counted by the samples of the lines, the weight is the eviction's (see _thin)
+        conn.execute("UPDATE telemetry_queue SET created_at = ?, weight = 1, resolution = ?, lines = ?, size = ?, "
+                     "payload = ? WHERE id = ?", (start, resolution, lines, len(payload), payload, first_id))
+        ids = [row[0] for row in rows[1:]]
+        conn.execute(f"DELETE FROM telemetry_queue WHERE id IN ({','.join('?' * len(ids))})", ids)
+        self.frames -= len(ids)
+        self.lines += lines - sum(row[3] for row in rows)
+        self.bytes += len(payload) - sum(row[4] for row in rows)
+        return len(ids)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM telemetry_queue")
+            conn.commit()
+            self._load_totals(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """ Backlog size and age, for the TelemetryBacklog measurement """
+        return {"frames": self.frames, "bytes": self.bytes, "lines": self.lines,
+                "oldest_age_s": round(time.time() - self.oldest, 1) if self.oldest is not None else 0.0,
+                "evicted_frames": self.evicted_frames, "max_bytes": self.max_bytes}
+
+    def cleanup(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _evict(self, conn: sqlite3.Connection):
+        """ Bring the compressed size under max_bytes, always keeps the newest frame """
+        evicted = 0
+        while self.bytes > self.max_bytes and self.frames > 1:
+            rows = self._thin(conn) if self.eviction == EVICT_DOWNSAMPLE else []
+            if not rows:
+                rows = self._drop_oldest(conn)
+            self.frames -= len(rows)
+            self.lines -= sum(lines for lines, _ in rows)
+            self.bytes -= sum(size for _, size in rows)
+            evicted += len(rows)
+        if evicted:
+            self.oldest = conn.execute("SELECT created_at FROM telemetry_queue ORDER BY id LIMIT 1").fetchone()[0]
+            self.evicted_frames += evicted
+            self.logger.warning(f"Telemetry backlog over {self.max_bytes} bytes, evicted {evicted} frames "
+                                f"({self.eviction})")
+
+    def _thin(self, conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+        """
+        Drop every other frame of the oldest ones, the kept frame stands for both.  Compacted frames are
+        downsampled already, the oldest of them are dropped instead.
+        :return: (lines, size) of the dropped frames
+        """
+        rows = conn.execute("SELECT id, weight, lines, size FROM telemetry_queue WHERE weight < ? AND resolution = 0 "
+                            "ORDER BY id LIMIT ?", (MAX_WEIGHT, EVICTION_BATCH)).fetchall()
+        # The newest frame is never thinned away
+        newest = conn.execute("SELECT MAX(id) FROM telemetry_queue").fetchone()[0]
+        rows = [row for row in rows if row[0] != newest]
+        dropped = []
+        excess = self.bytes - self.max_bytes
+        for (keep_id, keep_weight, *_), (drop_id, drop_weight, lines, size) in zip(rows[0::2], rows[1::2]):
+            conn.execute("UPDATE telemetry_queue SET weight = ? WHERE id = ?", (keep_weight + drop_weight, keep_id))
+            conn.execute("DELETE FROM telemetry_queue WHERE id = ?", (drop_id,))
+            dropped.append((lines, size))
+            excess -= size
+            if excess <= 0:
+                break
+        return dropped
+
+    def _drop_oldest(self, conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+        """ :return: (lines, size) of the dropped frames """
+        rows = conn.execute("SELECT id, lines, size FROM telemetry_queue ORDER BY id LIMIT ?",
+                            (min(EVICTION_BATCH, self.frames - 1),)).fetchall()
+        dropped = []
+        excess = self.bytes - self.max_bytes
+        for frame_id, lines, size in rows:
+            dropped.append((lines, size))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.execute("DELETE FROM telemetry_queue WHERE id <= ?", (frame_id,))
+        return dropped
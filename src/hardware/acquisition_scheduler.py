@@ -0,0 +1,123 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Any, Optional, Callable, NamedTuple
+
+from hardware.hardware_deployment import HardwareDeployment
+from utils import LogManager
+
+
+class AcquisitionJob(NamedTuple):
+    system: str
+    deployment: HardwareDeployment
+    scan_group: str = "DATA"
+    deadline: Optional[float] = None  # time.monotonic()
+
+
+class AcquisitionScheduler:
+    """
+    Runs HardwareDeployment acquisitions in a bounded worker pool.
+    Deployments are grouped by the physical resource they use (serial port, TCP host:port, CAN channel,
+    IIO device).  Independent resources are read concurrently while reads on the same resource stay
+    serialized in a single worker.  With use_async, resources whose hardware has a native asyncio driver
+    (Modbus) are read as coroutines in the event loop instead of taking a worker.
+    """
+
+    def __init__(self, max_workers: int = 4, use_async: bool = False):
+        self.logger = LogManager().get_logger("AcquisitionScheduler")
+        self.use_async = use_async
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="acquisition")
+
+    @staticmethod
+    def group_by_resource(jobs: List[AcquisitionJob]) -> Dict[str, List[AcquisitionJob]]:
+        """ Group jobs by resource key, keeping submission order within each resource """
+        resources: Dict[str, List[AcquisitionJob]] = {}
+        for job in jobs:
+            resources.setdefault(job.deployment.resource_key, []).append(job)
+        return resources
+
+    def _acquire_resource(self, resource: str, jobs: List[AcquisitionJob],
+                          on_result: Optional[Callable[[str, HardwareDeployment, dict], None]]) -> Tuple[list, dict]:
+        """ Worker: run every job on one resource, one after the other """
+        start = time.perf_counter()
+        results, errors = [], 0
+        for job in jobs:
+            instance_data = {}
+            try:
+                instance_data = job.deployment.data_acquisition(job.scan_group, job.deadline)
+                results.append((job, instance_data))
+            except Exception as e:
+                errors += 1
+                self.logger.error(f"Unable to read {job.scan_group} from: {job.system}/{job.deployment.hardware_id} "
+                                  f"on {resource}: {e}")
+            if on_result:
+                on_result(job.system, job.deployment, instance_data)
+        timing = {"elapsed_s": time.perf_counter() - start, "deployments": len(jobs), "errors": errors}
+        return results, timing
+
+    async def _acquire_resource_async(self, resource: str, jobs: List[AcquisitionJob],
+                                      on_result: Optional[Callable[[str, HardwareDeployment, dict], None]]
+                                      ) -> Tuple[list, dict]:
+        """ Coroutine: run every job on one resource, one after the other, in the event loop """
+        start = time.perf_counter()
+        results, errors = [], 0
+        for job in jobs:
+            instance_data = {}
+            try:
+                instance_data = await job.deployment.async_data_acquisition(job.scan_group, job.deadline)
+                results.append((job, instance_data))
+            except Exception as e:
+                errors += 1
+                self.logger.error(f"Unable to read {job.scan_group} from: {job.system}/{job.deployment.hardware_id} "
+                                  f"on {resource}: {e}")
+            if on_result:
+                on_result(job.system, job.deployment, instance_data)
+        timing = {"elapsed_s": time.perf_counter() - start, "deployments": len(jobs), "errors": errors}
+        return results, timing
+
+    def _runs_async(self, jobs: List[AcquisitionJob]) -> bool:
+        return self.use_async and all(job.deployment.has_native_async for job in jobs)
+
+    async def acquire_jobs(self, jobs: List[AcquisitionJob],
+                           on_result: Optional[Callable[[str, HardwareDeployment, dict], None]] = None
+                           ) -> Tuple[List[Tuple[AcquisitionJob, dict]], Dict[str, dict]]:
+        """
+        Run the given jobs, concurrently across resources.
+        :return: ([(job, {device: {...}})], {resource_key: timing})
+        """
+        loop = asyncio.get_running_loop()
+        resources = self.group_by_resource(jobs)
+        keys = list(resources.keys())
+        futures = [self._acquire_resource_async(key, resources[key], on_result) if self._runs_async(resources[key])
+                   else loop.run_in_executor(self._executor, self._acquire_resource, key, resources[key], on_result)
+                   for key in keys]
+        outcomes = await asyncio.gather(*futures)
+
+        results: List[Tuple[AcquisitionJob, dict]] = []
+        resource_timing: Dict[str, dict] = {}
+        for key, (resource_results, timing) in zip(keys, outcomes):
+            resource_timing[key] = timing
+            results.extend(resource_results)
+        return results, resource_timing
+
+    async def acquire(self, system_deployments: Dict[str, Dict[str, HardwareDeployment]],
+                      data_type: str = "DATA",
+                      on_result: Optional[Callable[[str, HardwareDeployment, dict], None]] = None
+                      ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, dict]]:
+        """
+        Acquire the given scan group from all deployments.
+        :return: ({system: {hardware: {device: {...}}}}, {resource_key: timing})
+        """
+        jobs = [AcquisitionJob(system, deployment, data_type)
+                for system, hardware_deployments in system_deployments.items()
+                for deployment in hardware_deployments.values()]
+        results, resource_timing = await self.acquire_jobs(jobs, on_result)
+
+        measurements: Dict[str, Dict[str, Any]] = {system: {} for system in system_deployments}
+        for job, instance_data in results:
+            measurements[job.system][job.deployment.hardware_id] = instance_data
+        return measurements, resource_timing
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
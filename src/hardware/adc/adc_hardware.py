@@ -160,6 +160,9 @@ class ADCHardware(HardwareBase):
 
 
 
+    def get_resource_key(self) -> str:
+        return f"iio:{self.iio_device_name}"
+
     def get_identifier(self, devices: List[dict]) -> Dict[str, str]:
         """Get identifiers for devices"""
         # Use the MAC address as the identifier
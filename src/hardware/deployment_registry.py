@@ -0,0 +1,82 @@
+import hashlib
+import json
+import time
+from logging import Logger
+from typing import Dict, Any, List, Tuple, Optional
+
+from database.database_manager import DatabaseManager
+from utils import EnvVars
+from hardware.hardware_deployment import instantiate_hardware_from_dict, HardwareDeployment
+
+
+class DeploymentRegistry:
+    """
+    Long-lived cache of HardwareDeployment instances.
+    Each deployment is built once and keyed by a content hash of its hardware table row.  On refresh
+    only the entries whose configuration changed (or that are new) are re-instantiated, removed
+    hardware is dropped.
+    """
+
+    def __init__(self, systems: List[str], logger: Logger):
+        self.systems = systems
+        self.logger = logger
+        # { system: { external_ref: (row_hash, deployment) } }
+        self._entries: Dict[str, Dict[str, Tuple[str, HardwareDeployment]]] = {system: {} for system in systems}
+        self.last_refresh: Dict[str, Any] = {}
+
+    @staticmethod
+    def hardware_hash(hardware: Dict[str, Any]) -> str:
+        """ Stable content hash of a hardware row (parameters, scan groups, devices, ...) """
+        encoded = json.dumps(hardware, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def refresh(self, db: Optional[DatabaseManager] = None) -> Dict[str, Dict[str, HardwareDeployment]]:
+        """
+        Synchronize the registry with the hardware table and return the current deployments as
+        { system: { external_ref: HardwareDeployment } }
+        """
+        start = time.perf_counter()
+        db = db or DatabaseManager(EnvVars().db_path)
+        built, reused, removed, failed = 0, 0, 0, 0
+        for system in self.systems:
+            current = self._entries.setdefault(system, {})
+            seen = set()
+            for hardware in db.get_hardware_systems(system):
+                hardware_ref = hardware["external_ref"]
+                seen.add(hardware_ref)
+                row_hash = self.hardware_hash(hardware)
+                entry = current.get(hardware_ref)
+                if entry and entry[0] == row_hash:
+                    reused += 1
+                    continue
+                try:
+                    deployment = instantiate_hardware_from_dict(hardware, self.logger)
+                    current[hardware_ref] = (row_hash, deployment)
+                    built += 1
+                    if entry:
+                        self.logger.info(f"Configuration changed for {system}/{hardware_ref}, rebuilt deployment")
+                except Exception as e:
+                    failed += 1
+                    current.pop(hardware_ref, None)
+                    self.logger.error(f"Unable to instantiate {system}/{hardware_ref}: {e}")
+
+            for hardware_ref in [ref for ref in current if ref not in seen]:
+                self.logger.info(f"Hardware {system}/{hardware_ref} removed from configuration")
+                del current[hardware_ref]
+                removed += 1
+
+        self.last_refresh = {"built": built, "reused": reused, "removed": removed, "failed": failed,
+                             "setup_s": time.perf_counter() - start}
+        return self.deployments()
+
+    def deployments(self) -> Dict[str, Dict[str, HardwareDeployment]]:
+        return {system: {ref: entry[1] for ref, entry in entries.items()}
+                for system, entries in self._entries.items()}
+
+    def invalidate(self, hardware_ref: Optional[str] = None):
+        """ Force a rebuild of one (or every) deployment on the next refresh """
+        for entries in self._entries.values():
+            if hardware_ref is None:
+                entries.clear()
+            else:
+                entries.pop(hardware_ref, None)
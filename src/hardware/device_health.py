@@ -0,0 +1,65 @@
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, Any
+
+BREAKER_CLOSED = "closed"
+BREAKER_HALF_OPEN = "half_open"
+BREAKER_OPEN = "open"
+# Numeric codes so the breaker state can be sent as a telemetry field
+BREAKER_STATE_CODES = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Health of one device (slave) on a bus.  After failure_threshold consecutive failed reads the breaker
+    opens and the device is skipped until its backoff expires, then a single probe read decides whether
+    it closes again or re-opens with a doubled backoff (capped at max_backoff).
+    """
+    failure_threshold: int = 3
+    base_backoff: float = 10.0
+    max_backoff: float = 300.0
+    state: str = BREAKER_CLOSED
+    consecutive_failures: int = 0
+    open_streak: int = 0
+    trips: int = 0
+    retry_at: float = 0.0
+    last_success: Optional[float] = None
+
+    def allow_request(self, now: Optional[float] = None) -> bool:
+        """ False while open, moves to half open (probing) once the backoff expired """
+        if self.state == BREAKER_OPEN:
+            if (time.monotonic() if now is None else now) < self.retry_at:
+                return False
+            self.state = BREAKER_HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.state = BREAKER_CLOSED
+        self.consecutive_failures = 0
+        self.open_streak = 0
+        self.last_success = time.time()
+
+    def record_failure(self, now: Optional[float] = None) -> bool:
+        """ :return: True if the breaker is (now) open and the device should not be read any further """
+        self.consecutive_failures += 1
+        if self.state == BREAKER_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.trip(now)
+        return self.state == BREAKER_OPEN
+
+    def trip(self, now: Optional[float] = None):
+        self.open_streak += 1
+        self.trips += 1
+        backoff = min(self.base_backoff * 2 ** (self.open_streak - 1), self.max_backoff)
+        self.retry_at = (time.monotonic() if now is None else now) + backoff
+        self.state = BREAKER_OPEN
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == BREAKER_OPEN
+
+    def status(self) -> Dict[str, Any]:
+        """ Telemetry fields """
+        return {"breaker_state": BREAKER_STATE_CODES[self.state],
+                "consecutive_failures": self.consecutive_failures,
+                "breaker_trips": self.trips}
@@ -1,7 +1,9 @@
-from typing import List, Dict, Any, Tuple, Union
+import asyncio
+from typing import List, Dict, Any, Tuple, Union, Optional
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 from utils import LogManager
+from telemetry.deadband import Deadband
 
 
 @dataclass
@@ -20,6 +22,17 @@ class HardwareBase(ABC):
         """
         raise ValueError("Must be implemented in sub-class")
 
+    async def async_data_acquisition(self, devices: List[Dict[str, Any]], scan_group: List[str],
+                                     hardware_id: str) -> Dict[str, Any]:
+        """
+        asyncio version of data_acquisition.  Hardware without a native asyncio driver is read in a thread.
+        """
+        return await asyncio.to_thread(self.data_acquisition, devices, scan_group, hardware_id)
+
+    def has_native_async(self) -> bool:
+        """ True when async_data_acquisition runs in the event loop instead of a thread """
+        return False
+
     @abstractmethod
     def get_points(self, names: List[str]) -> List:
         pass
@@ -28,6 +41,29 @@ class HardwareBase(ABC):
     def get_identifier(self, devices: List[dict]) -> Dict[str, str]:
         pass
 
+    def get_resource_key(self) -> str:
+        """
+        Identifies the physical resource (serial port, TCP gateway, CAN channel, IIO device) used by this
+        hardware.  Hardware sharing a resource key is never read concurrently.
+        """
+        return f"{type(self).__name__}:{id(self)}"
+
+    def set_acquisition_deadline(self, deadline: Optional[float]):
+        """ time.monotonic() by which the next acquisition should give up, None for no deadline """
+        self._acquisition_deadline = deadline
+
+    @property
+    def acquisition_deadline(self) -> Optional[float]:
+        return getattr(self, "_acquisition_deadline", None)
+
+    def get_deadbands(self, names: List[str]) -> Dict[str, Deadband]:
+        """ Deadbands defined by the hardware (e.g. in its register map) for the given points """
+        return {}
+
+    def device_health(self) -> Dict[str, Dict[str, Any]]:
+        """ Communication health per device ID, hardware without health tracking reports nothing """
+        return {}
+
     def ping_hardware(self) -> Tuple[str, Union[str, bool]]:
         return "Ping TBD", True
 
@@ -3,6 +3,7 @@ from pathlib import Path
 from typing import List, Iterator, Dict, Any, Union, Optional, Tuple
 from dataclasses import dataclass
 from hardware.hardware_base import HardwareBase
+from telemetry.deadband import Deadband, DeadbandConfig
 from utils import LogManager, EnvVars
 from logging import Logger
 from hardware.modbus.eve_battery import EveBattery
@@ -32,15 +33,57 @@ class HardwareDeployment:
         for device in self.devices:
             yield device
 
-    def data_acquisition(self, data_type: str = "DATA") -> dict:
+    def data_acquisition(self, data_type: str = "DATA", deadline: Optional[float] = None) -> dict:
         """
+        :param deadline: time.monotonic() after which the hardware stops reading, None for no deadline
         :return: A dictionary of { register_name: value }
         """
         data_registers = self.scan_groups.get(data_type, {}).get('registers', [])
         self.logger.info(f"Acq Data: {data_type}, {len(data_registers)} registers.")
-        values = self.hardware.data_acquisition(self.devices, data_registers, self.hardware_id)
+        self.hardware.set_acquisition_deadline(deadline)
+        try:
+            values = self.hardware.data_acquisition(self.devices, data_registers, self.hardware_id)
+        finally:
+            self.hardware.set_acquisition_deadline(None)
+        return values
+
+    async def async_data_acquisition(self, data_type: str = "DATA", deadline: Optional[float] = None) -> dict:
+        """ asyncio version of data_acquisition """
+        data_registers = self.scan_groups.get(data_type, {}).get('registers', [])
+        self.logger.info(f"Async Acq Data: {data_type}, {len(data_registers)} registers.")
+        self.hardware.set_acquisition_deadline(deadline)
+        try:
+            values = await self.hardware.async_data_acquisition(self.devices, data_registers, self.hardware_id)
+        finally:
+            self.hardware.set_acquisition_deadline(None)
         return values
 
+    @property
+    def has_native_async(self) -> bool:
+        return self.hardware.has_native_async()
+
+    def get_deadband_config(self, data_type: str = "DATA") -> DeadbandConfig:
+        """
+        Register map deadbands, overridden per point by the scan group "deadbands" and completed by
+        the scan group "deadband" default.
+        """
+        scan_group = self.scan_groups.get(data_type) if isinstance(self.scan_groups, dict) else None
+        if not isinstance(scan_group, dict):
+            return DeadbandConfig()
+        points = self.hardware.get_deadbands(scan_group.get('registers', []))
+        for name, deadband in scan_group.get('deadbands', {}).items():
+            points[name.replace(' ', '_')] = Deadband.from_dict(deadband)
+        default = scan_group.get('deadband')
+        return DeadbandConfig(points, Deadband.from_dict(default) if default else None)
+
+    def device_health(self) -> Dict[str, Dict[str, Any]]:
+        """ { device_id: communication health fields } """
+        return self.hardware.device_health()
+
+    @property
+    def resource_key(self) -> str:
+        return self.hardware.get_resource_key()
+
     def get_points(self, data_type: str = "DATA") -> List[dict]:
         data_registers = self.scan_groups.get(data_type, {}).get('registers', [])
         points = self.hardware.get_points(data_registers)
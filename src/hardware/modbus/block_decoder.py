@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from hardware.modbus.modbus_map import ModbusDatatype, ModbusRegister
+from hardware.modbus.read_planner import ReadBlock
+
+# data type: (mask, sign bit or 0)
+_NUMERIC = {
+    ModbusDatatype.UINT16: (0xFFFF, 0),
+    ModbusDatatype.INT16: (0xFFFF, 0x8000),
+    ModbusDatatype.UINT8: (0xFF, 0),
+    ModbusDatatype.INT8: (0xFF, 0x80),
+    ModbusDatatype.FLAG16: (-1, 0),
+}
+
+# Below this many numeric registers NumPy call overhead outweighs the per value work
+VECTORIZE_MIN_REGISTERS = 8
+_MAX_CACHED_DECODERS = 1024
+
+
+class BlockDecoder:
+    """
+    Decoder of the registers of one ReadBlock, compiled once into NumPy arrays of word offsets, masks, sign
+    bits and conversion factors.  A block of raw words is then decoded with a handful of vectorized
+    operations instead of one if/elif chain per register, ASCII runs are decoded from the same words.
+    Small blocks run the same precompiled steps as a plain loop.
+    Values (and their int / float types) are identical to convert_register_value, registers of other types
+    (bool, enum) or with a non numeric conversion factor are left in `fallback` for it.
+    Device specific scaling ({register name: multiplier}) is folded into the conversion factors.
+    """
+
+    def __init__(self, block: ReadBlock, scales: Optional[Dict[str, float]] = None):
+        self.count = block.count
+        self.scales = {r.name: scales[r.name] for r in block.registers if r.name in scales} if scales else {}
+        offsets, masks, signs = [], [], []
+        scaled: Dict[bool, Tuple[List[str], List[int], list]] = {True: ([], [], []), False: ([], [], [])}
+        self.ascii16: List[Tuple[str, int, int]] = []
+        self.ascii8: List[Tuple[str, int]] = []
+        self.fallback: List[ModbusRegister] = []
+        for register in block.registers:
+            offset = int(register.address) - block.start
+            data_type, factor = register.data_type, register.conversion_factor
+            if data_type in _NUMERIC and isinstance(factor, (int, float)) and not isinstance(factor, bool):
+                if register.name in self.scales:
+                    factor = factor * self.scales[register.name]
+                names, positions, factors = scaled[isinstance(factor, int)]
+                names.append(register.name)
+                positions.append(len(offsets))
+                factors.append(factor)
+                offsets.append(offset)
+                masks.append(_NUMERIC[data_type][0])
+                signs.append(_NUMERIC[data_type][1])
+            elif data_type == ModbusDatatype.ASCII16:
+                self.ascii16.append((register.name, offset, offset + max(1, register.range_size)))
+            elif data_type == ModbusDatatype.ASCII8:
+                self.ascii8.append((register.name, offset))
+            else:
+                self.fallback.append(register)
+
+        self.vectorized = len(offsets) >= VECTORIZE_MIN_REGISTERS
+        self.steps = [(name, offsets[position], masks[position], signs[position], factor)
+                      for names, positions, factors in scaled.values()
+                      for name, position, factor in zip(names, positions, factors)]
+        self.offsets = np.array(offsets, dtype=np.intp)
+        self.masks = np.array(masks, dtype=np.int64)
+        self.signs = np.array(signs, dtype=np.int64)
+        # Integer factors keep int values, as value * factor does
+        self.scaled = [(names, np.array(positions, dtype=np.intp),
+                        np.array(factors, dtype=np.int64 if integral else np.float64))
+                       for integral, (names, positions, factors) in scaled.items() if names]
+
+    def decode(self, raw_values: Sequence[int]) -> Dict[str, Union[float, int, str]]:
+        if len(raw_values) != self.count:
+            raise ValueError(f"Expected {self.count} registers, got {len(raw_values)}")
+        values: Dict[str, Union[float, int, str]] = {}
+        if self.vectorized:
+            raw = np.asarray(raw_values, dtype=np.int64)[self.offsets] & self.masks
+            raw -= (raw & self.signs) << 1  # two's complement of the signed types
+            for names, positions, factors in self.scaled:
+                values.update(zip(names, (raw[positions] * factors).tolist()))
+        else:
+            for name, offset, mask, sign, factor in self.steps:
+                value = raw_values[offset] & mask
+                values[name] = (value - ((value & sign) << 1)) * factor
+        for name, start, end in self.ascii16:
+            # Two characters per register, high byte first
+            values[name] = "".join(chr(word >> 8 & 0xFF) + chr(word & 0xFF) for word in raw_values[start:end])
+        for name, offset in self.ascii8:
+            values[name] = chr(raw_values[offset] & 0xFF)
+        return values
+
+    def rescale(self, name: str, value):
+        """ Device scaling of a value decoded outside of the decoder (fallback registers) """
+        scale = self.scales.get(name)
+        return value if scale is None or isinstance(value, str) else value * scale
+
+
+def decoder_key(block: ReadBlock) -> tuple:
+    return block.start, block.count, tuple(map(id, block.registers))
+
+
+_decoders: Dict[tuple, Tuple[List[ModbusRegister], BlockDecoder]] = {}
+
+
+def decoder_for(block: ReadBlock) -> BlockDecoder:
+    """ Compiled decoder of a block, cached since a scan group plans the same blocks every cycle """
+    key = decoder_key(block)
+    cached = _decoders.get(key)
+    if cached is None:
+        if len(_decoders) >= _MAX_CACHED_DECODERS:
+            _decoders.clear()
+        # Keep the registers referenced so their ids stay unique while cached
+        cached = _decoders[key] = (list(block.registers), BlockDecoder(block))
+    return cached[1]
@@ -0,0 +1,130 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, Optional, Tuple
+
+from hardware.modbus.read_planner import BlockLayout
+from utils import LogManager
+from utils.singleton import Singleton
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS modbus_block_layouts (
+    resource TEXT NOT NULL,
+    slave_id INTEGER NOT NULL,
+    map_version TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (resource, slave_id, map_version)
+)"""
+
+LayoutKey = Tuple[str, int, str]  # (resource, slave id, map version)
+
+
+class SQLiteBlockLayoutStore:
+    """
+    Learned layouts in the modbus_block_layouts table.  Reads run in the acquisition threads, so every call
+    uses its own short lived connection instead of the DatabaseManager's.
+    """
+
+    def __init__(self, db_path: str):
+        self.logger = LogManager().get_logger("BlockLayouts")
+        self.db_path = db_path
+        self._created = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        if not self._created:
+            # Also created by the schema and migration 4, older databases may have neither
+            conn.execute(CREATE_TABLE)
+            self._created = True
+        return conn
+
+    def load(self, key: LayoutKey) -> Optional[BlockLayout]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT layout FROM modbus_block_layouts WHERE resource = ? AND slave_id = ? "
+                               "AND map_version = ?", key).fetchone()
+            return BlockLayout.from_dict(json.loads(row[0])) if row else None
+        finally:
+            conn.close()
+
+    def save(self, key: LayoutKey, layout: BlockLayout):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO modbus_block_layouts (resource, slave_id, map_version, layout, "
+                         "updated_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)", (*key, json.dumps(layout.to_dict())))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, resource: str, slave_id: int):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM modbus_block_layouts WHERE resource = ? AND slave_id = ?", (resource, slave_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class BlockLayouts(metaclass=Singleton):
+    """
+    Process wide learned block layouts per device (resource, slave id) and register map version.  With a
+    store they are loaded on first use and saved whenever a device teaches something new, so a restart
+    plans the learned blocks right away.  Maps without a version (built in code) are only learned in memory.
+    """
+
+    def __init__(self, store: Optional[SQLiteBlockLayoutStore] = None):
+        self.logger = LogManager().get_logger("BlockLayouts")
+        self.store = store
+        self._layouts: Dict[LayoutKey, BlockLayout] = {}
+        self._lock = threading.Lock()
+
+    def layout(self, resource: str, slave_id: int, map_version: str) -> BlockLayout:
+        key = (resource, slave_id, map_version)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is None:
+                layout = self._layouts[key] = self._load(key) or BlockLayout()
+            return layout
+
+    def learned(self, resource: str, slave_id: int, map_version: str):
+        """ Persist the layout of a device after it changed """
+        key = (resource, slave_id, map_version)
+        layout = self._layouts.get(key)
+        if layout is None or self.store is None or not map_version:
+            return
+        try:
+            with self._lock:
+                self.store.save(key, layout)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Unable to save the block layout of {resource} slave {slave_id}: {e}")
+
+    def reset(self, resource: str, slave_id: int):
+        """ Forget what a device taught for every map version, e.g. after its firmware changed """
+        with self._lock:
+            for key in [key for key in self._layouts if key[:2] == (resource, slave_id)]:
+                del self._layouts[key]
+            if self.store is None:
+                return
+            try:
+                self.store.delete(resource, slave_id)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Unable to delete the block layout of {resource} slave {slave_id}: {e}")
+                return
+        self.logger.info(f"Reset the block layout of {resource} slave {slave_id}")
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+
+    def _load(self, key: LayoutKey) -> Optional[BlockLayout]:
+        if self.store is None or not key[2]:
+            return None
+        try:
+            layout = self.store.load(key)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Unable to load the block layout of {key[0]} slave {key[1]}: {e}")
+            return None
+        if layout is not None:
+            self.logger.info(f"Loaded the block layout of {key[0]} slave {key[1]}: {len(layout.cuts)} refused "
+                             f"joins, {len(layout.unreadable)} unreadable registers")
+        return layout
@@ -0,0 +1,629 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusException, ModbusIOException
+from pymodbus.framer import FramerType
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.pdu.register_message import (ReadHoldingRegistersResponse, ReadInputRegistersResponse,
+                                           WriteSingleRegisterResponse, WriteMultipleRegistersResponse)
+
+from hardware.modbus.client_pool import _ensure_event_loop
+from utils import LogManager
+from utils.singleton import Singleton
+
+DEFAULT_SOCKET_PATH = "/run/raptor/bus-broker.sock"
+
+# Request classes, the lower value is served first: operator commands, UI reads, then acquisition
+PRIORITY_COMMAND = "command"
+PRIORITY_UI = "ui"
+PRIORITY_ACQUISITION = "acquisition"
+PRIORITIES = {PRIORITY_COMMAND: 0, PRIORITY_UI: 1, PRIORITY_ACQUISITION: 2}
+# Age of cached registers the UI accepts, acquisition and commands always read the device
+UI_MAX_AGE = 2.0
+
+READ_OPS = {"read_holding": 3, "read_input": 4}
+WRITE_OPS = {"write_register": 6, "write_registers": 16}
+
+
+def bus_key(spec: Dict[str, Any]) -> str:
+    """ The physical bus of a bus description, same as ModbusHardware.get_resource_key """
+    if spec["type"] == "tcp":
+        return f"tcp:{spec['host']}:{spec['port']}"
+    return f"serial:{spec['port']}"
+
+
+@dataclass
+class BrokerRequest:
+    """ One transaction queued on a bus, answered through its future """
+    op: str
+    slave: int
+    address: int
+    count: int
+    values: List[int]
+    priority: int
+    max_age: float
+    connection: int
+    deadline: float
+    enqueued: float = field(default_factory=time.monotonic)
+    future: Optional[asyncio.Future] = None
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any], connection: int) -> 'BrokerRequest':
+        op = message["op"]
+        if op not in READ_OPS and op not in WRITE_OPS:
+            raise ValueError(f"unknown operation {op}")
+        values = [int(v) for v in message.get("values", [])]
+        return cls(op, int(message["slave"]), int(message["address"]),
+                   int(message.get("count", len(values))), values,
+                   PRIORITIES.get(message.get("priority"), PRIORITIES[PRIORITY_ACQUISITION]),
+                   float(message.get("max_age", 0.0)), connection,
+                   time.monotonic() + float(message.get("timeout", 10.0)))
+
+    @property
+    def is_read(self) -> bool:
+        return self.op in READ_OPS
+
+    @property
+    def key(self) -> Tuple[str, int, int, int]:
+        return self.op, self.slave, self.address, self.count
+
+
+@dataclass
+class CachedBlock:
+    start: int
+    registers: List[int]
+    read_at: float
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.registers)
+
+
+class BrokerBus:
+    """
+    One physical bus owned by the broker: a pymodbus sync client driven from a single worker thread, the
+    request queues and a short lived cache of the blocks read.
+
+    Requests are queued per class and per client connection.  The highest class is served first and its
+    connections take turns, so one process flooding the bus cannot delay another of the same class.  A request
+    waiting longer than max_wait goes next whatever its class, acquisition cannot starve behind the UI.
+    Reads of registers read less than cache_ttl (and the request's max_age) ago are answered from the cache,
+    a read already queued is shared by the identical requests arriving meanwhile.  Writes drop the cached
+    registers they overlap.
+    """
+
+    def __init__(self, key: str, spec: Dict[str, Any], cache_ttl: float = 5.0, max_wait: float = 5.0):
+        self.logger = LogManager().get_logger("BusBroker")
+        self.key = key
+        self.spec = spec
+        self.cache_ttl = cache_ttl
+        self.max_wait = max_wait
+        self.queues: List[Dict[int, Deque[BrokerRequest]]] = [OrderedDict() for _ in PRIORITIES]
+        self.cache: Dict[Tuple[int, int], Dict[int, CachedBlock]] = {}
+        self.inflight: Dict[Tuple[str, int, int, int], BrokerRequest] = {}
+        self.requests = 0
+        self.transactions = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.expired = 0
+        self._client = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix=f"bus-{key}")
+        self._pending = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+    async def transact(self, request: BrokerRequest) -> Dict[str, Any]:
+        self.requests += 1
+        if request.is_read:
+            registers = self._cached(request)
+            if registers is not None:
+                self.cache_hits += 1
+                return {"registers": registers, "cached": True}
+            shared = self.inflight.get(request.key)
+            # Only share a read served at least as early as this one
+            if shared is not None and shared.priority <= request.priority:
+                self.coalesced += 1
+                shared.deadline = max(shared.deadline, request.deadline)
+                return dict(await asyncio.shield(shared.future))
+        request.future = asyncio.get_running_loop().create_future()
+        if request.is_read:
+            self.inflight[request.key] = request
+        self.queues[request.priority].setdefault(request.connection, deque()).append(request)
+        self._pending.set()
+        try:
+            return await asyncio.shield(request.future)
+        finally:
+            if self.inflight.get(request.key) is request:
+                del self.inflight[request.key]
+
+    def queued(self) -> int:
+        return sum(len(q) for queues in self.queues for q in queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "transactions": self.transactions, "cache_hits": self.cache_hits,
+                "coalesced": self.coalesced, "expired": self.expired, "queued": self.queued()}
+
+    def _next(self) -> Optional[BrokerRequest]:
+        oldest = min((q[0] for queues in self.queues for q in queues.values()), key=lambda r: r.enqueued,
+                     default=None)
+        if oldest is None:
+            return None
+        if time.monotonic() - oldest.enqueued > self.max_wait:
+            return self._take(oldest.priority, oldest.connection)
+        priority = next(p for p, queues in enumerate(self.queues) if queues)
+        return self._take(priority, next(iter(self.queues[priority])))
+
+    def _take(self, priority: int, connection: int) -> BrokerRequest:
+        queues = self.queues[priority]
+        q = queues.pop(connection)
+        request = q.popleft()
+        if q:
+            # Round robin: the connection's next request waits for the other connections of its class
+            queues[connection] = q
+        return request
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request = self._next()
+            if request is None:
+                self._pending.clear()
+                await self._pending.wait()
+                continue
+            if time.monotonic() > request.deadline:
+                # The client gave up on it already
+                self.expired += 1
+                result = {"error": f"Expired after {time.monotonic() - request.enqueued:.1f}s in the queue"}
+            else:
+                try:
+                    result = await loop.run_in_executor(self._executor, self._transact, request)
+                    self.transactions += 1
+                    self._update_cache(request, result)
+                except Exception as e:
+                    # The worker serves the whole bus, it must outlive any request
+                    self.logger.error(f"{request.op} on {self.key} failed: {e}", exc_info=True)
+                    result = {"error": str(e)}
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def _cached(self, request: BrokerRequest) -> Optional[List[int]]:
+        max_age = min(request.max_age, self.cache_ttl)
+        if max_age <= 0:
+            return None
+        now = time.monotonic()
+        for block in self.cache.get((request.slave, READ_OPS[request.op]), {}).values():
+            if (block.start <= request.address and request.address + request.count <= block.end
+                    and now - block.read_at <= max_age):
+                offset = request.address - block.start
+                return block.registers[offset:offset + request.count]
+        return None
+
+    def _update_cache(self, request: BrokerRequest, result: Dict[str, Any]):
+        now = time.monotonic()
+        if request.is_read:
+            if "registers" not in result:
+                return
+            blocks = self.cache.setdefault((request.slave, READ_OPS[request.op]), {})
+            for start in [s for s, b in blocks.items() if now - b.read_at > self.cache_ttl]:
+                del blocks[start]
+            blocks[request.address] = CachedBlock(request.address, result["registers"], now)
+            return
+        # Even a failed write may have changed some of the registers
+        blocks = self.cache.get((request.slave, READ_OPS["read_holding"]), {})
+        end = request.address + request.count
+        for start in [s for s, b in blocks.items() if b.start < end and request.address < b.end]:
+            del blocks[start]
+
+    def _connect(self):
+        """ Runs in the worker thread """
+        if self._client is None:
+            _ensure_event_loop()
+            spec = self.spec
+            if spec["type"] == "tcp":
+                self._client = ModbusTcpClient(host=spec["host"], port=int(spec["port"]))
+            else:
+                self._client = ModbusSerialClient(port=spec["port"], framer=FramerType(spec.get("framer", "rtu")),
+                                                  baudrate=spec.get("baudrate", 9600), parity=spec.get("parity", "N"),
+                                                  stopbits=spec.get("stopbits", 1), bytesize=spec.get("bytesize", 8),
+                                                  timeout=spec.get("timeout", 0.2))
+        if not self._client.connected and not self._client.connect():
+            raise ConnectionException(f"Unable to open {self.key}")
+        return self._client
+
+    def _close(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except OSError as e:
+                self.logger.info(f"Closing {self.key} failed: {e}")
+
+    def _transact(self, request: BrokerRequest) -> Dict[str, Any]:
+        """ Runs in the worker thread """
+        try:
+            client = self._connect()
+            if request.op == "read_holding":
+                result = client.read_holding_registers(address=request.address, count=request.count,
+                                                       slave=request.slave)
+            elif request.op == "read_input":
+                result = client.read_input_registers(address=request.address, count=request.count,
+                                                     slave=request.slave)
+            elif request.op == "write_register":
+                result = client.write_register(address=request.address, value=request.values[0], slave=request.slave)
+            else:
+                result = client.write_registers(address=request.address, values=request.values, slave=request.slave)
+        except (ModbusException, OSError) as e:
+            # OSError: socket reset or broken pipe, serial adapter unplugged (SerialException)
+            self.logger.info(f"{request.op} of slave {request.slave} at {request.address} on {self.key} failed: {e}")
+            self._close()
+            return {"error": str(e)}
+        if isinstance(result, ExceptionResponse):
+            return {"exception": result.exception_code}
+        if result.isError():
+            return {"error": str(result)}
+        return {"registers": list(result.registers)} if request.is_read else {}
+
+
+class BusBroker:
+    """
+    Owns every Modbus bus (serial port or TCP gateway) of the controller and serves the transactions of the
+    other processes, received as JSON lines on a Unix socket:
+
+        {"id": 1, "bus": {...}, "op": "read_holding", "slave": 1, "address": 0, "count": 10,
+         "priority": "ui", "max_age": 2.0, "timeout": 10.0}
+
+    and answered with the same id and either "registers" (reads), "exception" (a Modbus exception code) or
+    "error".  A connection may have several requests in flight, answers come as they complete.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, cache_ttl: float = 5.0, max_wait: float = 5.0):
+        self.logger = LogManager().get_logger("BusBroker")
+        self.socket_path = socket_path
+        self.cache_ttl = cache_ttl
+        self.max_wait = max_wait
+        self.buses: Dict[str, BrokerBus] = {}
+        self._conflicts = set()
+        self._connections = itertools.count(1)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    def bus(self, spec: Dict[str, Any]) -> BrokerBus:
+        key = bus_key(spec)
+        bus = self.buses.get(key)
+        if bus is None:
+            self.logger.info(f"Opening bus {key}")
+            bus = self.buses[key] = BrokerBus(key, spec, self.cache_ttl, self.max_wait)
+            bus.start()
+        elif bus.spec != spec and key not in self._conflicts:
+            self._conflicts.add(key)
+            self.logger.warning(f"Conflicting settings for {key}, keeping {bus.spec} over {spec}")
+        return bus
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {key: bus.stats() for key, bus in self.buses.items()}
+
+    async def open(self):
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        self.logger.info(f"Bus broker listening on {self.socket_path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for bus in self.buses.values():
+            await bus.stop()
+        self.buses.clear()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def serve_forever(self, stats_interval: float = 300.0):
+        await self.open()
+        try:
+            while True:
+                await asyncio.sleep(stats_interval)
+                for key, stats in self.stats().items():
+                    self.logger.info(f"{key}: {stats}")
+        finally:
+            await self.close()
+
+    def start(self) -> 'BusBroker':
+        """ Serve from a thread of this process, for tests and tools """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="bus-broker", daemon=True)
+        self._thread.start()
+        if not self._started.wait(5.0):
+            raise RuntimeError("Bus broker failed to start")
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(5.0)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5.0)
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self) -> 'BusBroker':
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self.open())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _shutdown(self):
+        await self.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = next(self._connections)
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.ensure_future(self._answer(writer, connection, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, writer: asyncio.StreamWriter, connection: int, line: bytes):
+        request_id = None
+        try:
+            message = json.loads(line)
+            request_id = message.get("id")
+            response = await self.bus(message["bus"]).transact(BrokerRequest.from_message(message, connection))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            response = {"error": f"Invalid request: {e}"}
+        response["id"] = request_id
+        if not writer.is_closing():
+            writer.write(json.dumps(response).encode() + b"\n")
+
+
+def _response(op: str, slave: int, address: int, count: int, values: List[int], message: Dict[str, Any]):
+    """ The pymodbus response to a broker answer, errors raise like a pymodbus client would """
+    if "exception" in message:
+        return ExceptionResponse(READ_OPS.get(op) or WRITE_OPS[op], message["exception"], slave=slave)
+    if "error" in message:
+        raise ModbusIOException(f"Bus broker: {message['error']}")
+    if op == "read_holding":
+        return ReadHoldingRegistersResponse(dev_id=slave, address=address, registers=message["registers"])
+    if op == "read_input":
+        return ReadInputRegistersResponse(dev_id=slave, address=address, registers=message["registers"])
+    if op == "write_register":
+        return WriteSingleRegisterResponse(dev_id=slave, address=address, registers=values)
+    return WriteMultipleRegistersResponse(dev_id=slave, address=address, count=count)
+
+
+class BrokerModbusClient:
+    """
+    Stand-in for the pymodbus sync clients sending the transactions of one bus through the broker.
+    Used from one thread at a time (the ModbusClientPool lock), a timed out request drops the connection.
+    """
+
+    def __init__(self, socket_path: str, bus: Dict[str, Any], priority: str = PRIORITY_ACQUISITION,
+                 max_age: float = 0.0, timeout: float = 10.0):
+        self.logger = LogManager().get_logger("BusBroker")
+        self.socket_path = socket_path
+        self.bus = bus
+        self.priority = priority
+        self.max_age = max_age
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._socket: Optional[socket.socket] = None
+        self._file = None
+
+    @property
+    def connected(self) -> bool:
+        return self._socket is not None
+
+    def connect(self) -> bool:
+        if self._socket is not None:
+            return True
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # The broker answers expired requests itself, allow for the transaction running at that moment
+        sock.settimeout(self.timeout + 5.0)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            self.logger.error(f"Unable to reach the bus broker at {self.socket_path}: {e}")
+            sock.close()
+            return False
+        self._socket, self._file = sock, sock.makefile("rb")
+        return True
+
+    def close(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def _call(self, op: str, slave: int, address: int, count: int = 0, values: Optional[List[int]] = None):
+        if not self.connect():
+            raise ConnectionException(f"Bus broker {self.socket_path} unavailable")
+        request_id = next(self._ids)
+        message = {"id": request_id, "bus": self.bus, "op": op, "slave": slave, "address": address, "count": count,
+                   "values": values or [], "priority": self.priority, "max_age": self.max_age,
+                   "timeout": self.timeout}
+        try:
+            self._socket.sendall(json.dumps(message).encode() + b"\n")
+            while True:
+                line = self._file.readline()
+                if not line:
+                    raise ConnectionError("connection closed by the broker")
+                answer = json.loads(line)
+                # Skip the late answers of requests that timed out on an earlier connection
+                if answer.get("id") == request_id:
+                    break
+        except (OSError, ValueError) as e:
+            self.close()
+            raise ModbusIOException(f"Bus broker: {e}")
+        return _response(op, slave, address, count, values or [], answer)
+
+    def read_holding_registers(self, address: int, count: int = 1, slave: int = 1):
+        return self._call("read_holding", slave, address, count)
+
+    def read_input_registers(self, address: int, count: int = 1, slave: int = 1):
+        return self._call("read_input", slave, address, count)
+
+    def write_register(self, address: int, value: int, slave: int = 1):
+        return self._call("write_register", slave, address, 1, [value])
+
+    def write_registers(self, address: int, values: List[int], slave: int = 1):
+        return self._call("write_registers", slave, address, len(values), list(values))
+
+
+class AsyncBrokerModbusClient:
+    """ Stand-in for the pymodbus async clients, requests are matched to their answers by id """
+
+    def __init__(self, socket_path: str, bus: Dict[str, Any], priority: str = PRIORITY_ACQUISITION,
+                 max_age: float = 0.0, timeout: float = 10.0):
+        self.logger = LogManager().get_logger("BusBroker")
+        self.socket_path = socket_path
+        self.bus = bus
+        self.priority = priority
+        self.max_age = max_age
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> bool:
+        if self.connected:
+            return True
+        try:
+            reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        except OSError as e:
+            self.logger.error(f"Unable to reach the bus broker at {self.socket_path}: {e}")
+            return False
+        self._receiver = asyncio.ensure_future(self._receive(reader))
+        return True
+
+    def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+            self._receiver = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending()
+
+    def _fail_pending(self):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionException("Bus broker connection closed"))
+
+    async def _receive(self, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                answer = json.loads(line)
+                future = self._pending.pop(answer.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(answer)
+        except (ConnectionError, ValueError) as e:
+            self.logger.warning(f"Bus broker connection lost: {e}")
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            self._fail_pending()
+
+    async def _call(self, op: str, slave: int, address: int, count: int = 0, values: Optional[List[int]] = None):
+        if not await self.connect():
+            raise ConnectionException(f"Bus broker {self.socket_path} unavailable")
+        request_id = next(self._ids)
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        message = {"id": request_id, "bus": self.bus, "op": op, "slave": slave, "address": address, "count": count,
+                   "values": values or [], "priority": self.priority, "max_age": self.max_age,
+                   "timeout": self.timeout}
+        self._writer.write(json.dumps(message).encode() + b"\n")
+        try:
+            await self._writer.drain()
+            answer = await asyncio.wait_for(future, self.timeout + 5.0)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            self._pending.pop(request_id, None)
+            raise ModbusIOException(f"Bus broker: {e or 'no answer'}")
+        return _response(op, slave, address, count, values or [], answer)
+
+    async def read_holding_registers(self, address: int, count: int = 1, slave: int = 1):
+        return await self._call("read_holding", slave, address, count)
+
+    async def read_input_registers(self, address: int, count: int = 1, slave: int = 1):
+        return await self._call("read_input", slave, address, count)
+
+    async def write_register(self, address: int, value: int, slave: int = 1):
+        return await self._call("write_register", slave, address, 1, [value])
+
+    async def write_registers(self, address: int, values: List[int], slave: int = 1):
+        return await self._call("write_registers", slave, address, len(values), list(values))
+
+
+class BusBrokerSettings(metaclass=Singleton):
+    """
+    Whether this process reaches the Modbus buses through the bus broker, and as which request class.
+    Set up once at start, ModbusHardware then hands out broker clients instead of opening the bus.
+    """
+
+    def __init__(self):
+        self.socket_path: Optional[str] = None
+        self.priority = PRIORITY_ACQUISITION
+        self.max_age = 0.0
+        self.timeout = 10.0
+
+    def configure(self, socket_path: Optional[str], priority: str = PRIORITY_ACQUISITION, max_age: float = 0.0):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown bus broker priority {priority}")
+        self.socket_path = socket_path or None
+        self.priority = priority
+        self.max_age = max_age
+        if self.socket_path:
+            LogManager().get_logger("BusBroker").info(f"Modbus through the bus broker at {self.socket_path} "
+                                                      f"as {priority}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.socket_path is not None
+
+    def client(self, bus: Dict[str, Any]) -> BrokerModbusClient:
+        return BrokerModbusClient(self.socket_path, bus, self.priority, self.max_age, self.timeout)
+
+    def async_client(self, bus: Dict[str, Any]) -> AsyncBrokerModbusClient:
+        return AsyncBrokerModbusClient(self.socket_path, bus, self.priority, self.max_age, self.timeout)
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Tuple, AsyncIterator
+
+from utils import LogManager
+from utils.singleton import Singleton
+
+
+def _ensure_event_loop():
+    """
+    pymodbus 3.8 sync clients create an asyncio.Future on construction, which fails in worker threads
+    without an event loop.  Give such a thread its own (never run) loop.
+    """
+    policy = asyncio.get_event_loop_policy()
+    try:
+        policy.get_event_loop()
+    except RuntimeError:
+        policy.set_event_loop(policy.new_event_loop())
+
+
+@dataclass
+class PooledClient:
+    """ A Modbus client kept open across acquisition cycles, used by one thread at a time """
+    key: str
+    settings: Tuple
+    client: Any
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    connects: int = 0
+    resets: int = 0
+    last_used: float = 0.0
+
+    def reset(self):
+        """ Drop the connection after an error, the next request reconnects """
+        self.resets += 1
+        self.client.close()
+
+
+class ModbusClientPool(metaclass=Singleton):
+    """
+    Process wide pool of Modbus clients keyed by resource (serial port or TCP host:port).
+    Connections stay open between cycles and requests on one connection are serialized.  A connection
+    idle for longer than max_idle is re-opened before use, since gateways silently drop idle sockets.
+    """
+
+    def __init__(self, max_idle: float = 300.0):
+        self.logger = LogManager().get_logger("ModbusClientPool")
+        self.max_idle = max_idle
+        self._clients: Dict[str, PooledClient] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, hardware) -> PooledClient:
+        key = hardware.get_resource_key()
+        settings = hardware.client_settings()
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is None or pooled.settings != settings:
+                if pooled is not None:
+                    self.logger.warning(f"Modbus settings changed on {key}, replacing its client")
+                    with pooled.lock:
+                        pooled.client.close()
+                _ensure_event_loop()
+                pooled = self._clients[key] = PooledClient(key, settings, hardware.get_modbus_client())
+            return pooled
+
+    @contextmanager
+    def connection(self, hardware) -> Iterator[PooledClient]:
+        """
+        Exclusive use of the hardware's pooled client, connected if possible.
+        Any exception escaping the block resets the connection.
+        """
+        pooled = self._get(hardware)
+        with pooled.lock:
+            now = time.monotonic()
+            if pooled.client.connected and pooled.last_used and now - pooled.last_used > self.max_idle:
+                self.logger.info(f"Re-opening idle Modbus connection {pooled.key}")
+                pooled.client.close()
+            if not pooled.client.connected:
+                pooled.connects += 1
+                if not pooled.client.connect():
+                    self.logger.error(f"Modbus client {pooled.key} not connected... resetting")
+                    hardware.reset_hardware()
+            try:
+                yield pooled
+            except Exception:
+                pooled.reset()
+                raise
+            finally:
+                pooled.last_used = time.monotonic()
+
+    def connects(self, hardware) -> int:
+        """
+        Number of (re)connections the next request on the hardware's client runs on, a disconnected client
+        counts its upcoming reconnect.  Device state read on an earlier connection may be stale.
+        """
+        pooled = self._clients.get(hardware.get_resource_key())
+        return pooled.connects + (not pooled.client.connected) if pooled else 0
+
+    def close(self, key: str):
+        with self._lock:
+            pooled = self._clients.pop(key, None)
+        if pooled:
+            with pooled.lock:
+                pooled.client.close()
+
+    def close_all(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for pooled in clients:
+            with pooled.lock:
+                pooled.client.close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {key: {"connected": pooled.client.connected, "connects": pooled.connects, "resets": pooled.resets}
+                for key, pooled in list(self._clients.items())}
+
+
+@dataclass
+class AsyncPooledClient:
+    """ A pymodbus async client, bound to the event loop it was created in """
+    key: str
+    settings: Tuple
+    client: Any
+    loop: asyncio.AbstractEventLoop
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    connects: int = 0
+    resets: int = 0
+    last_used: float = 0.0
+
+    def reset(self):
+        self.resets += 1
+        self.client.close()
+
+
+class AsyncModbusClientPool(metaclass=Singleton):
+    """
+    ModbusClientPool for the asyncio acquisition path: one async client per resource and event loop.
+    Hardware behind one gateway may ask for different pipeline windows, the resource gets the largest.
+    """
+
+    def __init__(self, max_idle: float = 300.0):
+        self.logger = LogManager().get_logger("ModbusClientPool")
+        self.max_idle = max_idle
+        self._clients: Dict[Tuple[int, str], AsyncPooledClient] = {}
+        self._windows: Dict[str, int] = {}
+
+    def _get(self, hardware) -> AsyncPooledClient:
+        loop = asyncio.get_running_loop()
+        resource = hardware.get_resource_key()
+        key = (id(loop), resource)
+        window = self._windows[resource] = max(self._windows.get(resource, 1), hardware.pipeline_window)
+        settings = (hardware.client_settings(), window)
+        pooled = self._clients.get(key)
+        if pooled is None or pooled.settings != settings or pooled.loop is not loop:
+            if pooled is not None:
+                pooled.client.close()
+            pooled = self._clients[key] = AsyncPooledClient(resource, settings,
+                                                            hardware.get_async_modbus_client(window), loop)
+        return pooled
+
+    @asynccontextmanager
+    async def connection(self, hardware) -> AsyncIterator[AsyncPooledClient]:
+        pooled = self._get(hardware)
+        async with pooled.lock:
+            now = time.monotonic()
+            if pooled.client.connected and pooled.last_used and now - pooled.last_used > self.max_idle:
+                self.logger.info(f"Re-opening idle Modbus connection {pooled.key}")
+                pooled.client.close()
+            if not pooled.client.connected:
+                pooled.connects += 1
+                if not await pooled.client.connect():
+                    self.logger.error(f"Modbus client {pooled.key} not connected... resetting")
+                    hardware.reset_hardware()
+            try:
+                yield pooled
+            except Exception:
+                pooled.reset()
+                raise
+            finally:
+                pooled.last_used = time.monotonic()
+
+    def connects(self, hardware) -> int:
+        pooled = self._clients.get((id(asyncio.get_running_loop()), hardware.get_resource_key()))
+        return pooled.connects + (not pooled.client.connected) if pooled else 0
+
+    def close_all(self):
+        clients, self._clients = list(self._clients.values()), {}
+        self._windows.clear()
+        for pooled in clients:
+            pooled.client.close()
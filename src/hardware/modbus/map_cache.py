@@ -0,0 +1,82 @@
+import hashlib
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from hardware.modbus.modbus_map import ModbusMap
+from utils import LogManager
+from utils.singleton import Singleton
+
+# Bump when ModbusRegister / ModbusMap change shape, older cache files are then ignored
+CACHE_FORMAT = 2
+
+
+class ModbusMapCache(metaclass=Singleton):
+    """
+    Process wide cache of compiled ModbusMaps keyed by path and file version (mtime, size): every driver
+    using a map shares one instance, so its registers, resolved scan groups and address index are built once.
+    With a cache_dir the compiled map is also pickled there, a later process loads it instead of parsing
+    the JSON.  The cache directory must only be writable by this application.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.logger = LogManager().get_logger("ModbusMapCache")
+        self.cache_dir = cache_dir
+        self._maps: Dict[str, Tuple[Tuple[int, int], ModbusMap]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def load(self, path: str) -> ModbusMap:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._maps.get(path)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+            self.loads += 1
+            modbus_map = self._read_compiled(path, version)
+            if modbus_map is None:
+                modbus_map = ModbusMap.from_json(path)
+                self._write_compiled(path, version, modbus_map)
+            self._maps[path] = (version, modbus_map)
+            return modbus_map
+
+    def clear(self):
+        with self._lock:
+            self._maps.clear()
+
+    def _compiled_path(self, path: str) -> Optional[Path]:
+        if not self.cache_dir:
+            return None
+        return Path(self.cache_dir) / f"{hashlib.sha1(path.encode()).hexdigest()}.modbus_map.pickle"
+
+    def _read_compiled(self, path: str, version: Tuple[int, int]) -> Optional[ModbusMap]:
+        compiled = self._compiled_path(path)
+        if compiled is None or not compiled.exists():
+            return None
+        try:
+            with open(compiled, "rb") as f:
+                cache_format, cached_path, cached_version, modbus_map = pickle.load(f)
+            if (cache_format, cached_path, cached_version) == (CACHE_FORMAT, path, version):
+                return modbus_map
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable compiled Modbus map {compiled}: {e}")
+        return None
+
+    def _write_compiled(self, path: str, version: Tuple[int, int], modbus_map: ModbusMap):
+        compiled = self._compiled_path(path)
+        if compiled is None:
+            return
+        try:
+            compiled.parent.mkdir(parents=True, exist_ok=True)
+            tmp = compiled.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump((CACHE_FORMAT, path, version, modbus_map), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, compiled)
+        except OSError as e:
+            self.logger.warning(f"Unable to write compiled Modbus map {compiled}: {e}")
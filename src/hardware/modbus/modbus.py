@@ -1,9 +1,22 @@
-from typing import Dict, Union, List
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Union, List, Tuple, Optional, Any
+
+from pymodbus.pdu import ExceptionResponse
 
 from .modbus_map import ModbusMap, ModbusDatatype, ModbusRegister
 from .modbus_hardware import ModbusHardware
+from .client_pool import ModbusClientPool
+from .read_planner import plan_reads, split_block
+from .transaction_stats import ModbusTransactionStats, TransactionKey
 from utils import LogManager
 
+WRITE_SINGLE_REGISTER = 6
+WRITE_MULTIPLE_REGISTERS = 16
+# Modbus limit of registers per write (FC16)
+MAX_WRITE_REGISTERS = 123
+
 
 
 def convert_register_value(raw_value: int, register: ModbusRegister) -> float:
@@ -61,54 +74,185 @@ def modbus_data_acquisition_orig(modbus_hardware: ModbusHardware,
         client.close()
 
 
+@dataclass
+class WriteBlock:
+    """ Contiguous registers of one slave written in one transaction, FC06 for one register, FC16 otherwise """
+    slave_id: int
+    start: int
+    values: List[int] = field(default_factory=list)  # raw 16 bit words
+    registers: List[ModbusRegister] = field(default_factory=list)
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.values)
+
+
+@dataclass
+class WriteResult:
+    """ Outcome per register name of a batched write """
+    written: Dict[str, bool] = field(default_factory=dict)
+    verified: Dict[str, bool] = field(default_factory=dict)  # read-back matched, only when verifying
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def success(self) -> bool:
+        return bool(self.written) and not self.errors and all(self.written.values()) and all(self.verified.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"success": self.success, "written": self.written, "verified": self.verified, "errors": self.errors}
+
+
+def plan_writes(values: List[Tuple[ModbusRegister, int, int]],
+                max_count: int = MAX_WRITE_REGISTERS) -> List[WriteBlock]:
+    """
+    Group (register, raw value, slave id) into write blocks of contiguous addresses per slave, at most
+    max_count registers each
+    """
+    blocks: List[WriteBlock] = []
+    block: Optional[WriteBlock] = None
+    for register, raw_value, slave_id in sorted(values, key=lambda v: (v[2], int(v[0].address))):
+        address = int(register.address)
+        if block and block.slave_id == slave_id and block.end == address and len(block.values) < max_count:
+            block.values.append(raw_value)
+            block.registers.append(register)
+        else:
+            block = WriteBlock(slave_id, address, [raw_value], [register])
+            blocks.append(block)
+    return blocks
+
+
 def modbus_data_write(modbus_hardware: ModbusHardware,
                       modbus_map: ModbusMap,
                       slave_id: int,
                       register_name: str,
                       value: Union[float, int],
                       logger=None) -> bool:
+    return modbus_data_write_many(modbus_hardware, modbus_map, slave_id, {register_name: value},
+                                  logger=logger).success
+
+
+def modbus_data_write_many(modbus_hardware: ModbusHardware,
+                           modbus_map: ModbusMap,
+                           slave_id: int,
+                           values: Dict[str, Union[float, int]],
+                           verify: bool = False,
+                           logger=None) -> WriteResult:
+    """
+    Write raw values to many registers {register_name: value} on one pooled connection.  Contiguous registers
+    are written together with write_registers (FC16).  Nothing is written unless every register is writable
+    (access RW or W) and every value fits its data type.  A block without response stops the remaining
+    writes.  With verify the written registers are read back in coalesced reads and compared.
+    """
     if not logger:
         logger = LogManager().get_logger("ModbusHardware")
+    result = WriteResult()
 
-    client = modbus_hardware.get_modbus_client()
-    try:
-        if not client.connect():
-            logger.warning("Failed to connect to Modbus client.")
-            return False
-
-        # Find the register by name
+    pending: List[Tuple[ModbusRegister, int, int]] = []
+    # Results are reported under the names given by the caller
+    requested: Dict[str, str] = {}
+    addresses = set()
+    for register_name, value in values.items():
         register = modbus_map.get_register_by_name(register_name)
         if not register:
-            logger.warning(f"Register {register_name} not found in map")
-            return False
-
-        if register.read_write != "RW":
-            logger.warning(f"Cannot write, register is not RW: {register}")
-            return False
-        # Convert the value to the appropriate format for the register
+            result.errors[register_name] = "not found in map"
+            continue
+        if register.access not in ("RW", "W"):
+            result.errors[register_name] = f"not writable, access {register.access}"
+            continue
+        register_slave_id = register.slave_id or slave_id
+        if (register_slave_id, int(register.address)) in addresses:
+            result.errors[register_name] = f"address {register.address} written twice"
+            continue
+        addresses.add((register_slave_id, int(register.address)))
+        requested[register.name] = register_name
         try:
-            converted_value = prepare_value_for_register(value, register)
-        except ValueError as e:
-            logger.exception(f"Error converting value: {e}")
-            return False
-
-        # Attempt write to register
-        address = register.get_addresses()[0]
-        result = client.write_register(address=address, value=converted_value, slave=slave_id)
-
-        if result is None:
-            logger.error(f"No response received from port {modbus_hardware.port}, slave: {slave_id}")
-            return False
-        elif hasattr(result, 'isError') and result.isError():
-            logger.error(f"Error writing to register: {result}")
-            return False
-        return True
+            pending.append((register, prepare_value_for_register(value, register) & 0xFFFF, register_slave_id))
+        except (ValueError, TypeError) as e:
+            result.errors[register_name] = str(e)
+    if result.errors:
+        logger.warning(f"Modbus write to slave {slave_id} refused: {result.errors}")
+        return result
 
+    blocks = plan_writes(pending)
+    try:
+        with ModbusClientPool().connection(modbus_hardware) as pooled:
+            if not pooled.client.connected:
+                logger.warning("Failed to connect to Modbus client.")
+                result.errors["connection"] = "failed to connect"
+                return result
+            for block in blocks:
+                written, responded = _write_block(modbus_hardware, pooled.client, block, logger)
+                for register in block.registers:
+                    result.written[requested[register.name]] = written
+                if not responded:
+                    # Drop what may be left of a late response, the next transaction reconnects
+                    pooled.reset()
+                    break
+            if verify:
+                confirmed = [register for register, _, _ in pending if result.written.get(requested[register.name])]
+                expected = {register.name: raw_value for register, raw_value, _ in pending}
+                verified = _read_back(modbus_hardware, pooled.client, confirmed, expected, slave_id, logger)
+                result.verified = {requested[name]: ok for name, ok in verified.items()}
     except Exception as e:
         logger.error(f"Error writing to modbus: {e}")
-        return False
-    finally:
-        client.close()
+        result.errors["exception"] = str(e)
+    for register, _, _ in pending:
+        result.written.setdefault(requested[register.name], False)
+    logger.info(f"Modbus write to slave {slave_id}: {sum(result.written.values())}/{len(pending)} registers in "
+                f"{len(blocks)} transactions" + (f", {sum(result.verified.values())} verified" if verify else ""))
+    return result
+
+
+def _write_block(modbus_hardware: ModbusHardware, client, block: WriteBlock, logger) -> Tuple[bool, bool]:
+    """ :return: (written, whether the slave responded) """
+    function = WRITE_SINGLE_REGISTER if len(block.values) == 1 else WRITE_MULTIPLE_REGISTERS
+    started = time.perf_counter()
+    result = None
+    try:
+        if function == WRITE_SINGLE_REGISTER:
+            result = client.write_register(address=block.start, value=block.values[0], slave=block.slave_id)
+        else:
+            result = client.write_registers(address=block.start, values=block.values, slave=block.slave_id)
+    except Exception as e:
+        logger.error(f"Error writing registers {block.start}-{block.end - 1} on slave {block.slave_id}: {e}")
+    responded = result is not None and (not result.isError() or isinstance(result, ExceptionResponse))
+    ModbusTransactionStats().record(
+        TransactionKey(modbus_hardware.get_resource_key(), block.slave_id, function, block.start, len(block.values)),
+        time.perf_counter() - started, responded,
+        result.exception_code if isinstance(result, ExceptionResponse) else None)
+    if result is None:
+        logger.error(f"No response received from port {modbus_hardware.port}, slave: {block.slave_id}")
+        return False, False
+    if result.isError():
+        logger.error(f"Error writing to registers {block.start}-{block.end - 1}: {result}")
+        return False, responded
+    return True, True
+
+
+def _read_back(modbus_hardware: ModbusHardware, client, registers: List[ModbusRegister],
+               expected: Dict[str, int], slave_id: int, logger) -> Dict[str, bool]:
+    """ Compare the written registers with the device, a refused coalesced read is retried per register """
+    verified = {register.name: False for register in registers}
+    blocks = deque(plan_reads(registers, modbus_hardware.max_read_gap, modbus_hardware.max_read_registers,
+                              modbus_map=modbus_hardware.modbus_map))
+    while blocks:
+        block = blocks.popleft()
+        block_slave_id = block.slave_id or slave_id
+        try:
+            result = client.read_holding_registers(address=block.start, count=block.count, slave=block_slave_id)
+        except Exception as e:
+            logger.error(f"Error reading back registers {block.start}-{block.end - 1}: {e}")
+            result = None
+        if result is None or result.isError():
+            if result is not None and len(block.registers) > 1:
+                blocks.extendleft(reversed(split_block(block)))
+            continue
+        for register in block.registers:
+            verified[register.name] = (block.slice(result.registers, register)[0] & 0xFFFF) == expected[register.name]
+    mismatched = [name for name, ok in verified.items() if not ok]
+    if mismatched:
+        logger.warning(f"Modbus read-back of slave {slave_id} does not match the written values: {mismatched}")
+    return verified
 
 
 def prepare_value_for_register(value: Union[float, int], register: ModbusRegister) -> int:
@@ -1,13 +1,36 @@
-from typing import Tuple, Union, Optional, List, Dict
+import asyncio
+import time
+from collections import deque
+from typing import Tuple, Union, Optional, List, Dict, Any, Callable
 from enum import Enum
 from dataclasses import dataclass
-from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+from pymodbus.client import ModbusSerialClient, ModbusTcpClient, AsyncModbusSerialClient, AsyncModbusTcpClient
 from pymodbus.framer import FramerType
+from pymodbus.pdu import ExceptionResponse
 from hardware.hardware_base import HardwareBase
+from hardware.device_health import CircuitBreaker
+from telemetry.deadband import Deadband
 from hardware.modbus.modbus_map import ModbusMap, ModbusRegister, ModbusDatatype, ModbusRegisterType
+from hardware.modbus.read_planner import ReadBlock, plan_reads, split_block, bisect_block, MAX_READ_REGISTERS
+from hardware.modbus.read_planner import UNREADABLE_REPROBE
+from hardware.modbus.block_layouts import BlockLayouts
+from hardware.modbus.bus_broker import BusBrokerSettings, BrokerModbusClient, AsyncBrokerModbusClient
+from hardware.modbus.block_decoder import BlockDecoder, decoder_for
+from hardware.modbus.client_pool import ModbusClientPool, AsyncModbusClientPool
+from hardware.modbus.map_cache import ModbusMapCache
+from hardware.modbus.pipelined_client import PipelinedModbusTcpClient
+from hardware.modbus.transaction_stats import ModbusTransactionStats, TransactionKey
 from utils import LogManager, check_interface, set_tcp_interface
 
 
+READ_HOLDING_REGISTERS = 3
+READ_INPUT_REGISTERS = 4
+# Exception codes of a block spanning registers the device does not serve, its layout is learned from them
+ILLEGAL_DATA_ADDRESS = 2
+ILLEGAL_DATA_VALUE = 3
+LAYOUT_EXCEPTIONS = (ILLEGAL_DATA_ADDRESS, ILLEGAL_DATA_VALUE)
+
+
 class ModbusClientType(Enum):
     TCP = 1,
     RTU = 2,
@@ -28,32 +51,103 @@ class ModbusHardware(HardwareBase):
     interface: Optional[str] = None
     interface_ip: Optional[str] = None
     modbus_map_path: str = ""
+    # Consecutive failed reads before a device is skipped, and its backoff before the next probe
+    breaker_threshold: int = 3
+    breaker_backoff: float = 10.0
+    breaker_max_backoff: float = 300.0
+    # Registers are read in blocks, bridging up to max_read_gap unused registers
+    max_read_gap: int = 4
+    max_read_registers: int = MAX_READ_REGISTERS
+    # Learn which registers the device refuses to read together, see BlockLayouts
+    adaptive_blocks: bool = True
+    # Modbus TCP reads kept in flight on the asyncio path, 1 disables pipelining
+    pipeline_window: int = 1
     _modbus_map: Optional[ModbusMap] = None
 
     MODBUS_SLEEP_BETWEEN_READS: float = 0.05
 
     def __post_init__(self):
         super().__post_init__()
-        self._modbus_map = ModbusMap.from_json(self.modbus_map_path)
+        self._modbus_map = ModbusMapCache().load(self.modbus_map_path)
 
     @property
-    def modbus_map(self):
+    def modbus_map(self) -> ModbusMap:
+        # Shared with every driver using the same map file, do not modify
         if not self._modbus_map:
-            self._modbus_map = ModbusMap.from_json(self.modbus_map_path)
+            self._modbus_map = ModbusMapCache().load(self.modbus_map_path)
         return self._modbus_map
 
     def get_points(self, names: List[str]) -> List:
         return [p for p in self.modbus_map.register_iterator(names)]
 
+    def get_deadbands(self, names: List[str]) -> Dict[str, Deadband]:
+        return {r.name: Deadband(r.deadband, r.deadband_percent, r.max_silence)
+                for r in self.modbus_map.register_iterator(names)
+                if r.deadband is not None or r.deadband_percent is not None}
+
 
     def data_acquisition(self, devices: list, scan_group_registers: List[str], _):
-        registers = [r for r in self.modbus_map.register_iterator(scan_group_registers)]
+        self._warn_unused_window()
+        registers = self.modbus_map.resolve(scan_group_registers)
+        output = {}
+        for device in devices:
+            slave_id = device['slave_id']
+            mac = device['mac']
+            breaker = self.get_breaker(mac)
+            if not breaker.allow_request():
+                self.logger.info(f"Skipping slave {slave_id} ({mac}), unresponsive after "
+                                 f"{breaker.consecutive_failures} failed reads")
+                output[mac] = {}
+                continue
+            output[mac] = modbus_data_acquisition(self, registers, slave_id, breaker=breaker,
+                                                  deadline=self.acquisition_deadline)
+        return output
+
+    async def async_data_acquisition(self, devices: list, scan_group_registers: List[str], _):
+        registers = self.modbus_map.resolve(scan_group_registers)
         output = {}
         for device in devices:
             slave_id = device['slave_id']
             mac = device['mac']
-            output[mac] = modbus_data_acquisition(self, registers, slave_id)
-        return output    
+            breaker = self.get_breaker(mac)
+            if not breaker.allow_request():
+                self.logger.info(f"Skipping slave {slave_id} ({mac}), unresponsive after "
+                                 f"{breaker.consecutive_failures} failed reads")
+                output[mac] = {}
+                continue
+            output[mac] = await async_modbus_data_acquisition(self, registers, slave_id, breaker=breaker,
+                                                              deadline=self.acquisition_deadline)
+        return output
+
+    def has_native_async(self) -> bool:
+        return True
+
+    def _warn_unused_window(self):
+        # Only the asyncio acquisition pipelines reads, see TelemetryConfig.async_acquisition
+        if self.pipeline_window > 1 and not self.__dict__.get("_window_warned"):
+            self.__dict__["_window_warned"] = True
+            self.logger.warning(f"pipeline_window {self.pipeline_window} of {self.get_resource_key()} is not used, "
+                                f"reads are only pipelined with async_acquisition enabled")
+
+    @property
+    def _breakers(self) -> Dict[Any, CircuitBreaker]:
+        # Not a dataclass field, and subclasses may not run __post_init__
+        return self.__dict__.setdefault("_device_breakers", {})
+
+    def get_breaker(self, device_id) -> CircuitBreaker:
+        breaker = self._breakers.get(device_id)
+        if breaker is None:
+            breaker = self._breakers[device_id] = CircuitBreaker(self.breaker_threshold, self.breaker_backoff,
+                                                                 self.breaker_max_backoff)
+        return breaker
+
+    def device_health(self) -> Dict[str, Dict[str, Any]]:
+        return {device_id: breaker.status() for device_id, breaker in self._breakers.items()}
+
+    def get_resource_key(self) -> str:
+        if self.client_type == ModbusClientType.TCP:
+            return f"tcp:{self.host}:{self.port}"
+        return f"serial:{self.port}"
 
     # TCP Modbus resets/checks the interface settings
     def reset_hardware(self) -> Tuple[str, Union[str, bool]]:
@@ -89,7 +183,24 @@ class ModbusHardware(HardwareBase):
         return ModbusTcpClient(host=self.host, port=int(self.port))
 
 
-    def get_modbus_client(self) -> Union[ModbusTcpClient, ModbusSerialClient]:
+    def client_settings(self) -> tuple:
+        """ Hardware sharing a resource with different settings cannot share its pooled client """
+        if self.client_type == ModbusClientType.TCP:
+            # The pipeline window is picked per resource by the AsyncModbusClientPool
+            return self.client_type, self.host, self.port, BusBrokerSettings().socket_path
+        return self.client_type, self.port, self.framer, self.baudrate, self.parity, self.stopbits, self.bytesize, \
+            self.timeout, BusBrokerSettings().socket_path
+
+    def bus_spec(self) -> Dict[str, Any]:
+        """ The bus description sent to the bus broker """
+        if self.client_type == ModbusClientType.TCP:
+            return {"type": "tcp", "host": self.host, "port": int(self.port)}
+        return {"type": "rtu", "port": self.port, "framer": self.framer.value, "baudrate": self.baudrate,
+                "parity": self.parity, "stopbits": self.stopbits, "bytesize": self.bytesize, "timeout": self.timeout}
+
+    def get_modbus_client(self) -> Union[ModbusTcpClient, ModbusSerialClient, BrokerModbusClient]:
+        if BusBrokerSettings().enabled and self.client_type != ModbusClientType.NA:
+            return BusBrokerSettings().client(self.bus_spec())
         if self.client_type == ModbusClientType.RTU:
             return self.get_modbus_serial_client()
         elif self.client_type == ModbusClientType.TCP:
@@ -97,6 +208,24 @@ class ModbusHardware(HardwareBase):
         else:
             raise Exception(f"Invalid Modbus Hardware specification {self.client_type}")
 
+    def get_async_modbus_client(self, window: Optional[int] = None
+                                ) -> Union[AsyncModbusTcpClient, AsyncModbusSerialClient, PipelinedModbusTcpClient,
+                                           AsyncBrokerModbusClient]:
+        """ window overrides the hardware's pipeline_window """
+        window = self.pipeline_window if window is None else window
+        if BusBrokerSettings().enabled and self.client_type != ModbusClientType.NA:
+            return BusBrokerSettings().async_client(self.bus_spec())
+        if self.client_type == ModbusClientType.TCP and window > 1:
+            return PipelinedModbusTcpClient(self.host, int(self.port), window=window)
+        if self.client_type == ModbusClientType.RTU:
+            return AsyncModbusSerialClient(port=self.port, framer=self.framer, baudrate=self.baudrate,
+                                           parity=self.parity, stopbits=self.stopbits, bytesize=self.bytesize,
+                                           timeout=self.timeout)
+        elif self.client_type == ModbusClientType.TCP:
+            return AsyncModbusTcpClient(host=self.host, port=int(self.port))
+        else:
+            raise Exception(f"Invalid Modbus Hardware specification {self.client_type}")
+
 
     def create_read_message(self, register, slave_id) -> Tuple[bytes, int]:
         """ creates the message that the hardware is expecting """
@@ -153,46 +282,261 @@ def convert_register_value(raw_values: List[int], register: ModbusRegister) -> U
     return value * register.conversion_factor
 
 
+def _request_block(client, block: ReadBlock, slave_id: int, logger):
+    """ Send the block read, returns the response (sync clients) or an awaitable (async clients) """
+    if block.register_type == ModbusRegisterType.HOLDING:
+        logger.info(f"Reading HOLDING registers: {block.start}-{block.end - 1}, {slave_id}, "
+                    f"{len(block.registers)} points")
+        return client.read_holding_registers(address=block.start, count=block.count, slave=slave_id)
+    logger.info(f"Reading INPUT registers: {block.start}-{block.end - 1}, {slave_id}, "
+                f"{len(block.registers)} points")
+    return client.read_input_registers(address=block.start, count=block.count, slave=slave_id)
+
+
+def _check_response(result, slave_id: int, port, logger) -> Tuple[Optional[List[int]], bool]:
+    """
+    :return: (register values or None on failure, whether the slave responded)
+    """
+    if result is None:
+        logger.info(f"No response received from port {port}, slave: {slave_id}")
+        return None, False
+    if hasattr(result, 'isError') and result.isError():
+        logger.info(f"Error reading registers: {result}")
+        # An exception response still proves the slave is alive
+        return None, isinstance(result, ExceptionResponse)
+    logger.info(f"Result is: {result.registers}")
+    return result.registers, True
+
+
+def _transaction_key(modbus_hardware: ModbusHardware, block: ReadBlock, slave_id: int) -> TransactionKey:
+    function = READ_HOLDING_REGISTERS if block.register_type == ModbusRegisterType.HOLDING else READ_INPUT_REGISTERS
+    return TransactionKey(modbus_hardware.get_resource_key(), slave_id, function, block.start, block.count)
+
+
+def _trace(modbus_hardware: ModbusHardware, block: ReadBlock, slave_id: int, started: float, result,
+           responded: bool) -> Optional[int]:
+    """ Record the transaction, returns the Modbus exception code of an exception response """
+    exception_code = result.exception_code if isinstance(result, ExceptionResponse) else None
+    ModbusTransactionStats().record(_transaction_key(modbus_hardware, block, slave_id),
+                                    time.perf_counter() - started, responded, exception_code)
+    return exception_code
+
+
+def _read_block(client: Union[ModbusTcpClient, ModbusSerialClient], block: ReadBlock, slave_id: int,
+                modbus_hardware: ModbusHardware, logger) -> Tuple[Optional[List[int]], bool, Optional[int]]:
+    """ :return: (register values or None on failure, whether the slave responded, exception code) """
+    started = time.perf_counter()
+    try:
+        result = _request_block(client, block, slave_id, logger)
+    except Exception as e:
+        logger.exception(f"Error reading modbus: {e} on slave: {slave_id}, {block.start}.. .continuing.", exc_info=True)
+        _trace(modbus_hardware, block, slave_id, started, None, False)
+        return None, False, None
+    raw_values, responded = _check_response(result, slave_id, modbus_hardware.port, logger)
+    return raw_values, responded, _trace(modbus_hardware, block, slave_id, started, result, responded)
+
+
+async def _async_read_block(client: Union[AsyncModbusTcpClient, AsyncModbusSerialClient], block: ReadBlock,
+                            slave_id: int, modbus_hardware: ModbusHardware,
+                            logger) -> Tuple[Optional[List[int]], bool, Optional[int]]:
+    started = time.perf_counter()
+    try:
+        result = await _request_block(client, block, slave_id, logger)
+    except Exception as e:
+        logger.exception(f"Error reading modbus: {e} on slave: {slave_id}, {block.start}.. .continuing.", exc_info=True)
+        _trace(modbus_hardware, block, slave_id, started, None, False)
+        return None, False, None
+    raw_values, responded = _check_response(result, slave_id, modbus_hardware.port, logger)
+    return raw_values, responded, _trace(modbus_hardware, block, slave_id, started, result, responded)
+
+
+class _DeviceReads:
+    """
+    Bookkeeping of one device acquisition shared by the sync and async paths: the planned blocks, the
+    deadline, the circuit breaker, the register by register fallback and the decoding.
+    """
+
+    def __init__(self, modbus_hardware: ModbusHardware, registers: List[ModbusRegister], slave_id: int,
+                 logger, breaker: Optional[CircuitBreaker], deadline: Optional[float],
+                 decoder: Callable[[ReadBlock], BlockDecoder] = decoder_for):
+        self.modbus_hardware = modbus_hardware
+        self.registers = registers
+        self.decoder = decoder
+        self.slave_id = slave_id
+        self.logger = logger
+        self.breaker = breaker
+        self.deadline = deadline
+        self.layout = None
+        if modbus_hardware.adaptive_blocks:
+            self.layout = BlockLayouts().layout(modbus_hardware.get_resource_key(), slave_id,
+                                                modbus_hardware.modbus_map.version)
+        self.layout_changed = False
+        self.blocks = deque(plan_reads(registers, modbus_hardware.max_read_gap, modbus_hardware.max_read_registers,
+                                       self.layout, modbus_hardware.modbus_map))
+        self.values: Dict[str, Union[float, int, str]] = {}
+
+    def next_block(self) -> Optional[ReadBlock]:
+        if not self.blocks:
+            return None
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.logger.warning(f"Acquisition deadline reached on slave: {self.slave_id}, "
+                                f"{sum(len(b.registers) for b in self.blocks)} registers not read")
+            self.blocks.clear()
+            return None
+        return self.blocks.popleft()
+
+    def block_slave_id(self, block: ReadBlock) -> int:
+        # In some cases, like Inview S the slave ID is used to query different systems not devices
+        return block.slave_id or self.slave_id
+
+    def record(self, block: ReadBlock, raw_values: Optional[List[int]], responded: bool,
+               exception_code: Optional[int] = None) -> bool:
+        """ :return: False when the device should not be read any further """
+        if self.breaker:
+            if responded:
+                self.breaker.record_success()
+            elif self.breaker.record_failure():
+                self.logger.warning(f"Slave {self.slave_id} unresponsive after {self.breaker.consecutive_failures} "
+                                    f"failed reads, skipping its remaining registers")
+                return False
+
+        if raw_values is None:
+            if self.layout is not None and exception_code in LAYOUT_EXCEPTIONS:
+                self.learn_refusal(block)
+            elif len(block.registers) > 1:
+                # The device may refuse the unused registers of a gap, fall back to one read per register
+                self.blocks.extendleft(reversed(split_block(block)))
+                ModbusTransactionStats().record_retry(_transaction_key(self.modbus_hardware, block,
+                                                                       self.block_slave_id(block)))
+            return True
+        if block.bisection is not None:
+            self.learn_success(block)
+        if self.layout is not None and (self.layout.unreadable or self.layout.refusals):
+            self.learn_readable(block)
+
+        decoder = self.decoder(block)
+        registers = decoder.fallback
+        try:
+            self.values.update(decoder.decode(raw_values))
+        except Exception as e:
+            self.logger.warning(f"Block decode failed on slave: {self.block_slave_id(block)}, {block.start}: {e}, "
+                                f"decoding register by register")
+            registers = block.registers
+        for register in registers:
+            try:
+                value = convert_register_value(block.slice(raw_values, register), register)
+                self.values[register.name] = decoder.rescale(register.name, value)
+            except Exception as e:
+                self.logger.exception(f"Error decoding modbus: {e} on slave: {self.block_slave_id(block)}, "
+                                      f"{register.address}.. .continuing.", exc_info=True)
+        return True
+
+    def learn_refusal(self, block: ReadBlock):
+        """ Bisect a refused block, a single register refused UNREADABLE_REFUSALS times is left out of the plans """
+        if block.bisection is not None:
+            block.bisection.failed = True
+        if len(block.registers) > 1:
+            self.blocks.extendleft(reversed(bisect_block(block)))
+            ModbusTransactionStats().record_retry(_transaction_key(self.modbus_hardware, block,
+                                                                   self.block_slave_id(block)))
+            return
+        register = block.registers[0]
+        if self.layout.refused(register):
+            self.logger.warning(f"Slave {self.slave_id} refuses register {register.name} ({register.address}), "
+                                f"it is not read for the next {UNREADABLE_REPROBE:.0f}s")
+            self.layout_changed = True
+
+    def learn_success(self, block: ReadBlock):
+        """ Both halves of a refused block read: the device refuses their join """
+        bisection = block.bisection
+        bisection.read += 1
+        if bisection.read == 2 and not bisection.failed:
+            self.logger.info(f"Slave {self.slave_id} refuses blocks across {bisection.lo}-{bisection.hi}, "
+                             f"reads are split there from now on")
+            self.layout.cuts.add((bisection.slave_id, bisection.register_type.value, bisection.lo, bisection.hi))
+            self.layout_changed = True
+
+    def learn_readable(self, block: ReadBlock):
+        """ Registers read again after being refused are planned as usual """
+        for register in self.layout.read(block.registers):
+            self.logger.info(f"Slave {self.slave_id} serves register {register.name} ({register.address}) again")
+            self.layout_changed = True
+
+    def output(self) -> Dict[str, Union[float, int]]:
+        if self.layout_changed:
+            BlockLayouts().learned(self.modbus_hardware.get_resource_key(), self.slave_id,
+                                   self.modbus_hardware.modbus_map.version)
+            self.layout_changed = False
+        # Keep the scan group order
+        return {r.name: self.values[r.name] for r in self.registers if r.name in self.values}
+
+
 def modbus_data_acquisition(modbus_hardware: ModbusHardware,
                             registers: List[ModbusRegister], slave_id: int,
-                            logger=None) -> Dict[str, Union[float, int]]:
+                            logger=None, breaker: Optional[CircuitBreaker] = None,
+                            deadline: Optional[float] = None,
+                            decoder: Callable[[ReadBlock], BlockDecoder] = decoder_for
+                            ) -> Dict[str, Union[float, int]]:
     """
     This method queries the modbus hardware based upon the slave_id and the provided registers.
     The output is in the format of a dictionary:   { register_name: register_value }
+    Adjacent registers are read in blocks (see read_planner), a refused block is retried register by register.
+    The client comes from the ModbusClientPool and stays connected for the next call.
+    When a breaker is given the remaining registers are abandoned as soon as it opens, and reading stops
+    once the deadline (time.monotonic()) has passed.  decoder supplies the compiled BlockDecoder of a block.
     """
     if not logger:
         logger = LogManager().get_logger("ModbusHardware")
 
-    client = modbus_hardware.get_modbus_client()
-    if not client.connect():
-        logger.error("Modbus client not connected... resetting")
-        modbus_hardware.reset_hardware()
+    reads = _DeviceReads(modbus_hardware, registers, slave_id, logger, breaker, deadline, decoder)
+    with ModbusClientPool().connection(modbus_hardware) as pooled:
+        while (block := reads.next_block()) is not None:
+            raw_values, responded, exception_code = _read_block(pooled.client, block, reads.block_slave_id(block),
+                                                                modbus_hardware, logger)
+            if raw_values is None and not responded:
+                # Drop what may be left of a late response, the next read reconnects
+                pooled.reset()
+            if not reads.record(block, raw_values, responded, exception_code):
+                break
+    return reads.output()
 
-    output: Dict[str, Union[float, int]] = {}
-    for register in registers:
-        address = int(register.address)
-        try:
-            # In some cases, like Inview S the slave ID is used to query different systems not devices
-            if register.slave_id:
-                slave_id = register.slave_id
-            result = None
-            if ModbusRegisterType(register.type) == ModbusRegisterType.HOLDING:
-                logger.info(f"Reading HOLDING register: {address}, {slave_id}, {register.name}")
-                result = client.read_holding_registers(address=address, count=register.range_size, slave=slave_id)
-            else:
-                logger.info(f"Reading INPUT register: {address}, {slave_id}, {register.name}")
-                result = client.read_input_registers(address=address, count=register.range_size, slave=slave_id)
-            if result is None:
-                logger.info(f"No response received from port {modbus_hardware.port}, slave: {slave_id}")
-            elif hasattr(result, 'isError') and result.isError():
-                logger.info(f"Error reading register: {result}")
-            else:
-                logger.info(f"Result is: {result.registers}")
-                output[register.name] = convert_register_value(result.registers, register)
-        except Exception as e:
-            logger.exception(f"Error reading modbus: {e} on slave: {slave_id}, {address}.. .continuing.", exc_info=True)
 
-    # output['slave_id'] = slave_id
-    client.close()
-    return output
+async def async_modbus_data_acquisition(modbus_hardware: ModbusHardware,
+                                        registers: List[ModbusRegister], slave_id: int,
+                                        logger=None, breaker: Optional[CircuitBreaker] = None,
+                                        deadline: Optional[float] = None,
+                                        decoder: Callable[[ReadBlock], BlockDecoder] = decoder_for
+                                        ) -> Dict[str, Union[float, int]]:
+    """
+    asyncio version of modbus_data_acquisition on the pymodbus async clients (AsyncModbusClientPool).
+    Reads on different resources can then run concurrently in the event loop without threads.
+    With pipeline_window > 1 a Modbus TCP device gets that many blocks in flight on its connection (the largest
+    window of the hardware sharing the connection).
+    """
+    if not logger:
+        logger = LogManager().get_logger("ModbusHardware")
+
+    reads = _DeviceReads(modbus_hardware, registers, slave_id, logger, breaker, deadline, decoder)
+    async with AsyncModbusClientPool().connection(modbus_hardware) as pooled:
+        # A pipelined client matches late responses by transaction id, other clients are reset to drop them
+        pipelined = isinstance(pooled.client, PipelinedModbusTcpClient)
+        while batch := _next_batch(reads, pooled.client.window if pipelined else 1):
+            responses = await asyncio.gather(*(_async_read_block(pooled.client, block, reads.block_slave_id(block),
+                                                                 modbus_hardware, logger) for block in batch))
+            abandon = False
+            for block, (raw_values, responded, exception_code) in zip(batch, responses):
+                if raw_values is None and not responded and not pipelined:
+                    pooled.reset()
+                if not reads.record(block, raw_values, responded, exception_code):
+                    abandon = True
+                    break
+            if abandon:
+                break
+    return reads.output()
+
 
+def _next_batch(reads: _DeviceReads, size: int) -> List[ReadBlock]:
+    batch = []
+    while len(batch) < size and (block := reads.next_block()) is not None:
+        batch.append(block)
+    return batch
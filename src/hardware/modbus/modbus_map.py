@@ -1,8 +1,11 @@
-from typing import Optional, List, Union, Iterable, Dict
+from typing import Optional, List, Union, Iterable, Dict, Tuple, NamedTuple, Sequence
 from enum import Enum
 from dataclasses import dataclass, field
+import hashlib
 import json
 
+import numpy as np
+
 
 class ModbusDatatype(Enum):
     UINT16 = "uint16"
@@ -32,7 +35,7 @@ class ModbusRegisterType(Enum):
     SCALING = 'scaling'
 
 
-@dataclass
+@dataclass(slots=True)
 class ModbusRegister:
     name: str
     address: int
@@ -48,10 +51,17 @@ class ModbusRegister:
     access: str = "RO"
     slave_id: Optional[int] = None
     type: Union[ModbusRegisterType, str] = ModbusRegisterType.HOLDING
+    # Report-by-exception: report when the value moves past the band or after max_silence seconds
+    deadband: Optional[float] = None
+    deadband_percent: Optional[float] = None
+    max_silence: Optional[float] = None
 
     def __post_init__(self):
         # Ensure the name has no spaces:
         self.name = self.name.replace(' ', '_')
+        if isinstance(self.address, str):
+            # Some maps give hex addresses ("0x0108")
+            self.address = int(self.address, 0)
         # Convert string to enum if string was provided
         if isinstance(self.data_type, str):
             try:
@@ -91,19 +101,52 @@ class ModbusRegister:
         return self.name == other.name and self.address == other.address
 
 
+def read_type(register: ModbusRegister) -> ModbusRegisterType:
+    """ Holding registers are read with FC03, everything else with FC04 """
+    if ModbusRegisterType(register.type) == ModbusRegisterType.HOLDING:
+        return ModbusRegisterType.HOLDING
+    return ModbusRegisterType.INPUT
+
+
+class RegisterIndex(NamedTuple):
+    """ Registers of one (slave id, read register type) sorted by address """
+    addresses: np.ndarray
+    registers: List[ModbusRegister]
+
+    def between(self, start: int, end: int) -> List[ModbusRegister]:
+        """ Registers starting in [start, end) """
+        lo, hi = np.searchsorted(self.addresses, [start, end])
+        return self.registers[lo:hi]
+
+
 @dataclass
 class ModbusMap:
     registers: Dict[str, ModbusRegister]
+    # Content hash of the map file, empty for maps built in code
+    version: str = field(default="", compare=False)
+    # Derived lookups, built on first use (see ModbusMapCache for sharing a map)
+    _resolved: Dict[Tuple[str, ...], List[ModbusRegister]] = field(default_factory=dict, init=False, repr=False,
+                                                                   compare=False)
+    _index: Optional[Dict[Tuple[Optional[int], ModbusRegisterType], RegisterIndex]] = field(
+        default=None, init=False, repr=False, compare=False)
 
 
     @classmethod
     def from_json(cls, json_file: str) -> 'ModbusMap':
-        with open(json_file, 'r') as f:
-            data = json.load(f)
-            return cls.from_dict(data)
+        with open(json_file, 'rb') as f:
+            content = f.read()
+        modbus_map = cls.from_dict(json.loads(content))
+        modbus_map.version = hashlib.sha1(content).hexdigest()
+        return modbus_map
 
     @classmethod
     def from_dict(cls, register_map: dict) -> 'ModbusMap':
+        """ {key: register}, {"registers": {key: register}} or {"registers": [register, ...]} keyed by name """
+        nested = register_map.get("registers")
+        if isinstance(nested, list):
+            return cls(registers={reg["name"]: ModbusRegister(**reg) for reg in nested})
+        if isinstance(nested, dict) and "address" not in nested:
+            register_map = nested
         registers = {name: ModbusRegister(**reg) for name, reg in register_map.items()}
         return cls(registers=registers)
 
@@ -120,12 +163,32 @@ class ModbusMap:
                 regs.append(reg)
         return regs
 
+    def resolve(self, register_names: Optional[Sequence[str]] = None) -> List[ModbusRegister]:
+        """ Registers of a name list (all when empty) in its order, looked up once per list """
+        key = tuple(register_names or ())
+        registers = self._resolved.get(key)
+        if registers is None:
+            registers = self._resolved[key] = list(self.registers.values()) if not key else self.get_registers(key)
+        return registers
+
     def register_iterator(self, register_names: Optional[List[str]] = None) -> Iterable[ModbusRegister]:
-        if not register_names:
-            for name, register in self.registers:
-                yield register
-        else:
-            for name in register_names:
-                reg = self.registers.get(name, None)
-                if reg:
-                    yield reg
+        return iter(self.resolve(register_names))
+
+    @property
+    def address_index(self) -> Dict[Tuple[Optional[int], ModbusRegisterType], RegisterIndex]:
+        """ Address sorted registers per (slave id, read register type), the groups the reads are planned in """
+        if self._index is None:
+            groups: Dict[Tuple[Optional[int], ModbusRegisterType], List[ModbusRegister]] = {}
+            for register in self.registers.values():
+                groups.setdefault((register.slave_id, read_type(register)), []).append(register)
+            index = {}
+            for key, registers in groups.items():
+                registers.sort(key=lambda r: int(r.address))
+                index[key] = RegisterIndex(np.array([int(r.address) for r in registers], dtype=np.int32), registers)
+            self._index = index
+        return self._index
+
+    def registers_between(self, start: int, end: int, register_type: ModbusRegisterType = ModbusRegisterType.HOLDING,
+                          slave_id: Optional[int] = None) -> List[ModbusRegister]:
+        index = self.address_index.get((slave_id, register_type))
+        return index.between(start, end) if index else []
@@ -0,0 +1,171 @@
+import asyncio
+import struct
+from typing import Dict, Optional, Set, Tuple
+
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.pdu.register_message import ReadHoldingRegistersResponse, ReadInputRegistersResponse
+
+from utils import LogManager
+
+MBAP_HEADER = struct.Struct(">HHHB")  # transaction id, protocol id, length, unit id
+READ_HOLDING_REGISTERS = 0x03
+READ_INPUT_REGISTERS = 0x04
+
+
+class PipelineBroken(ModbusIOException):
+    """ The gateway mishandled pipelined requests, the client fell back to one request at a time """
+
+
+class PipelinedModbusTcpClient:
+    """
+    Modbus TCP client keeping up to `window` read transactions in flight on one connection.
+    Responses are matched to their request by MBAP transaction id, so the gateway may answer out of order.
+
+    A gateway that misbehaves while pipelining (unknown transaction or unit ids, a request timing out while
+    others are in flight, closing the connection with requests in flight) is downgraded to
+    window=1 for the lifetime of the client and the affected requests are resent one at a time.
+
+    Offers the read_holding_registers / read_input_registers coroutines of the pymodbus async clients,
+    returning pymodbus responses.
+    """
+
+    def __init__(self, host: str, port: int, window: int = 4, timeout: float = 3.0):
+        self.logger = LogManager().get_logger("PipelinedModbusTcpClient")
+        self.host = host
+        self.port = int(port)
+        self.window = max(1, window)
+        self.timeout = timeout
+        self.downgraded = False
+        self.max_in_flight = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._pending: Dict[int, Tuple[int, int, asyncio.Future]] = {}  # tid: (unit, sequence, future)
+        self._abandoned: Set[int] = set()  # timed out, a late response is dropped
+        self._next_tid = 0
+        self._sent = 0
+        self._last_answered = 0
+        self._broken_at = 0  # last request sent before falling back
+        self._slots = asyncio.Condition()
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> bool:
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.logger.error(f"Unable to connect to {self.host}:{self.port}: {e}")
+                return False
+            self._abandoned.clear()
+            self._receiver = asyncio.create_task(self._receive(self._reader))
+            return True
+
+    def close(self):
+        self._disconnect(ConnectionException(f"Connection to {self.host}:{self.port} closed"))
+
+    def _disconnect(self, error: Exception):
+        for _, _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        if self._receiver is not None and self._receiver is not asyncio.current_task():
+            self._receiver.cancel()
+        self._receiver = None
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    def _misbehaved(self, reason: str):
+        if self.window > 1:
+            self.logger.warning(f"Gateway {self.host}:{self.port} does not support pipelining ({reason}), "
+                                f"falling back to one request at a time")
+            self.window = 1
+            self.downgraded = True
+            self._broken_at = self._sent
+            self._disconnect(PipelineBroken(reason))
+        else:
+            self._disconnect(ModbusIOException(reason))
+
+    async def _receive(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                tid, protocol, length, unit = MBAP_HEADER.unpack(await reader.readexactly(MBAP_HEADER.size))
+                if protocol != 0 or length < 2:
+                    self._misbehaved(f"invalid MBAP header, protocol {protocol} length {length}")
+                    return
+                pdu = await reader.readexactly(length - 1)
+                if tid in self._abandoned:
+                    self._abandoned.discard(tid)
+                    continue
+                pending = self._pending.pop(tid, None)
+                if pending is None or pending[0] != unit:
+                    self._misbehaved(f"unexpected response, transaction {tid} unit {unit}")
+                    return
+                _, sequence, future = pending
+                self._last_answered = max(self._last_answered, sequence)
+                if not future.done():
+                    future.set_result(pdu)
+        except (asyncio.IncompleteReadError, OSError) as e:
+            if len(self._pending) > 1:
+                self._misbehaved(f"connection lost with {len(self._pending)} requests in flight")
+            else:
+                self._disconnect(ConnectionException(f"Connection to {self.host}:{self.port} lost: {e}"))
+
+    async def _transact(self, unit: int, request: bytes) -> bytes:
+        async with self._slots:
+            await self._slots.wait_for(lambda: len(self._pending) < self.window)
+            if not self.connected and not await self.connect():
+                raise ConnectionException(f"Unable to connect to {self.host}:{self.port}")
+            self._next_tid = self._next_tid % 0xFFFF + 1
+            self._sent += 1
+            tid, sequence = self._next_tid, self._sent
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tid] = (unit, sequence, future)
+            self.max_in_flight = max(self.max_in_flight, len(self._pending))
+        try:
+            self._writer.write(MBAP_HEADER.pack(tid, 0, len(request) + 1, unit) + request)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            if self._pending.pop(tid, None) is not None:
+                self._abandoned.add(tid)
+            if self.window > 1 and (self._last_answered > sequence or self._pending):
+                # Dropped by the gateway while other requests were in flight
+                self._misbehaved(f"transaction {tid} dropped")
+            if sequence <= self._broken_at:
+                raise PipelineBroken(f"Transaction {tid} dropped by {self.host}:{self.port}")
+            raise ModbusIOException(f"No response from {self.host}:{self.port} unit {unit}, transaction {tid}")
+        finally:
+            self._pending.pop(tid, None)
+            async with self._slots:
+                self._slots.notify_all()
+
+    async def execute(self, unit: int, request: bytes) -> bytes:
+        """ Send a request PDU and return the response PDU, resent once if the pipeline broke under it """
+        try:
+            return await self._transact(unit, request)
+        except PipelineBroken:
+            return await self._transact(unit, request)
+
+    async def _read_registers(self, function_code: int, address: int, count: int, slave: int):
+        pdu = await self.execute(slave, struct.pack(">BHH", function_code, address, count))
+        if pdu[0] == function_code | 0x80 and len(pdu) >= 2:
+            return ExceptionResponse(function_code, pdu[1], slave=slave)
+        if pdu[0] != function_code or len(pdu) != 2 + 2 * count or pdu[1] != 2 * count:
+            raise ModbusIOException(f"Malformed response to function {function_code} from unit {slave}")
+        response = ReadHoldingRegistersResponse if function_code == READ_HOLDING_REGISTERS \
+            else ReadInputRegistersResponse
+        return response(dev_id=slave, registers=list(struct.unpack(f">{count}H", pdu[2:])))
+
+    async def read_holding_registers(self, address: int, count: int = 1, slave: int = 1):
+        return await self._read_registers(READ_HOLDING_REGISTERS, address, count, slave)
+
+    async def read_input_registers(self, address: int, count: int = 1, slave: int = 1):
+        return await self._read_registers(READ_INPUT_REGISTERS, address, count, slave)
@@ -0,0 +1,178 @@
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Tuple, Set
+
+from hardware.modbus.modbus_map import ModbusMap, ModbusRegister, ModbusRegisterType, read_type
+
+# Modbus limit of registers per read (FC03/FC04)
+MAX_READ_REGISTERS = 125
+
+
+@dataclass
+class ReadBlock:
+    """ One read transaction covering several registers of the same slave and register type """
+    slave_id: Optional[int]  # register level slave override, None for the device's slave id
+    register_type: ModbusRegisterType
+    start: int
+    count: int
+    registers: List[ModbusRegister] = field(default_factory=list)
+    # Set on the two halves of a refused block, see bisect_block
+    bisection: Optional['Bisection'] = field(default=None, repr=False, compare=False)
+
+    @property
+    def end(self) -> int:
+        return self.start + self.count
+
+    def slice(self, values: List[int], register: ModbusRegister) -> List[int]:
+        offset = int(register.address) - self.start
+        return values[offset:offset + max(1, register.range_size)]
+
+
+@dataclass
+class Bisection:
+    """ The two halves of a refused block: when both are read the join between them is what the device refuses """
+    slave_id: Optional[int]
+    register_type: ModbusRegisterType
+    lo: int  # end of the left half
+    hi: int  # start of the right half
+    read: int = 0
+    failed: bool = False
+
+
+# (slave id override, register type value, lo, hi) of a refused join, (slave id, register type value, address)
+Cut = Tuple[Optional[int], str, int, int]
+Unreadable = Tuple[Optional[int], str, int]
+
+
+# Refusals of a register read on its own before it is left out of the plans, and the seconds it stays out
+# before it is read again: some devices only refuse a register while busy or in some operating mode
+UNREADABLE_REFUSALS = 3
+UNREADABLE_REPROBE = 3600.0
+
+
+def unreadable_key(register: ModbusRegister) -> Unreadable:
+    return register.slave_id, read_type(register).value, int(register.address)
+
+
+@dataclass
+class BlockLayout:
+    """
+    What a device taught about reading its registers together: the joins it refuses (a block may not contain
+    registers on both sides of [lo, hi)) and the registers it refuses even on their own, with the time.time()
+    of their last refusal.  The refusals not yet making a register unreadable are only counted in memory.
+    """
+    cuts: Set[Cut] = field(default_factory=set)
+    unreadable: Dict[Unreadable, float] = field(default_factory=dict)
+    refusals: Dict[Unreadable, int] = field(default_factory=dict, compare=False)
+
+    def allows(self, slave_id: Optional[int], register_type: ModbusRegisterType, start: int, end: int) -> bool:
+        return not any(s == slave_id and t == register_type.value and start < lo and end > hi
+                       for s, t, lo, hi in self.cuts)
+
+    def is_unreadable(self, register: ModbusRegister, now: Optional[float] = None) -> bool:
+        refused = self.unreadable.get(unreadable_key(register))
+        return refused is not None and (time.time() if now is None else now) - refused < UNREADABLE_REPROBE
+
+    def refused(self, register: ModbusRegister, now: Optional[float] = None) -> bool:
+        """ Count a refusal of the register read on its own, :return: True when it is no longer read """
+        key = unreadable_key(register)
+        # A register read again after UNREADABLE_REPROBE goes back out on its first refusal
+        if key not in self.unreadable:
+            self.refusals[key] = self.refusals.get(key, 0) + 1
+            if self.refusals[key] < UNREADABLE_REFUSALS:
+                return False
+        self.refusals.pop(key, None)
+        self.unreadable[key] = time.time() if now is None else now
+        return True
+
+    def read(self, registers: List[ModbusRegister]) -> List[ModbusRegister]:
+        """ Forget the refusals of registers that were read, :return: the ones that were unreadable """
+        readable = []
+        for register in registers:
+            key = unreadable_key(register)
+            self.refusals.pop(key, None)
+            if self.unreadable.pop(key, None) is not None:
+                readable.append(register)
+        return readable
+
+    def to_dict(self) -> dict:
+        return {"cuts": sorted(self.cuts, key=str),
+                "unreadable": sorted(([*key, refused] for key, refused in self.unreadable.items()), key=str)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BlockLayout':
+        # Layouts saved without refusal times are read again right away
+        return cls({tuple(c) for c in data.get("cuts", [])},
+                   {tuple(u[:3]): u[3] if len(u) > 3 else 0.0 for u in data.get("unreadable", [])})
+
+
+# Registers to read per (slave id override, read register type)
+ReadGroups = Dict[Tuple[Optional[int], ModbusRegisterType], List[ModbusRegister]]
+
+
+def _indexed_groups(registers: List[ModbusRegister], modbus_map: ModbusMap) -> Optional[ReadGroups]:
+    """ The registers grouped and address sorted by the map's index, None when some are not the map's """
+    wanted = {id(register) for register in registers}
+    if len(wanted) != len(registers):
+        return None
+    groups = {}
+    for key, index in modbus_map.address_index.items():
+        group = [register for register in index.registers if id(register) in wanted]
+        if group:
+            groups[key] = group
+    return groups if sum(len(group) for group in groups.values()) == len(registers) else None
+
+
+def plan_reads(registers: List[ModbusRegister], max_gap: int = 0,
+               max_count: int = MAX_READ_REGISTERS, layout: Optional[BlockLayout] = None,
+               modbus_map: Optional[ModbusMap] = None) -> List[ReadBlock]:
+    """
+    Coalesce registers into block reads.  Registers are grouped by (slave id, register type) and sorted by
+    address, a register joins the current block when at most max_gap unused registers separate them and
+    the block stays within max_count registers.  A learned layout keeps the joins the device refused out
+    of the blocks and leaves out the registers it refuses altogether.  Registers of modbus_map come
+    grouped and sorted from its address index instead of being sorted on every cycle.
+    """
+    groups = _indexed_groups(registers, modbus_map) if modbus_map is not None else None
+    if groups is None:
+        groups: ReadGroups = {}
+        for register in registers:
+            groups.setdefault((register.slave_id, read_type(register)), []).append(register)
+        groups = {key: sorted(group, key=lambda r: int(r.address)) for key, group in groups.items()}
+
+    blocks: List[ReadBlock] = []
+    for (slave_id, register_type), group in groups.items():
+        block: Optional[ReadBlock] = None
+        for register in group:
+            if layout and layout.unreadable and layout.is_unreadable(register):
+                continue
+            address = int(register.address)
+            end = address + max(1, register.range_size)
+            if block and address - block.end <= max_gap and max(end, block.end) - block.start <= max_count \
+                    and (not layout or layout.allows(slave_id, register_type, block.start, max(end, block.end))):
+                block.count = max(end, block.end) - block.start
+                block.registers.append(register)
+            else:
+                block = ReadBlock(slave_id, register_type, address, end - address, [register])
+                blocks.append(block)
+    return blocks
+
+
+def split_block(block: ReadBlock) -> List[ReadBlock]:
+    """ One block per register, used when a coalesced read is refused by the device """
+    return [ReadBlock(block.slave_id, block.register_type, int(r.address), max(1, r.range_size), [r])
+            for r in block.registers]
+
+
+def bisect_block(block: ReadBlock) -> List[ReadBlock]:
+    """ The two halves of a block refused by the device, linked by their Bisection """
+    middle = len(block.registers) // 2
+    halves = []
+    for registers in (block.registers[:middle], block.registers[middle:]):
+        start = min(int(r.address) for r in registers)
+        end = max(int(r.address) + max(1, r.range_size) for r in registers)
+        halves.append(ReadBlock(block.slave_id, block.register_type, start, end - start, list(registers)))
+    left, right = halves
+    bisection = Bisection(block.slave_id, block.register_type, min(left.end, right.start), right.start)
+    left.bisection = right.bisection = bisection
+    return halves
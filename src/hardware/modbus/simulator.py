@@ -0,0 +1,323 @@
+"""
+Modbus device simulator serving our register maps over Modbus TCP or an RTU link on a pseudo terminal.
+
+    with ModbusSimulator.tcp(SimulatedBus.from_map("tristar", slave_ids=range(1, 9), latency=0.01)) as sim:
+        hardware = ModbusHardware(client_type=ModbusClientType.TCP, host=sim.host, port=sim.port, ...)
+
+The simulator runs its own event loop in a thread.  Every request on a SimulatedBus waits for the bus, like
+slaves sharing an RS-485 link or a TCP gateway, and takes latency plus the frame times at the bus baudrate.
+"""
+import asyncio
+import os
+import random
+import struct
+import threading
+import tty
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from pymodbus.framer.rtu import FramerRTU
+
+from hardware.modbus.map_cache import ModbusMapCache
+from hardware.modbus.modbus_map import ModbusMap, ModbusRegister, ModbusDatatype, ModbusRegisterType
+from utils import LogManager
+
+DATA_PATH = Path(__file__).parents[3] / "data"
+
+SIMULATED_MAPS = {
+    "esslix": DATA_PATH / "Esslix" / "esslix_modbus_map.json",
+    "tristar": DATA_PATH / "MorningStar" / "tristar_v11_modbus_map.json",
+    "sierra25": DATA_PATH / "Sierra25" / "sierra25_is_modbus_map.json",
+    "sierra25_gw": DATA_PATH / "Sierra25" / "sierra25_gw_modbus_map.json",
+    "renogy": DATA_PATH / "RenogyRover" / "modbus_map_v1.json",
+}
+
+# Engineering value ranges by unit, raw values are derived through the register's conversion factor
+UNIT_RANGES = {
+    "V": (11.5, 58.0), "Volts": (11.5, 58.0), "A": (-40.0, 40.0), "Amps": (-40.0, 40.0), "W": (0.0, 4000.0),
+    "VA": (0.0, 4500.0), "Wh": (0.0, 20000.0), "kWh": (0.0, 2000.0), "Ah": (50.0, 280.0), "%": (20.0, 100.0),
+    "°C": (15.0, 45.0), "Hz": (59.9, 60.1), "s": (0.0, 3600.0), "min": (0.0, 600.0), "h": (0.0, 10000.0),
+    "days": (0.0, 3650.0), "cycles": (0.0, 2000.0),
+}
+
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+READ_HOLDING_REGISTERS = 0x03
+READ_INPUT_REGISTERS = 0x04
+WRITE_SINGLE_REGISTER = 0x06
+WRITE_MULTIPLE_REGISTERS = 0x10
+
+
+def plausible_raw_values(register: ModbusRegister, rng: random.Random) -> List[int]:
+    """ Raw words for a register, within the usual range of its unit and the limits of its data type """
+    size = max(1, register.range_size)
+    data_type = register.data_type
+    if data_type == ModbusDatatype.ASCII16:
+        text = f"SIM{rng.randrange(10 ** 6):06d}".ljust(2 * size)[:2 * size].encode("latin-1")
+        return list(struct.unpack(f">{size}H", text))
+    if data_type == ModbusDatatype.ASCII8:
+        return [ord("S")] * size
+    if data_type in (ModbusDatatype.FLAG16, ModbusDatatype.BOOL, ModbusDatatype.ENUM):
+        return [0] * size
+    factor = register.conversion_factor if isinstance(register.conversion_factor, (int, float)) else 1
+    low, high = UNIT_RANGES.get(register.units, (0.0, 100.0))
+    limits = {ModbusDatatype.UINT16: (0, 0xFFFF), ModbusDatatype.INT16: (-0x8000, 0x7FFF),
+              ModbusDatatype.UINT8: (0, 0xFF), ModbusDatatype.INT8: (-0x80, 0x7F)}[data_type]
+    raw = int(round(rng.uniform(low, high) / factor)) if factor else 0
+    return [min(max(raw, limits[0]), limits[1]) & 0xFFFF] * size
+
+
+class SimulatedDevice:
+    """
+    Register contents of one slave, generated from a ModbusMap.  Values drift by up to `jitter` raw counts
+    on every read.  A strict device answers ILLEGAL DATA ADDRESS for addresses missing from its map, as
+    many devices do for the gaps of a block read.
+    """
+
+    def __init__(self, modbus_map: ModbusMap, seed: int = 0, strict: bool = False, jitter: int = 0):
+        self.strict = strict
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self.tables: Dict[str, Dict[int, int]] = {"holding": {}, "input": {}}
+        for register in modbus_map.registers.values():
+            table = self.tables["holding" if register.type == ModbusRegisterType.HOLDING else "input"]
+            for offset, value in enumerate(plausible_raw_values(register, self._rng)):
+                table[int(register.address) + offset] = value
+        self._drifting = {address for table in self.tables.values() for address in table}
+        self._ascii = {int(r.address) + i for r in modbus_map.registers.values()
+                       if r.data_type in (ModbusDatatype.ASCII16, ModbusDatatype.ASCII8, ModbusDatatype.FLAG16,
+                                          ModbusDatatype.BOOL, ModbusDatatype.ENUM)
+                       for i in range(max(1, r.range_size))}
+
+    def read(self, table: str, address: int, count: int) -> Optional[List[int]]:
+        """ :return: the registers, None for an illegal address """
+        registers = self.tables[table]
+        if self.strict and any(a not in registers for a in range(address, address + count)):
+            return None
+        values = [registers.get(a, 0) for a in range(address, address + count)]
+        if self.jitter:
+            for i, a in enumerate(range(address, address + count)):
+                if a in registers and a not in self._ascii:
+                    values[i] = registers[a] = (registers[a] + self._rng.randint(-self.jitter, self.jitter)) & 0xFFFF
+        return values
+
+    def write(self, address: int, values: List[int]) -> bool:
+        registers = self.tables["holding"]
+        if self.strict and any(a not in registers for a in range(address, address + len(values))):
+            return False
+        for offset, value in enumerate(values):
+            registers[address + offset] = value & 0xFFFF
+        return True
+
+
+@dataclass
+class SimulatedBus:
+    """
+    Slaves behind one link.  Requests are served one at a time, each taking `latency` plus the time of the
+    request and response frames at `baudrate` (None for a native TCP device without serial side).
+    """
+    devices: Dict[int, SimulatedDevice]
+    latency: float = 0.0
+    baudrate: Optional[int] = None
+    bits_per_byte: int = 10  # start + 8 data + stop
+    requests: int = 0
+    registers: int = 0
+    exceptions: int = 0
+    _lock: Optional[asyncio.Lock] = field(default=None, repr=False)
+
+    @classmethod
+    def from_map(cls, modbus_map: Union[str, Path], slave_ids: Iterable[int] = (1,), strict: bool = False,
+                 jitter: int = 0, **timing) -> 'SimulatedBus':
+        """ Bus of slaves serving a map file, or one of SIMULATED_MAPS by name """
+        path = SIMULATED_MAPS.get(str(modbus_map), modbus_map)
+        loaded = ModbusMapCache().load(str(path))
+        return cls({slave_id: SimulatedDevice(loaded, seed=slave_id, strict=strict, jitter=jitter)
+                    for slave_id in slave_ids}, **timing)
+
+    def transaction_time(self, request_bytes: int, response_bytes: int) -> float:
+        wire = (request_bytes + response_bytes) * self.bits_per_byte / self.baudrate if self.baudrate else 0.0
+        return self.latency + wire
+
+    async def handle(self, slave_id: int, pdu: bytes) -> Optional[bytes]:
+        """ :return: the response PDU, None when no slave answers """
+        device = self.devices.get(slave_id)
+        if device is None:
+            return None
+        response = self._respond(device, pdu)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self.requests += 1
+            # RTU framing: slave id + PDU + CRC
+            delay = self.transaction_time(len(pdu) + 3, len(response) + 3)
+            if delay:
+                await asyncio.sleep(delay)
+        return response
+
+    def _respond(self, device: SimulatedDevice, pdu: bytes) -> bytes:
+        function_code = pdu[0]
+        try:
+            if function_code in (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS):
+                address, count = struct.unpack(">HH", pdu[1:5])
+                table = "holding" if function_code == READ_HOLDING_REGISTERS else "input"
+                values = device.read(table, address, count) if 1 <= count <= 125 else None
+                if values is None:
+                    return self._exception(function_code, ILLEGAL_DATA_ADDRESS)
+                self.registers += count
+                return struct.pack(f">BB{count}H", function_code, 2 * count, *values)
+            if function_code == WRITE_SINGLE_REGISTER:
+                address, value = struct.unpack(">HH", pdu[1:5])
+                if not device.write(address, [value]):
+                    return self._exception(function_code, ILLEGAL_DATA_ADDRESS)
+                return pdu[:5]
+            if function_code == WRITE_MULTIPLE_REGISTERS:
+                address, count, _ = struct.unpack(">HHB", pdu[1:6])
+                values = list(struct.unpack(f">{count}H", pdu[6:6 + 2 * count]))
+                if not device.write(address, values):
+                    return self._exception(function_code, ILLEGAL_DATA_ADDRESS)
+                self.registers += count
+                return pdu[:5]
+        except struct.error:
+            pass
+        return self._exception(function_code, ILLEGAL_FUNCTION)
+
+    def _exception(self, function_code: int, code: int) -> bytes:
+        self.exceptions += 1
+        return bytes([function_code | 0x80, code])
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "registers": self.registers, "exceptions": self.exceptions}
+
+
+class ModbusSimulator:
+    """ Serves a SimulatedBus over Modbus TCP (host, port) or an RTU pseudo terminal (port) from a thread """
+
+    def __init__(self, bus: SimulatedBus, transport: str = "tcp", host: str = "127.0.0.1", port: int = 0):
+        self.logger = LogManager().get_logger("ModbusSimulator")
+        self.bus = bus
+        self.transport = transport
+        self.host = host
+        self.port: Union[int, str] = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._pty: Optional[Tuple[int, int]] = None
+        self._started = threading.Event()
+
+    @classmethod
+    def tcp(cls, bus: SimulatedBus, host: str = "127.0.0.1", port: int = 0) -> 'ModbusSimulator':
+        return cls(bus, "tcp", host, port)
+
+    @classmethod
+    def rtu(cls, bus: SimulatedBus) -> 'ModbusSimulator':
+        return cls(bus, "rtu")
+
+    def __enter__(self) -> 'ModbusSimulator':
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def start(self) -> 'ModbusSimulator':
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=f"modbus-sim-{self.transport}", daemon=True)
+        self._thread.start()
+        if not self._started.wait(5.0):
+            raise RuntimeError("Modbus simulator failed to start")
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(5.0)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5.0)
+        if self._pty is not None:
+            for fd in self._pty:
+                os.close(fd)
+            self._pty = None
+        self._loop.close()
+        self._loop = None
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        if self.transport == "tcp":
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._serve_tcp, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+        else:
+            master, slave = os.openpty()
+            tty.setraw(master)
+            tty.setraw(slave)
+            self._pty = (master, slave)
+            self.port = os.ttyname(slave)
+            os.set_blocking(master, False)
+            self._loop.add_reader(master, self._on_rtu_data, master, bytearray())
+        self.logger.info(f"Modbus {self.transport.upper()} simulator of {len(self.bus.devices)} slaves on "
+                         f"{self.host + ':' if self.transport == 'tcp' else ''}{self.port}")
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _shutdown(self):
+        if self._server is not None:
+            self._server.close()
+        if self._pty is not None:
+            self._loop.remove_reader(self._pty[0])
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _serve_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Requests on one connection are answered concurrently (pipelining), the bus serializes them
+        tasks = set()
+        try:
+            while True:
+                tid, protocol, length, unit = struct.unpack(">HHHB", await reader.readexactly(7))
+                pdu = await reader.readexactly(length - 1)
+                task = asyncio.ensure_future(self._answer_tcp(writer, tid, unit, pdu))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _answer_tcp(self, writer: asyncio.StreamWriter, tid: int, unit: int, pdu: bytes):
+        response = await self.bus.handle(unit, pdu)
+        if response is not None and not writer.is_closing():
+            writer.write(struct.pack(">HHHB", tid, 0, len(response) + 1, unit) + response)
+
+    def _on_rtu_data(self, fd: int, buffer: bytearray):
+        try:
+            buffer.extend(os.read(fd, 4096))
+        except BlockingIOError:
+            return
+        while len(buffer) >= 8:
+            size = _rtu_request_size(buffer)
+            if size is None or len(buffer) < size:
+                if size is None:
+                    buffer.clear()
+                return
+            frame, buffer[:] = bytes(buffer[:size]), buffer[size:]
+            if FramerRTU.compute_CRC(frame[:-2]) != struct.unpack(">H", frame[-2:])[0]:
+                self.logger.warning(f"Dropping RTU frame with a bad CRC: {frame.hex()}")
+                continue
+            asyncio.ensure_future(self._answer_rtu(fd, frame[0], frame[1:-2]))
+
+    async def _answer_rtu(self, fd: int, slave_id: int, pdu: bytes):
+        response = await self.bus.handle(slave_id, pdu)
+        if response is not None:
+            frame = bytes([slave_id]) + response
+            os.write(fd, frame + struct.pack(">H", FramerRTU.compute_CRC(frame)))
+
+
+def _rtu_request_size(buffer: bytearray) -> Optional[int]:
+    function_code = buffer[1]
+    if function_code in (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS, WRITE_SINGLE_REGISTER):
+        return 8
+    if function_code == WRITE_MULTIPLE_REGISTERS:
+        return 9 + buffer[6]
+    return None
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Any
+
+from utils.singleton import Singleton
+
+# Upper bounds of the latency buckets in ms, the last bucket counts everything slower
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+FUNCTION_NAMES = {3: "read_holding", 4: "read_input", 6: "write_register", 16: "write_registers"}
+
+
+class TransactionKey(NamedTuple):
+    resource: str  # ModbusHardware.get_resource_key(), e.g. "tcp:10.0.0.5:502" or "serial:/dev/ttyS1"
+    slave_id: int
+    function: int
+    start: int
+    count: int
+
+    @property
+    def label(self) -> str:
+        return f"{self.slave_id}/fc{self.function}/{self.start}+{self.count}"
+
+
+class LatencyHistogram:
+    """ Fixed size latency histogram, percentiles are estimated as the upper bound of their bucket """
+    __slots__ = ("counts", "total", "sum_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(LATENCY_BUCKETS_MS[bucket], self.max_ms) if bucket < len(LATENCY_BUCKETS_MS) \
+                    else self.max_ms
+        return self.max_ms
+
+    @property
+    def mean_ms(self) -> float:
+        return self.sum_ms / self.total if self.total else 0.0
+
+
+class TransactionStats:
+    """ Outcome counters and response latency of one (resource, slave, function, block) """
+    __slots__ = ("latency", "requests", "timeouts", "retries", "exceptions")
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.timeouts = 0  # no response: timeout, connection or framing error
+        self.retries = 0   # re-read register by register after the block failed
+        self.exceptions: Dict[int, int] = {}  # Modbus exception code: count
+
+    def summary(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "timeouts": self.timeouts, "retries": self.retries,
+                "exceptions": sum(self.exceptions.values()),
+                "mean_ms": round(self.latency.mean_ms, 3), "p50_ms": self.latency.percentile(0.5),
+                "p95_ms": self.latency.percentile(0.95), "max_ms": round(self.latency.max_ms, 3)}
+
+
+class ModbusTransactionStats(metaclass=Singleton):
+    """
+    Process wide latency tracing of Modbus transactions.  Every read is recorded twice: in the totals since
+    start (queried by the UI) and in the current window, taken by the controller for its periodic
+    telemetry measurement.  At most max_keys blocks are tracked, later ones are counted as dropped.
+    """
+
+    def __init__(self, max_keys: int = 1024):
+        self.enabled = True
+        self.max_keys = max_keys
+        self.dropped = 0
+        self._totals: Dict[TransactionKey, TransactionStats] = {}
+        self._window: Dict[TransactionKey, TransactionStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, table: Dict[TransactionKey, TransactionStats], key: TransactionKey) \
+            -> Optional[TransactionStats]:
+        stats = table.get(key)
+        if stats is None:
+            if len(table) >= self.max_keys:
+                return None
+            stats = table[key] = TransactionStats()
+        return stats
+
+    def record(self, key: TransactionKey, elapsed_s: float, responded: bool, exception_code: Optional[int] = None):
+        if not self.enabled:
+            return
+        ms = elapsed_s * 1000.0
+        with self._lock:
+            for table in (self._totals, self._window):
+                stats = self._stats(table, key)
+                if stats is None:
+                    self.dropped += 1
+                    continue
+                stats.requests += 1
+                if not responded:
+                    stats.timeouts += 1
+                    continue
+                stats.latency.add(ms)
+                if exception_code is not None:
+                    stats.exceptions[exception_code] = stats.exceptions.get(exception_code, 0) + 1
+
+    def record_retry(self, key: TransactionKey):
+        if not self.enabled:
+            return
+        with self._lock:
+            for table in (self._totals, self._window):
+                stats = self._stats(table, key)
+                if stats is not None:
+                    stats.retries += 1
+
+    def take_window(self) -> Dict[TransactionKey, TransactionStats]:
+        """ The stats recorded since the previous call """
+        with self._lock:
+            window, self._window = self._window, {}
+        return window
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+            self._window.clear()
+            self.dropped = 0
+
+    def summary(self, resource: Optional[str] = None, slave_id: Optional[int] = None, top: Optional[int] = None,
+                sort: str = "p95_ms") -> List[Dict[str, Any]]:
+        """ Totals per block, slowest first """
+        with self._lock:
+            rows = [summary_row(key, stats) for key, stats in self._totals.items()
+                    if (resource is None or key.resource == resource)
+                    and (slave_id is None or key.slave_id == slave_id)]
+        rows.sort(key=lambda row: row.get(sort, 0), reverse=True)
+        return rows[:top] if top else rows
+
+    def save(self, path: str):
+        """ Write the totals for the processes without access to this one (the UI) """
+        snapshot = {"blocks": self.summary(), "dropped": self.dropped}
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+
+def summary_row(key: TransactionKey, stats: TransactionStats) -> Dict[str, Any]:
+    row = {"resource": key.resource, "slave_id": key.slave_id,
+           "function": FUNCTION_NAMES.get(key.function, key.function), "start": key.start, "count": key.count}
+    row.update(stats.summary())
+    row["exception_codes"] = {f"{code:02d}": count for code, count in sorted(stats.exceptions.items())}
+    return row
+
+
+def telemetry_measurement(window: Dict[TransactionKey, TransactionStats], top: int = 20) \
+        -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    {resource: {block label: fields}} of the blocks with the most time spent on the bus (plus those that
+    timed out), in the {hardware: {device: fields}} layout of the telemetry measurements
+    """
+    ranked = sorted(window.items(), key=lambda item: (item[1].timeouts, item[1].latency.sum_ms), reverse=True)
+    measurement: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for key, stats in ranked[:top]:
+        measurement.setdefault(key.resource, {})[key.label] = stats.summary()
+    return measurement
+
+
+def load_summary(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
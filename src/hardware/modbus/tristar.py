@@ -1,12 +1,47 @@
-from dataclasses import dataclass
-from typing import List, Dict
+import time
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Callable, Generator, NamedTuple
 
-from .modbus_hardware import ModbusHardware, ModbusClientType, modbus_data_acquisition
+from .block_decoder import BlockDecoder, decoder_key, decoder_for
+from .client_pool import ModbusClientPool, AsyncModbusClientPool
+from .modbus_hardware import ModbusHardware, ModbusClientType, modbus_data_acquisition, async_modbus_data_acquisition
+from .modbus_map import ModbusRegister
+from .read_planner import ReadBlock
+from hardware.device_health import CircuitBreaker
 from utils import LogManager
 
 
+@dataclass
+class TristarScaling:
+    """ Voltage and current scaling of one Tristar and the block decoders with the scaling folded in """
+    v_pu: float
+    i_pu: float
+    fetched_at: float  # time.monotonic()
+    connects: Dict[str, int]  # pool connection count per acquisition path when read
+    scales: Dict[str, float]
+    decoders: Dict[tuple, BlockDecoder] = field(default_factory=dict)
+
+    def decoder(self, block: ReadBlock) -> BlockDecoder:
+        key = decoder_key(block)
+        decoder = self.decoders.get(key)
+        if decoder is None:
+            decoder = self.decoders[key] = BlockDecoder(block, self.scales)
+        return decoder
+
+
+class _TristarRead(NamedTuple):
+    """ One read of a Tristar acquisition, made by the sync or the async path """
+    registers: List[ModbusRegister]
+    slave_id: int
+    breaker: CircuitBreaker
+    decoder: Callable[[ReadBlock], BlockDecoder]
+
+
 @dataclass
 class Tristar(ModbusHardware):
+    # The scaling registers are constant for a controller, they are re-read after scaling_ttl seconds,
+    # after a reconnect and after a failed read
+    scaling_ttl: float = 3600.0
 
     SCALING_REGISTERS = ["V_PU_hi", "V_PU_lo", "I_PU_hi", "I_PU_lo"]
     TWO_NEG_15 = 0.000030518
@@ -21,26 +56,90 @@ class Tristar(ModbusHardware):
         output = {d["mac"]: "ID is NA" for d in devices}
         return output
 
-    def data_acquisition(self, devices: list, scan_group_registers: List[str], _):
+    @property
+    def _scalings(self) -> Dict[str, TristarScaling]:
+        return self.__dict__.setdefault("_device_scalings", {})
 
-        # First let's get the scaling registers
-        self.logger.info("IN TRISTAR")
-        scaling_registers = [r for r in self.modbus_map.register_iterator(self.SCALING_REGISTERS)]
-        registers = [r for r in self.modbus_map.register_iterator(scan_group_registers)]
+    def _cached_scaling(self, mac: str, path: str, connects: int) -> Optional[TristarScaling]:
+        scaling = self._scalings.get(mac)
+        if scaling is None:
+            return None
+        if time.monotonic() - scaling.fetched_at > self.scaling_ttl:
+            self.logger.info(f"Scaling of Tristar {mac} expired, re-reading")
+            return None
+        if scaling.connects.setdefault(path, connects) != connects:
+            self.logger.info(f"Tristar {mac} reconnected, re-reading its scaling")
+            return None
+        return scaling
+
+    def _new_scaling(self, mac: str, values: Dict[str, float], path: str, connects: int) -> Optional[TristarScaling]:
+        try:
+            # TODO: Register name issue to be resolved
+            v_pu = values["Voltage_Scaling_High"] + (values["Voltage_Scaling_Low"] * self.TWO_NEG_16)
+            i_pu = values["Current_Scaling_High"] + (values["Current_Scaling_Low"] * self.TWO_NEG_16)
+        except KeyError:
+            self._scalings.pop(mac, None)
+            self.logger.warning(f"Unable to read the scaling registers of Tristar {mac}, got: {list(values)}")
+            return None
+        multipliers = {"voltage_scaling": v_pu * self.TWO_NEG_15, "current_scaling": i_pu * self.TWO_NEG_15}
+        scales = {register.name: multipliers[register.conversion_function]
+                  for register in self.modbus_map.registers.values()
+                  if register.conversion_function in multipliers}
+        scaling = self._scalings[mac] = TristarScaling(v_pu, i_pu, time.monotonic(), {path: connects}, scales)
+        return scaling
+
+    def _check_read(self, mac: str, values: Dict[str, float], breaker: CircuitBreaker):
+        if not values or breaker.consecutive_failures:
+            # The controller may have restarted with other settings
+            self._scalings.pop(mac, None)
+
+    def _acquisition_steps(self, devices: list, scan_group_registers: List[str], path: str,
+                           pool) -> Generator['_TristarRead', Dict[str, float], Dict[str, dict]]:
+        """
+        The acquisition shared by the sync and async paths: yields the reads to make, is sent their values
+        and returns the output per device.  :param path: the pool connection count key of the path
+        """
+        scaling_registers = self.modbus_map.resolve(self.SCALING_REGISTERS)
+        registers = self.modbus_map.resolve(scan_group_registers)
         output = {}
         for device in devices:
             slave_id = device['slave_id']
             mac = device['mac']
-            scaling_values = modbus_data_acquisition(self, scaling_registers, slave_id)
-            output[mac] = modbus_data_acquisition(self, registers, slave_id)
-            for register_name, pre_scaled_value in output[mac].items():
-                scale_function = self.modbus_map.get_register_by_name(register_name).conversion_function
-                if scale_function == "voltage_scaling":
-                    # TODO: Register name issue to be resolved
-                    v_pu = scaling_values["Voltage_Scaling_High"] + (scaling_values["Voltage_Scaling_Low"] * self.TWO_NEG_16)
-                    output[mac][register_name] = pre_scaled_value * v_pu * self.TWO_NEG_15
-                elif scale_function == "current_scaling":
-                    i_pu = scaling_values["Current_Scaling_High"] + (scaling_values["Current_Scaling_Low"] * self.TWO_NEG_16)
-                    output[mac][register_name] = pre_scaled_value * i_pu * self.TWO_NEG_15
-
+            breaker = self.get_breaker(mac)
+            if not breaker.allow_request():
+                self.logger.info(f"Skipping Tristar {slave_id} ({mac}), unresponsive")
+                output[mac] = {}
+                continue
+            scaling = self._cached_scaling(mac, path, pool.connects(self))
+            if scaling is None:
+                scaling_values = yield _TristarRead(scaling_registers, slave_id, breaker, decoder_for)
+                scaling = self._new_scaling(mac, scaling_values, path, pool.connects(self))
+            if scaling is None:
+                output[mac] = {}
+                continue
+            output[mac] = yield _TristarRead(registers, slave_id, breaker, scaling.decoder)
+            self._check_read(mac, output[mac], breaker)
         return output
+
+    def data_acquisition(self, devices: list, scan_group_registers: List[str], _):
+        self._warn_unused_window()
+        steps = self._acquisition_steps(devices, scan_group_registers, "sync", ModbusClientPool())
+        try:
+            read = next(steps)
+            while True:
+                read = steps.send(modbus_data_acquisition(self, read.registers, read.slave_id, breaker=read.breaker,
+                                                          deadline=self.acquisition_deadline, decoder=read.decoder))
+        except StopIteration as done:
+            return done.value
+
+    async def async_data_acquisition(self, devices: list, scan_group_registers: List[str], _):
+        steps = self._acquisition_steps(devices, scan_group_registers, "async", AsyncModbusClientPool())
+        try:
+            read = next(steps)
+            while True:
+                read = steps.send(await async_modbus_data_acquisition(self, read.registers, read.slave_id,
+                                                                      breaker=read.breaker,
+                                                                      deadline=self.acquisition_deadline,
+                                                                      decoder=read.decoder))
+        except StopIteration as done:
+            return done.value
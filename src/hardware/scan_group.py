@@ -0,0 +1,178 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple, Callable
+
+from hardware.hardware_deployment import HardwareDeployment
+from hardware.acquisition_scheduler import AcquisitionScheduler, AcquisitionJob
+from utils import LogManager
+
+DATA_GROUP = "DATA"
+ALARM_GROUP = "ALARM"
+DIAGNOSTIC_GROUP = "DIAGNOSTIC"
+
+
+@dataclass(frozen=True)
+class ScanGroup:
+    """
+    A named set of registers/points with its own reporting period.
+    period: seconds covered by one reported (aggregated) frame
+    sampling: number of acquisitions spread over each period
+    averaging: aggregation method for the frame, defaults to the telemetry averaging method
+    """
+    name: str
+    registers: List[str]
+    period: Optional[float] = None
+    sampling: int = 1
+    averaging: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any]) -> 'ScanGroup':
+        period = data.get("period")
+        return cls(
+            name=name,
+            registers=data.get("registers", []),
+            period=float(period) if period else None,
+            sampling=max(1, int(data.get("sampling", 1))),
+            averaging=data.get("averaging")
+        )
+
+    @property
+    def sample_interval(self) -> float:
+        return self.period / self.sampling
+
+
+@dataclass
+class ScanSlot:
+    """ All deployments sharing a scan group name and timing are sampled together """
+    scan_group: str
+    period: float
+    sampling: int
+    averaging: Optional[str]
+    next_due: float
+    members: List[Tuple[str, HardwareDeployment]] = field(default_factory=list)
+    # Accumulates the samples of the current window: add(sample), result(), len()
+    window: Any = None
+
+    @property
+    def sample_interval(self) -> float:
+        return self.period / self.sampling
+
+
+@dataclass
+class ScanWindow:
+    """ A completed period of a scan group, window.result() returns the aggregated frame """
+    scan_group: str
+    averaging: Optional[str]
+    window: Any
+
+    def result(self) -> dict:
+        return self.window.result()
+
+
+class ScanGroupScheduler:
+    """
+    Interleaves scan groups running at independent periods (e.g. ALARM at 1s, DATA at 10s, DIAGNOSTIC
+    hourly).  Every scan group of a deployment with a period is scheduled, DATA always runs and defaults
+    to the telemetry interval/sampling.  Due groups are dispatched together through the
+    AcquisitionScheduler so reads on one bus never overlap.
+    """
+
+    def __init__(self, acquisition_scheduler: AcquisitionScheduler, default_period: float, default_sampling: int,
+                 window_factory: Callable[[Optional[str]], Any]):
+        """
+        :param window_factory: creates the sample accumulator of a window from the scan group averaging method
+        """
+        self.logger = LogManager().get_logger("ScanGroupScheduler")
+        self.acquisition_scheduler = acquisition_scheduler
+        self.window_factory = window_factory
+        self.default_period = default_period
+        self.default_sampling = max(1, default_sampling)
+        self.slots: Dict[Tuple[str, float, int, Optional[str]], ScanSlot] = {}
+        self.last_resource_timing: Dict[str, dict] = {}
+
+    def resolve_scan_group(self, deployment: HardwareDeployment, name: str) -> Optional[ScanGroup]:
+        """ Return the scan group with its timing, or None if it is not periodically scheduled """
+        scan_groups = deployment.scan_groups if isinstance(deployment.scan_groups, dict) else {}
+        definition = scan_groups.get(name)
+        if definition is None:
+            if name != DATA_GROUP:
+                return None
+            # DATA is always acquired, some hardware (e.g. CTs) reads its points without a register list
+            definition = {}
+        scan_group = ScanGroup.from_dict(name, definition)
+        if scan_group.period is None:
+            if name != DATA_GROUP:
+                return None
+            sampling = definition.get("sampling", self.default_sampling)
+            scan_group = ScanGroup(name, scan_group.registers, float(self.default_period),
+                                   max(1, int(sampling)), scan_group.averaging)
+        return scan_group
+
+    def update(self, system_deployments: Dict[str, Dict[str, HardwareDeployment]], now: Optional[float] = None):
+        """ Rebuild slot membership from the current deployments, keeping the timing of existing slots """
+        now = now or time.time()
+        members: Dict[Tuple[str, float, int, Optional[str]], List[Tuple[str, HardwareDeployment]]] = {}
+        for system, hardware_deployments in system_deployments.items():
+            for deployment in hardware_deployments.values():
+                names = list(deployment.scan_groups) if isinstance(deployment.scan_groups, dict) else []
+                if DATA_GROUP not in names:
+                    names.insert(0, DATA_GROUP)
+                for name in names:
+                    scan_group = self.resolve_scan_group(deployment, name)
+                    if scan_group:
+                        key = (name, scan_group.period, scan_group.sampling, scan_group.averaging)
+                        members.setdefault(key, []).append((system, deployment))
+
+        for key in [k for k in self.slots if k not in members]:
+            self.logger.info(f"Scan group {key[0]} @ {key[1]}s no longer scheduled")
+            del self.slots[key]
+        for key, slot_members in members.items():
+            slot = self.slots.get(key)
+            if slot is None:
+                name, period, sampling, averaging = key
+                self.logger.info(f"Scheduling scan group {name}: {sampling} samples every {period}s")
+                slot = ScanSlot(name, period, sampling, averaging, next_due=now,
+                                window=self.window_factory(averaging))
+                self.slots[key] = slot
+            slot.members = slot_members
+
+    def next_due(self) -> float:
+        if not self.slots:
+            return time.time() + self.default_period / self.default_sampling
+        return min(slot.next_due for slot in self.slots.values())
+
+    async def run_due(self, now: Optional[float] = None, on_result=None) -> List[ScanWindow]:
+        """
+        Acquire every scan group that is due and return the windows that completed with this sample.
+        """
+        now = now or time.time()
+        due = [slot for slot in self.slots.values() if slot.next_due <= now]
+        if not due:
+            return []
+
+        # A sample has to be read before the next one of its slot is due
+        started = time.monotonic()
+        jobs = [AcquisitionJob(system, deployment, slot.scan_group, started + slot.sample_interval)
+                for slot in due for system, deployment in slot.members]
+        results, self.last_resource_timing = await self.acquisition_scheduler.acquire_jobs(jobs, on_result)
+        by_job = {(job.system, job.deployment.hardware_id, job.scan_group): data for job, data in results}
+
+        completed = []
+        for slot in due:
+            sample = {}
+            for system, deployment in slot.members:
+                data = by_job.get((system, deployment.hardware_id, slot.scan_group))
+                if data is not None:
+                    sample.setdefault(system, {})[deployment.hardware_id] = data
+            slot.window.add(sample)
+            self.logger.info(f"Collected {slot.scan_group} sample {len(slot.window)}/{slot.sampling}")
+
+            # Drift free schedule, but don't try to catch up on missed samples
+            slot.next_due += slot.sample_interval
+            if slot.next_due < now:
+                slot.next_due = now + slot.sample_interval
+
+            if len(slot.window) >= slot.sampling:
+                completed.append(ScanWindow(slot.scan_group, slot.averaging, slot.window))
+                slot.window = self.window_factory(slot.averaging)
+        return completed
@@ -0,0 +1,29 @@
+import argparse
+import asyncio
+from hardware.modbus.bus_broker import BusBroker, DEFAULT_SOCKET_PATH
+from utils import LogManager, EnvVars
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Owns the Modbus buses and serves the other services over a '
+                                                 'Unix socket')
+    parser.add_argument('--socket', default=None,
+                        help=f"Socket path, BUS_BROKER_SOCKET or {DEFAULT_SOCKET_PATH} by default")
+    parser.add_argument('--cache-ttl', type=float, default=5.0,
+                        help="Longest time read registers are served from the cache")
+    parser.add_argument('--max-wait', type=float, default=5.0,
+                        help="Queue time after which a request is served whatever its priority")
+    parser.add_argument('--stats-interval', type=float, default=300.0,
+                        help="Seconds between the logged bus statistics")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logger = LogManager("bus-broker.log").get_logger("BusBroker")
+    socket_path = args.socket or EnvVars().bus_broker_socket or DEFAULT_SOCKET_PATH
+    broker = BusBroker(socket_path, cache_ttl=args.cache_ttl, max_wait=args.max_wait)
+    try:
+        asyncio.run(broker.serve_forever(args.stats_interval))
+    except KeyboardInterrupt:
+        logger.info("Bus broker stopped")
@@ -3,12 +3,13 @@ import asyncio
 from typing import Optional
 from database.db_utils import get_mqtt_config, get_telemetry_config, get_raptor_configuration
 from database.database_manager import DatabaseManager
-from utils import LogManager
+from utils import LogManager, EnvVars
 from config.mqtt_config import MQTTConfig
-from cloud.mqtt_comms import setup_mqtt_listener, upload_command_response
+from cloud.mqtt_comms import setup_mqtt_listener, upload_command_response, MqttPublisher
 from actions.action_factory import ActionFactory
 from actions.action_status import ActionStatus
 from utils import get_mac_address
+from hardware.modbus.bus_broker import BusBrokerSettings, PRIORITY_COMMAND
 
 
 class CmdController:
@@ -22,6 +23,10 @@ class CmdController:
         self.raptor_configuration = get_raptor_configuration(self.logger)
         self.telemetry_config = get_telemetry_config(self.logger)
         self.mqtt_task = None
+        # Commands go ahead of the acquisition and UI traffic on the shared buses
+        BusBrokerSettings().configure(EnvVars().bus_broker_socket, PRIORITY_COMMAND)
+        # The iot-controller publishes with the same MQTT configuration, each service has its own session
+        MqttPublisher().configure("cmd-controller")
 
 
 
@@ -121,6 +126,7 @@ class CmdController:
             monitor_task.cancel()
             if self.mqtt_task:
                 self.mqtt_task.cancel()
+            await MqttPublisher().close()
 
 
 
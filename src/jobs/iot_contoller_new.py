@@ -208,10 +208,8 @@ class IoTController:
 
             # Upload based on configured mode
             if self.telemetry_config.mode == MQTT_MODE:
-                success = await upload_telemetry_data_mqtt(self.mqtt_config, self.telemetry_config, self.logger)
-                if success:
-                    db.clear_telemetry_data()
-                return success
+                # Uploaded frames are deleted by the upload itself
+                return await upload_telemetry_data_mqtt(self.mqtt_config, self.telemetry_config, self.logger)
             elif self.telemetry_config.mode == REST_MODE:
                 self.logger.warning("REST mode NOT IMPLEMENTED")
                 return True
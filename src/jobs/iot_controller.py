@@ -2,23 +2,42 @@ import argparse
 import asyncio
 import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
 import csv
-import statistics
-from typing import Dict, Union, Optional, Any, List
+from typing import Dict, Union, Optional, Any, List, Tuple, Callable, Awaitable
 from database.db_utils import get_mqtt_config, get_telemetry_config, get_raptor_configuration
 from database.database_manager import DatabaseManager
 from utils import LogManager, EnvVars
-from hardware.hardware_deployment import instantiate_hardware_from_dict, HardwareDeployment
+from hardware.deployment_registry import DeploymentRegistry
+from hardware.acquisition_scheduler import AcquisitionScheduler
+from hardware.scan_group import ScanGroupScheduler, ScanWindow, DATA_GROUP
+from hardware.modbus.client_pool import ModbusClientPool, AsyncModbusClientPool
+from hardware.modbus.map_cache import ModbusMapCache
+from hardware.modbus.block_layouts import BlockLayouts, SQLiteBlockLayoutStore
+from hardware.modbus.bus_broker import BusBrokerSettings, PRIORITY_ACQUISITION
+from hardware.modbus.transaction_stats import ModbusTransactionStats, telemetry_measurement
 from config.mqtt_config import MQTTConfig, FORMAT_FLAT, FORMAT_HIER, FORMAT_LINE_PROTOCOL
 from config.telemetry_config import TelemetryConfig, MQTT_MODE, REST_MODE
-from cloud.mqtt_comms import upload_telemetry_data_mqtt
+from cloud.mqtt_comms import upload_telemetry_data_mqtt, upload_telemetry_batches, MqttPublisher
 from utils.system_status import collect_system_stats
+from telemetry.aggregation import ColumnarAggregator
+from telemetry.streaming_aggregation import create_window_aggregator
+from telemetry.pipeline import TelemetryPipeline, PipelineStage, TelemetryFrame, OverflowPolicy
+from telemetry.deadband import DeadbandFilter, DeadbandConfig
 if EnvVars().enable_simulators:
     from hardware.simulators.simulation_state import SimulationState
 
 
 SUPPORTED_SYSTEMS = ["PV", "Meter", "BMS", "Converters", "IoT", "Charge Controller", "Generation"]
+# Measurement name of the per device communication health lines sent with every DATA frame
+DEVICE_HEALTH_MEASUREMENT = "DeviceHealth"
+# Measurement name of the periodic Modbus transaction latency lines, one per slow block
+MODBUS_STATS_MEASUREMENT = "ModbusLatency"
+# Measurement name of the size and age of the telemetry waiting for upload, sent while there is a backlog
+TELEMETRY_BACKLOG_MEASUREMENT = "TelemetryBacklog"
+# Seconds between the backlog compaction passes once nothing is left to roll up
+COMPACTION_INTERVAL = 60
 
 
 class IoTController:
@@ -35,10 +54,50 @@ class IoTController:
         self.mqtt_task = None
         self.system_measurements = {}
         self.simulator = simulator_mode
+        ModbusMapCache().cache_dir = EnvVars().modbus_map_cache_dir
+        BlockLayouts().store = SQLiteBlockLayoutStore(EnvVars().db_path)
+        BusBrokerSettings().configure(EnvVars().bus_broker_socket, PRIORITY_ACQUISITION)
+        # The cmd-controller publishes with the same MQTT configuration, each service has its own session
+        MqttPublisher().configure("iot-controller")
+        DatabaseManager(EnvVars().db_path).telemetry_queue.configure(self.telemetry_config.store_max_bytes,
+                                                                     self.telemetry_config.store_eviction)
+        self.deployment_registry = DeploymentRegistry(SUPPORTED_SYSTEMS, self.logger)
+        self.cycle_timing: Dict[str, Any] = {}
+        # Simulators share state in SUPPORTED_SYSTEMS order, so they are read by a single worker
+        acquisition_workers = 1 if simulator_mode else self.telemetry_config.acquisition_workers
+        self.acquisition_scheduler = AcquisitionScheduler(max_workers=acquisition_workers,
+                                                          use_async=self.telemetry_config.async_acquisition)
 
         # Parameters for distributed sampling
         self.sample_count = max(1, self.telemetry_config.sampling)  # Ensure at least 1 sample
         self.averaging_method = self.telemetry_config.averaging_method
+        self.aggregator = ColumnarAggregator(self.averaging_method)
+        self.scan_scheduler = ScanGroupScheduler(self.acquisition_scheduler, self.telemetry_config.interval,
+                                                 self.sample_count, self._create_window_aggregator)
+        self.scan_group_measurements: Dict[str, dict] = {}
+
+        # Report-by-exception, deadband configurations are cached per scan group until the hardware changes
+        self.deadband_filter = DeadbandFilter(self.telemetry_config.deadband_max_silence)
+        self._deadband_configs: Dict[str, Dict[str, DeadbandConfig]] = {}
+
+        # Modbus transaction latency is reported every modbus_stats_interval seconds
+        self.last_modbus_stats = time.time()
+
+        # Aggregation, storage and upload run in their own pipeline stages, decoupled from sampling
+        self.pipeline_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipeline")
+        self.pipeline = self._build_pipeline()
+
+        # Upload backoff state
+        self.last_upload_attempt = 0
+        self.upload_failure_count = 0
+        self.max_upload_backoff = 300  # 5 minutes max between upload attempts
+        # Live-first upload: frames stored after live_after go out with the next upload, older ones are
+        # the backlog, uploaded at backfill_rate by the backfill task while the link is up
+        self.live_after: Optional[int] = None
+        self.upload_lock = asyncio.Lock()
+        self.backfill_wakeup = asyncio.Event()
+        self.backfill_task: Optional[asyncio.Task] = None
+        self.compaction_task: Optional[asyncio.Task] = None
 
         self.logger.info(
             f"Initialized with {self.sample_count} samples per recording using {self.averaging_method} averaging (distributed throughout interval)")
@@ -51,122 +110,76 @@ class IoTController:
         This ensures all systems are measured at the same point in time.
         """
         db = DatabaseManager(EnvVars().db_path)
-        system_measurements = {}
-
-        # Setup all hardware objects first
-        system_deployments = {}
-        for system in SUPPORTED_SYSTEMS:
-            hardware_deployments = {}
-            for hardware in db.get_hardware_systems(system):
-                deployment = instantiate_hardware_from_dict(hardware, self.logger)
-                hardware_deployments[hardware["external_ref"]] = deployment
-            system_deployments[system] = hardware_deployments
-
-        # Now take measurements from all systems at once
+
+        # Hardware objects are built once and only rebuilt when their configuration changes
+        system_deployments = self.deployment_registry.refresh(db)
+        setup_stats = self.deployment_registry.last_refresh
+
+        # Now take measurements from all systems at once, one worker per physical bus
         self.logger.info("Taking synchronized sample across all systems")
+        return await self._timed_acquisition(
+            setup_stats, lambda on_result: self.acquisition_scheduler.acquire(system_deployments, "DATA", on_result))
+
+
+    async def _timed_acquisition(self, setup_stats: dict,
+                                 acquire: Callable[[Optional[Callable]], Awaitable[Tuple[Any, Dict[str, dict]]]]):
+        """
+        Run acquire(on_result), which returns (result, {resource_key: timing}), record the cycle timing
+        and return the result.  on_result collects the simulation state in simulator mode.
+        """
+        acquisition_start = time.perf_counter()
+        on_result = None
         if self.simulator:
             SimulationState().reset()
-        for system, hardware_deployments in system_deployments.items():
-            system_measurements[system] = {}
-            self.logger.info(f"Reading system:  {system}")
-            for hardware_id, deployment in hardware_deployments.items():
-                try:
-                    instance_data = deployment.data_acquisition()
-                    system_measurements[system][deployment.hardware_id] = instance_data
-                except Exception as e:
-                    self.logger.error(f"Unable to read from: {system}, continuing")
+            on_result = self._add_simulation_state
+        result, resource_timing = await acquire(on_result)
+
+        self.cycle_timing = {"setup_s": setup_stats.get("setup_s", 0.0),
+                             "acquisition_s": time.perf_counter() - acquisition_start,
+                             "deployments_built": setup_stats.get("built", 0),
+                             "deployments_reused": setup_stats.get("reused", 0),
+                             "resources": resource_timing}
+        self.logger.info(f"Sample timing: setup {self.cycle_timing['setup_s'] * 1000:.1f}ms "
+                         f"({self.cycle_timing['deployments_built']} built, "
+                         f"{self.cycle_timing['deployments_reused']} reused), "
+                         f"acquisition {self.cycle_timing['acquisition_s'] * 1000:.1f}ms")
+        for resource, timing in resource_timing.items():
+            self.logger.info(f"Resource {resource}: {timing['deployments']} deployments in "
+                             f"{timing['elapsed_s'] * 1000:.1f}ms, {timing['errors']} errors")
+        return result
 
-                if self.simulator:
-                    SimulationState().add_state(system, deployment.hardware_id, instance_data)
 
-        return system_measurements
+    @staticmethod
+    def _add_simulation_state(system: str, deployment, instance_data: dict):
+        SimulationState().add_state(system, deployment.hardware_id, instance_data)
 
 
 
-    def _average_synchronized_samples(self, samples: List[dict]) -> dict:
+    def _average_synchronized_samples(self, samples: List[dict], averaging_method: Optional[str] = None) -> dict:
         """
         Average multiple synchronized samples
 
         Args:
             samples: List of system measurements, each containing data for all systems
+            averaging_method: Overrides the telemetry averaging method (e.g. per scan group)
 
         Returns:
             A single dictionary with averaged values across all systems
         """
-        if not samples:
-            return {}
+        return self.aggregator.aggregate(samples, averaging_method)
 
-        # Create result structure
-        result = {}
-
-        # Get all systems from the first sample
-        for system in samples[0].keys():
-            result[system] = {}
-
-            # Get all hardware IDs for this system in the first sample
-            for hardware_id in samples[0][system].keys():
-                result[system][hardware_id] = {}
-
-                # Get all device IDs for this hardware in all samples
-                all_device_ids = set()
-                for sample in samples:
-                    if system in sample and hardware_id in sample[system]:
-                        all_device_ids.update(sample[system][hardware_id].keys())
-
-                # Process each device ID
-                for device_id in all_device_ids:
-                    # Group data for this device across all samples
-                    device_data_across_samples = []
-
-                    for sample in samples:
-                        if (system in sample and
-                                hardware_id in sample[system] and
-                                device_id in sample[system][hardware_id]):
-                            device_data_across_samples.append(sample[system][hardware_id][device_id])
-
-                    # If we have data for this device from at least one sample
-                    if device_data_across_samples:
-                        # Get all measurement keys
-                        all_keys = set()
-                        for device_data in device_data_across_samples:
-                            all_keys.update(device_data.keys())
-
-                        # Initialize device result
-                        device_result = {}
-
-                        # Process each measurement key
-                        for key in all_keys:
-                            values = []
-                            for device_data in device_data_across_samples:
-                                if key in device_data and isinstance(device_data[key], (int, float)):
-                                    values.append(device_data[key])
-
-                            # Calculate average if we have values
-                            if values:
-                                if self.averaging_method == "mean":
-                                    device_result[key] = statistics.mean(values)
-                                elif self.averaging_method == "median":
-                                    device_result[key] = statistics.median(values)
-                                elif self.averaging_method == "mode":
-                                    try:
-                                        device_result[key] = statistics.mode(values)
-                                    except statistics.StatisticsError:
-                                        # If no unique mode found, fall back to mean
-                                        device_result[key] = statistics.mean(values)
-                                else:
-                                    # Default to mean if unknown method
-                                    device_result[key] = statistics.mean(values)
-
-                        # Add device result to result
-                        result[system][hardware_id][device_id] = device_result
 
-        return result
+
+    def _create_window_aggregator(self, averaging_method: Optional[str] = None):
+        """ Streaming averaging methods keep constant memory, the others keep the window's samples """
+        return create_window_aggregator(averaging_method, self.aggregator)
 
 
 
-    def _format_telemetry_data(self, system_measurements: Dict[str, Any]) -> Dict[str, Any]:
-        """ Format system measurements data for telemetry """
-        timestamp = int(time.time() * 1000000000)
+    def _format_telemetry_data(self, system_measurements: Dict[str, Any],
+                               scan_group: str = DATA_GROUP, sampled_at: Optional[float] = None) -> Dict[str, Any]:
+        """ Format system measurements data for telemetry, non DATA scan groups are tagged by name """
+        timestamp = int((sampled_at or time.time()) * 1000000000)
         if True or self.mqtt_config.format == FORMAT_LINE_PROTOCOL:
             lines = []
             for system, system_data in system_measurements.items():
@@ -176,6 +189,8 @@ class IoTController:
                         if m_data:
                             tags = [f"raptor={self.raptor_configuration.raptor_id}", f"hardware_id={hardware}",
                                     f"device_id={device_id}"]
+                            if scan_group != DATA_GROUP:
+                                tags.append(f"scan_group={scan_group}")
                             fields = [f"{point}={value}" for point, value in m_data.items()]
                             tag_str = ','.join(tags)
                             field_str = ','.join(fields)
@@ -199,6 +214,22 @@ class IoTController:
         return False
 
 
+    async def _upload_frames(self, after_id: int, until_id: int,
+                             max_batches: Optional[int] = None) -> Tuple[bool, int]:
+        """ Upload the stored frames after after_id up to until_id.  :return: (success, payload bytes sent) """
+        if self.telemetry_config.mode == MQTT_MODE:
+            try:
+                return await upload_telemetry_batches(self.mqtt_config, self.telemetry_config, self.logger,
+                                                      after_id, until_id, max_batches)
+            except Exception as e:
+                self.logger.error(f"Error uploading telemetry data: {e}")
+                return False, 0
+        elif self.telemetry_config.mode == REST_MODE:
+            self.logger.warning("REST mode NOT IMPLEMENTED")
+            return True, 0
+        return False, 0
+
+
     @staticmethod
     def _store_local_telemetry_data(system: str, data: dict):
         """
@@ -230,117 +261,334 @@ class IoTController:
     async def shutdown(self):
         self.logger.warning("SHUTDOWN")
         self.running = False
+        self.acquisition_scheduler.shutdown()
+        await self.pipeline.stop()
+        self.pipeline_executor.shutdown(wait=False)
+        ModbusClientPool().close_all()
+        AsyncModbusClientPool().close_all()
         DatabaseManager().close()
 
 
 
-    async def main_loop(self):
+    async def _sample_due_scan_groups(self, now: float) -> List[ScanWindow]:
         """
-        Main execution loop with distributed sampling approach
+        Acquire every scan group that is due and return the scan group windows completed by this sample.
         """
-        self.logger.info(f"Starting up IoT Controller with distributed sampling.")
-        interval_seconds = self.telemetry_config.interval
+        db = DatabaseManager(EnvVars().db_path)
+        system_deployments = self.deployment_registry.refresh(db)
+        self.scan_scheduler.update(system_deployments, now)
+        setup_stats = self.deployment_registry.last_refresh
+        if setup_stats.get("built") or setup_stats.get("removed"):
+            self._deadband_configs.clear()
+
+        async def acquire(on_result):
+            completed = await self.scan_scheduler.run_due(now, on_result)
+            return completed, self.scan_scheduler.last_resource_timing
+
+        return await self._timed_acquisition(setup_stats, acquire)
+
+
+
+    def _build_pipeline(self) -> TelemetryPipeline:
+        """
+        acquire (main loop) -> aggregate -> deadband -> format -> persist -> upload, joined by bounded queues.
+        Sampling never waits on the pipeline: a full aggregate queue drops its oldest window.  Persist
+        pushes back on aggregate/format, and pending uploads are coalesced since each upload sends
+        everything stored so far.
+        """
+        queue_size = max(1, self.telemetry_config.pipeline_queue_size)
+        return TelemetryPipeline([
+            PipelineStage("aggregate", self._aggregate_stage, queue_size, OverflowPolicy.DROP_OLDEST,
+                          self.pipeline_executor, blocking=True),
+            PipelineStage("deadband", self._deadband_stage, queue_size, OverflowPolicy.BLOCK),
+            PipelineStage("format", self._format_stage, queue_size, OverflowPolicy.BLOCK),
+            PipelineStage("persist", self._persist_stage, queue_size, OverflowPolicy.BLOCK),
+            PipelineStage("upload", self._upload_stage, 1, OverflowPolicy.DROP_OLDEST),
+        ])
+
+
+
+    @staticmethod
+    def _aggregate_stage(frame: TelemetryFrame) -> TelemetryFrame:
+        frame.measurements = frame.window.result()
+        frame.window = None
+        return frame
+
+
+
+    def _deadband_configs_for(self, scan_group: str) -> Dict[str, DeadbandConfig]:
+        """ {hardware_id: DeadbandConfig} of the deployments with deadbands in this scan group """
+        configs = self._deadband_configs.get(scan_group)
+        if configs is None:
+            configs = {}
+            for hardware_deployments in self.deployment_registry.deployments().values():
+                for hardware_id, deployment in hardware_deployments.items():
+                    config = deployment.get_deadband_config(scan_group)
+                    if config:
+                        configs[hardware_id] = config
+            self._deadband_configs[scan_group] = configs
+        return configs
+
+
+
+    def _deadband_stage(self, frame: TelemetryFrame) -> TelemetryFrame:
+        """ Only report the points that moved past their deadband or whose heartbeat expired """
+        configs = self._deadband_configs_for(frame.scan_group)
+        if configs:
+            frame.reported = self.deadband_filter.filter(frame.scan_group, frame.measurements, configs,
+                                                         frame.completed_at)
+            stats = self.deadband_filter.last_stats
+            self.logger.info(f"Deadband {frame.scan_group}: {stats['suppressed']}/{stats['points']} points "
+                             f"suppressed, {stats['bytes_saved']} bytes saved "
+                             f"({self.deadband_filter.total_bytes_saved} total)")
+        return frame
+
+
+
+    def _format_stage(self, frame: TelemetryFrame) -> TelemetryFrame:
+        if frame.scan_group == DATA_GROUP:
+            self.system_measurements = frame.measurements
+        else:
+            self.scan_group_measurements[frame.scan_group] = frame.measurements
+        measurements = frame.measurements if frame.reported is None else frame.reported
+        if frame.device_health:
+            measurements = {**measurements, DEVICE_HEALTH_MEASUREMENT: frame.device_health}
+        if frame.modbus_stats:
+            measurements = {**measurements, MODBUS_STATS_MEASUREMENT: frame.modbus_stats}
+        if frame.telemetry_backlog:
+            measurements = {**measurements, TELEMETRY_BACKLOG_MEASUREMENT: frame.telemetry_backlog}
+        frame.telemetry_data = self._format_telemetry_data(measurements, frame.scan_group, frame.completed_at)
+        if frame.scan_group == DATA_GROUP:
+            self.telemetry_data = frame.telemetry_data
+        return frame
+
+
+
+    async def _persist_stage(self, frame: TelemetryFrame) -> Optional[TelemetryFrame]:
+        """
+        Store the frame in SQLite.  ALARM/DIAGNOSTIC frames go out with the next telemetry upload,
+        DATA frames are also recorded locally and trigger the upload.
+        """
+        # SQLite writes, CSV files and psutil sampling block, keep them off the event loop
+        loop = asyncio.get_running_loop()
+        has_data = bool(frame.telemetry_data.get("data"))
+        if has_data:
+            await loop.run_in_executor(self.pipeline_executor,
+                                       DatabaseManager(EnvVars().db_path).store_telemetry_data, frame.telemetry_data)
+        if frame.scan_group != DATA_GROUP:
+            return None
+
+        # The CSV files keep every point, including the ones suppressed by their deadband
+        await loop.run_in_executor(self.pipeline_executor, self._record_local, frame.measurements)
+        return frame if has_data else None
+
+
+
+    def _record_local(self, measurements: dict):
+        # Store locally if needed
+        if self.store_local:
+            for system, system_data in measurements.items():
+                for hardware_id, hardware_data in system_data.items():
+                    self._store_local_telemetry_data(system, hardware_data)
+
+        # Try to collect system stats
+        try:
+            self.logger.info(f"Collecting system status")
+            sbc_state = {0: collect_system_stats()}
+            self.logger.info(sbc_state)
+            self._store_local_telemetry_data("RAPTOR", sbc_state)
+        except Exception as e:
+            self.logger.error("Failed to perform system status acquisition", exc_info=True)
+
+        try:
+            ModbusTransactionStats().save(EnvVars().modbus_stats_path)
+        except OSError as e:
+            self.logger.warning(f"Unable to write the Modbus transaction stats: {e}")
+
+
+
+    async def _upload_stage(self, frame: TelemetryFrame) -> None:
+        """ Upload everything stored so far, with exponential backoff after failures """
+        current_time = time.time()
+
+        # Determine if we should attempt an upload based on backoff strategy
+        if self.upload_failure_count > 0:
+            time_since_last_upload = current_time - self.last_upload_attempt
+            backoff_time = min(2 ** self.upload_failure_count, self.max_upload_backoff)
+            if time_since_last_upload < backoff_time:
+                self.logger.info(
+                    f"Skipping upload attempt due to previous failures. Next attempt in {backoff_time - time_since_last_upload:.1f}s")
+                return None
+
+        self.last_upload_attempt = current_time
+        # Live path: the frames stored since the previous attempt go out now, ahead of any backlog.  The ones
+        # that fail join the backlog.  The upload deletes the frames it published.
+        until_id = DatabaseManager(EnvVars().db_path).telemetry_queue.last_id()
+        async with self.upload_lock:
+            upload_success, _ = await self._upload_frames(self.live_after or 0, until_id)
+        self.live_after = until_id
+        if upload_success:
+            self.backfill_wakeup.set()
+
+        if upload_success:
+            if self.upload_failure_count > 0:
+                self.logger.info(
+                    f"Upload succeeded after {self.upload_failure_count} failed attempts")
+                self.upload_failure_count = 0
+        else:
+            self.upload_failure_count += 1
+            backoff_time = min(2 ** self.upload_failure_count, self.max_upload_backoff)
+            if self.upload_failure_count < 10:
+                self.logger.warning(
+                    f"Failed to upload telemetry data. Will retry in {backoff_time}s")
+            elif self.upload_failure_count % 10 == 0:  # Log only periodically to reduce spam
+                self.logger.error(
+                    f"Still unable to upload telemetry data after {self.upload_failure_count} attempts. Next retry in {backoff_time}s")
+        return None
+
+
+
+    def _collect_device_health(self) -> Dict[str, Dict[str, Any]]:
+        """ Circuit breaker state of every device that tracks it, keyed by hardware then device """
+        health = {}
+        for hardware_deployments in self.deployment_registry.deployments().values():
+            for hardware_id, deployment in hardware_deployments.items():
+                device_health = deployment.device_health()
+                if device_health:
+                    health[hardware_id] = device_health
+        return health
+
+
+
+    def _collect_modbus_stats(self, now: float) -> Dict[str, Any]:
+        """ Latency of the Modbus transactions since the previous report, once per modbus_stats_interval """
+        interval = self.telemetry_config.modbus_stats_interval
+        if interval <= 0 or now - self.last_modbus_stats < interval:
+            return {}
+        self.last_modbus_stats = now
+        return telemetry_measurement(ModbusTransactionStats().take_window())
 
-        self.logger.info(
-            f"Using distributed sampling with {self.sample_count} samples over {interval_seconds}s intervals")
-        sample_interval = interval_seconds / self.sample_count
-        samples_collected = []
-        next_sample_time = time.time()
-        last_upload_attempt = 0
-        upload_failure_count = 0
-        max_upload_backoff = 300  # 5 minutes max between upload attempts
 
+
+    @staticmethod
+    def _collect_telemetry_backlog() -> Dict[str, Any]:
+        """ Size and age of the stored telemetry not uploaded yet, nothing without a backlog """
+        stats = DatabaseManager(EnvVars().db_path).telemetry_queue.stats()
+        return {"queue": {"0": stats}} if stats["frames"] else {}
+
+
+
+    async def _backfill_loop(self):
+        """
+        Upload the backlog (frames up to live_after) oldest first, one batch at a time, limited to
+        backfill_rate payload bytes per second.  Stops after a failure until a live upload succeeds.
+        """
+        rate = self.telemetry_config.backfill_rate
         while self.running:
-            current_time = time.time()
+            await self.backfill_wakeup.wait()
+            if self.upload_failure_count > 0:
+                self.backfill_wakeup.clear()
+                continue
+            async with self.upload_lock:
+                success, sent = await self._upload_frames(0, self.live_after, max_batches=1)
+            if not success or not sent:
+                # Link down or backlog drained
+                self.backfill_wakeup.clear()
+                continue
+            self.logger.info(f"Backfilled {sent} bytes, {DatabaseManager(EnvVars().db_path).telemetry_queue.frames} "
+                             f"frames stored")
+            await asyncio.sleep(sent / rate if rate > 0 else 0)
 
-            if current_time >= next_sample_time:
-                try:
-                    # Take a single synchronized sample of all systems
-                    sample_data = await self._take_synchronized_sample()
-                    samples_collected.append(sample_data)
-                    self.logger.info(f"Collected synchronized sample {len(samples_collected)}/{self.sample_count}")
+    async def _compaction_loop(self):
+        """
+        Roll the aged backlog up to the coarser resolutions of compaction_levels, a few periods at a time under
+        the upload lock, so an outage uploads as per-minute then per-quarter min/max/mean frames
+        """
+        queue = DatabaseManager(EnvVars().db_path).telemetry_queue
+        loop = asyncio.get_running_loop()
+        while self.running:
+            merged = 0
+            try:
+                for min_age, resolution in self.telemetry_config.compaction_levels:
+                    if not queue.frames:
+                        break
+                    async with self.upload_lock:
+                        merged += await loop.run_in_executor(self.pipeline_executor, queue.compact, resolution,
+                                                             min_age)
+            except Exception as e:
+                self.logger.error(f"Telemetry compaction failed: {str(e)}", exc_info=True)
+            if merged:
+                self.logger.info(f"Compacted {merged} stored frames, {queue.frames} frames stored")
+            await asyncio.sleep(1 if merged else COMPACTION_INTERVAL)
 
-                    # Calculate next sample time
-                    next_sample_time = next_sample_time + sample_interval
 
-                    # If we've collected all samples, process them and reset
-                    if len(samples_collected) >= self.sample_count:
-                        # Average the samples
-                        averaged_data = self._average_synchronized_samples(samples_collected)
 
-                        # Store and upload the averaged data
-                        self.system_measurements = averaged_data
-                        self.telemetry_data = self._format_telemetry_data(averaged_data)
+    def _log_pipeline_stats(self):
+        stats = self.pipeline.stats()
+        self.cycle_timing["pipeline"] = stats
+        self.logger.info("Pipeline: " + ", ".join(
+            f"{name} depth {stage['queue_depth']}/{stage['capacity']} last {stage['last_ms']:.1f}ms "
+            f"avg {stage['avg_ms']:.1f}ms dropped {stage['dropped']}" for name, stage in stats.items()))
 
-                        data = self.telemetry_data.get("data", [])
-                        if data:
-                            db = DatabaseManager(EnvVars().db_path)
-                            db.store_telemetry_data(self.telemetry_data)
 
-                            # Store locally if needed
-                            if self.store_local:
-                                for system, system_data in averaged_data.items():
-                                    for hardware_id, hardware_data in system_data.items():
-                                        self._store_local_telemetry_data(system, hardware_data)
 
-                            # Determine if we should attempt an upload based on backoff strategy
-                            should_attempt_upload = True
-                            if upload_failure_count > 0:
-                                time_since_last_upload = current_time - last_upload_attempt
-                                backoff_time = min(2 ** upload_failure_count, max_upload_backoff)
-                                should_attempt_upload = time_since_last_upload >= backoff_time
-
-                                if not should_attempt_upload:
-                                    self.logger.info(
-                                        f"Skipping upload attempt due to previous failures. Next attempt in {backoff_time - time_since_last_upload:.1f}s")
-
-                            # Upload to cloud if appropriate
-                            if should_attempt_upload:
-                                last_upload_attempt = current_time
-                                upload_success = await self._upload_telemetry_data()
-
-                                if upload_success:
-                                    if upload_failure_count > 0:
-                                        self.logger.info(
-                                            f"Upload succeeded after {upload_failure_count} failed attempts")
-                                        upload_failure_count = 0
-                                    db.clear_telemetry_data()
-                                else:
-                                    upload_failure_count += 1
-                                    backoff_time = min(2 ** upload_failure_count, max_upload_backoff)
-                                    if upload_failure_count < 10:
-                                        self.logger.warning(
-                                            f"Failed to upload telemetry data. Will retry in {backoff_time}s")
-                                    elif upload_failure_count % 10 == 0:  # Log only periodically to reduce spam
-                                        self.logger.error(
-                                            f"Still unable to upload telemetry data after {upload_failure_count} attempts. Next retry in {backoff_time}s")
+    async def main_loop(self):
+        """
+        Main execution loop: scan groups are sampled at their own periods, each completed scan group
+        window is aggregated and reported.  DATA windows drive the telemetry upload.
+        """
+        self.logger.info(f"Starting up IoT Controller with multi-rate scan group sampling.")
+        self.logger.info(
+            f"DATA default: {self.sample_count} samples over {self.telemetry_config.interval}s intervals")
+        self.pipeline.start()
+        # Everything stored before the start is backlog
+        self.live_after = DatabaseManager(EnvVars().db_path).telemetry_queue.last_id()
+        self.backfill_task = asyncio.create_task(self._backfill_loop())
+        self.backfill_wakeup.set()
+        self.compaction_task = asyncio.create_task(self._compaction_loop())
 
-                        # Try to collect system stats
-                        try:
-                            self.logger.info(f"Collecting system status")
-                            sbc_state = {0: collect_system_stats()}
-                            self.logger.info(sbc_state)
-                            self._store_local_telemetry_data("RAPTOR", sbc_state)
-                        except Exception as e:
-                            self.logger.error("Failed to perform system status acquisition", exc_info=True)
+        while self.running:
+            current_time = time.time()
+            next_due = self.scan_scheduler.next_due() if self.scan_scheduler.slots else current_time
 
-                        # Reset for next cycle
-                        samples_collected = []
-                        self.logger.info(f"Completed full sampling cycle, next cycle starts at {datetime.fromtimestamp(next_sample_time)}")
+            if current_time >= next_due:
+                try:
+                    completed = await self._sample_due_scan_groups(current_time)
+                    for window in completed:
+                        # Aggregation, storage and upload run in the pipeline, off the sampling path
+                        frame = TelemetryFrame(window.scan_group, current_time, window)
+                        if window.scan_group == DATA_GROUP:
+                            frame.device_health = self._collect_device_health()
+                            frame.modbus_stats = self._collect_modbus_stats(current_time)
+                            frame.telemetry_backlog = self._collect_telemetry_backlog()
+                        await self.pipeline.submit(frame)
+                        if window.scan_group == DATA_GROUP:
+                            self._log_pipeline_stats()
+                            self.logger.info(f"Completed full sampling cycle, next sample at "
+                                             f"{datetime.fromtimestamp(self.scan_scheduler.next_due())}")
+
+                    if not self.scan_scheduler.slots:
+                        self.logger.warning("No scan groups configured, waiting for hardware configuration")
+                        await asyncio.sleep(self.telemetry_config.interval)
 
                     # Small sleep to avoid tight loop
                     await asyncio.sleep(0.1)
 
                 except Exception as e:
-                    self.logger.critical(f"Critical error in distributed sampling: {str(e)}", exc_info=True)
-                    # Skip this sample but continue with the next one
-                    next_sample_time = current_time + sample_interval
+                    self.logger.critical(f"Critical error in scan group sampling: {str(e)}", exc_info=True)
                     await asyncio.sleep(1)  # Brief pause before continuing
             else:
                 # Sleep until close to the next sample time
-                sleep_time = min(next_sample_time - current_time, 1.0)  # Check at least every second
+                sleep_time = min(next_due - current_time, 1.0)  # Check at least every second
                 await asyncio.sleep(sleep_time)
 
+        await self.pipeline.drain()
+        await self.pipeline.stop()
+        self.backfill_task.cancel()
+        self.compaction_task.cancel()
+        await asyncio.gather(self.backfill_task, self.compaction_task, return_exceptions=True)
+        await MqttPublisher().close()
+
 
     async def main_loop_orig(self):
         """
@@ -390,9 +638,7 @@ class IoTController:
 
                             # Upload to cloud
                             upload_success = await self._upload_telemetry_data()
-                            if upload_success:
-                                db.clear_telemetry_data()
-                            else:
+                            if not upload_success:
                                 self.logger.error("Wasn't able to upload telemetry data.")
 
                         # Try to collect system stats
@@ -0,0 +1,5 @@
+from .aggregation import ColumnarAggregator, average_synchronized_samples, AVERAGING_METHODS, STREAMING_PREFIX
+from .streaming_aggregation import StreamingAggregator, BufferedAggregator, create_window_aggregator
+from .pipeline import TelemetryPipeline, PipelineStage, TelemetryFrame, OverflowPolicy
+from .deadband import Deadband, DeadbandConfig, DeadbandFilter
+from .compaction import FrameCompactor
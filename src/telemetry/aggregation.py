@@ -0,0 +1,211 @@
+import statistics
+from typing import Dict, List, Tuple, Optional, Any
+
+import numpy as np
+
+AVERAGING_METHODS = ["mean", "median", "mode", "min", "max", "std", "last"]
+# Averaging methods with this prefix are folded in as samples arrive instead of being buffered
+STREAMING_PREFIX = "streaming_"
+
+# (system, hardware_id, device_id)
+DeviceKey = Tuple[str, str, Any]
+
+
+def _reduce_values(values: List[float], averaging_method: str) -> float:
+    """ Reduce the values of one point with the statistics module (reference implementation) """
+    if averaging_method == "mean":
+        return statistics.mean(values)
+    elif averaging_method == "median":
+        return statistics.median(values)
+    elif averaging_method == "last":
+        return values[-1]
+    elif averaging_method == "min":
+        return min(values)
+    elif averaging_method == "max":
+        return max(values)
+    elif averaging_method == "std":
+        return statistics.pstdev(values)
+    elif averaging_method == "mode":
+        try:
+            return statistics.mode(values)
+        except statistics.StatisticsError:
+            # If no unique mode found, fall back to mean
+            return statistics.mean(values)
+    # Default to mean if unknown method
+    return statistics.mean(values)
+
+
+def average_synchronized_samples(samples: List[dict], averaging_method: str = "mean") -> dict:
+    """
+    Reference (nested dict) averaging of synchronized samples, point by point.
+    Kept to validate and benchmark the ColumnarAggregator.
+    """
+    if not samples:
+        return {}
+
+    # Get all systems and hardware IDs seen in any sample (scan groups may skip failed hardware)
+    systems = {}
+    for sample in samples:
+        for system, system_data in sample.items():
+            hardware_ids = systems.setdefault(system, [])
+            hardware_ids.extend(h for h in system_data.keys() if h not in hardware_ids)
+
+    result = {}
+    for system, hardware_ids in systems.items():
+        result[system] = {}
+        for hardware_id in hardware_ids:
+            result[system][hardware_id] = {}
+
+            # Get all device IDs for this hardware in all samples
+            all_device_ids = set()
+            for sample in samples:
+                if system in sample and hardware_id in sample[system]:
+                    all_device_ids.update(sample[system][hardware_id].keys())
+
+            for device_id in all_device_ids:
+                device_data_across_samples = []
+                for sample in samples:
+                    device_data = sample.get(system, {}).get(hardware_id, {}).get(device_id)
+                    if isinstance(device_data, dict):
+                        device_data_across_samples.append(device_data)
+
+                if device_data_across_samples:
+                    all_keys = set()
+                    for device_data in device_data_across_samples:
+                        all_keys.update(device_data.keys())
+
+                    device_result = {}
+                    for key in all_keys:
+                        values = [device_data[key] for device_data in device_data_across_samples
+                                  if key in device_data and isinstance(device_data[key], (int, float))]
+                        if values:
+                            device_result[key] = _reduce_values(values, averaging_method)
+                    result[system][hardware_id][device_id] = device_result
+
+    return result
+
+
+class ColumnarAggregator:
+    """
+    Vectorized aggregation of synchronized samples.
+    Each (system, hardware, device) gets a stable point index and a block of columns in one preallocated
+    (samples x points) array that is reused across cycles, so a whole interval is reduced with a single
+    NumPy call.  Missing or non numeric values are NaN and ignored, so the results match
+    average_synchronized_samples.
+    """
+
+    def __init__(self, averaging_method: str = "mean"):
+        self.averaging_method = averaging_method
+        self._point_index: Dict[DeviceKey, Dict[str, int]] = {}
+        self._buffer: Optional[np.ndarray] = None
+
+    def point_index(self, key: DeviceKey) -> Dict[str, int]:
+        return self._point_index.setdefault(key, {})
+
+    def _columns(self, n_samples: int, n_points: int) -> np.ndarray:
+        buffer = self._buffer
+        if buffer is None or buffer.shape[0] < n_samples or buffer.shape[1] < n_points:
+            rows = max(n_samples, buffer.shape[0] if buffer is not None else 0)
+            # Leave room for points that appear later without reallocating every cycle
+            cols = max(n_points + n_points // 4, buffer.shape[1] if buffer is not None else 0)
+            self._buffer = buffer = np.empty((rows, cols), dtype=np.float64)
+        return buffer[:n_samples, :n_points]
+
+    def pack(self, samples: List[dict]) -> Tuple[Dict[DeviceKey, int], np.ndarray]:
+        """
+        Pack the samples into a (samples x points) array.
+        :return: ({device key: first column of its block}, array)
+        """
+        device_rows: Dict[DeviceKey, List[Tuple[int, dict]]] = {}
+        for row, sample in enumerate(samples):
+            for system, system_data in sample.items():
+                for hardware_id, hardware_data in system_data.items():
+                    for device_id, device_data in hardware_data.items():
+                        if isinstance(device_data, dict):
+                            device_rows.setdefault((system, hardware_id, device_id), []).append((row, device_data))
+
+        offsets: Dict[DeviceKey, int] = {}
+        n_points = 0
+        for key, rows in device_rows.items():
+            index = self.point_index(key)
+            for _, device_data in rows:
+                for point in device_data:
+                    if point not in index:
+                        index[point] = len(index)
+            offsets[key] = n_points
+            n_points += len(index)
+
+        # Fill plain lists first, a single bulk copy into the array is much cheaper than per item writes
+        nan = float("nan")
+        table = [[nan] * n_points for _ in range(len(samples))]
+        for key, rows in device_rows.items():
+            offset = offsets[key]
+            index = self._point_index[key]
+            for row, device_data in rows:
+                values = table[row]
+                for point, value in device_data.items():
+                    if isinstance(value, (int, float)):
+                        values[offset + index[point]] = value
+        columns = self._columns(len(samples), n_points)
+        if n_points:
+            columns[:] = table
+        return offsets, columns
+
+    @staticmethod
+    def reduce(columns: np.ndarray, averaging_method: str) -> np.ndarray:
+        """ Reduce a (samples x points) array to one value per point, ignoring NaN """
+        result = np.full(columns.shape[1], np.nan)
+        valid = ~np.isnan(columns)
+        present = valid.any(axis=0)
+        if not present.any():
+            return result
+        data = columns[:, present]
+        complete = bool(valid[:, present].all())
+        if averaging_method == "median":
+            result[present] = np.median(data, axis=0) if complete else np.nanmedian(data, axis=0)
+        elif averaging_method == "min":
+            result[present] = np.nanmin(data, axis=0)
+        elif averaging_method == "max":
+            result[present] = np.nanmax(data, axis=0)
+        elif averaging_method == "std":
+            result[present] = data.std(axis=0) if complete else np.nanstd(data, axis=0)
+        elif averaging_method == "last":
+            # Row of the last valid value in each column
+            last_rows = data.shape[0] - 1 - np.argmax(valid[::-1, present], axis=0)
+            result[present] = data[last_rows, np.arange(data.shape[1])]
+        elif averaging_method == "mode":
+            for col in np.flatnonzero(present):
+                values = columns[:, col]
+                result[col] = _reduce_values(values[~np.isnan(values)].tolist(), "mode")
+        else:
+            result[present] = data.mean(axis=0) if complete else np.nanmean(data, axis=0)
+        return result
+
+    def aggregate(self, samples: List[dict], averaging_method: Optional[str] = None) -> dict:
+        """
+        Aggregate a list of {system: {hardware: {device: {point: value}}}} samples into one.
+        """
+        if not samples:
+            return {}
+        averaging_method = averaging_method or self.averaging_method
+        if averaging_method.startswith(STREAMING_PREFIX):
+            averaging_method = averaging_method[len(STREAMING_PREFIX):]
+
+        result: Dict[str, Dict[str, Dict[Any, dict]]] = {}
+        for sample in samples:
+            for system, system_data in sample.items():
+                system_result = result.setdefault(system, {})
+                for hardware_id in system_data:
+                    system_result.setdefault(hardware_id, {})
+
+        offsets, columns = self.pack(samples)
+        reduced = self.reduce(columns, averaging_method).tolist()
+        for key, offset in offsets.items():
+            system, hardware_id, device_id = key
+            device_result = {}
+            for point, col in self._point_index[key].items():
+                value = reduced[offset + col]
+                if value == value:  # skip NaN: no numeric value this cycle
+                    device_result[point] = value
+            result[system][hardware_id][device_id] = device_result
+        return result
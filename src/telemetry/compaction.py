@@ -0,0 +1,121 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.mqtt_config import FORMAT_LINE_PROTOCOL
+
+# Tag of the lines rolled up over that many seconds, their points carry these companion fields
+RESOLUTION_TAG = "resolution"
+MIN_SUFFIX = "_min"
+MAX_SUFFIX = "_max"
+SAMPLES_FIELD = "samples"
+
+
+def parse_line(line: str) -> Optional[Tuple[str, Dict[str, str], int]]:
+    """ :return: (measurement and tags, {field: value text}, timestamp) or None when not line protocol """
+    try:
+        series, rest = line.split(" ", 1)
+        fields, timestamp = rest.rsplit(" ", 1)
+        return series, dict(f.split("=", 1) for f in fields.split(",")), int(timestamp)
+    except ValueError:
+        return None
+
+
+def _number(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+@dataclass
+class _PointStats:
+    total: float = 0.0
+    samples: int = 0
+    minimum: float = float("inf")
+    maximum: float = float("-inf")
+
+    def add(self, mean: float, minimum: float, maximum: float, samples: int):
+        self.total += mean * samples
+        self.samples += samples
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+
+@dataclass
+class _Series:
+    points: Dict[str, _PointStats] = field(default_factory=dict)
+    text: Dict[str, str] = field(default_factory=dict)
+    samples: int = 0
+
+
+class FrameCompactor:
+    """
+    Rolls line protocol frames into one frame per series (measurement and tags): each numeric point becomes
+    its mean, with its min and max as point_min and point_max, and samples counts the frames behind it.
+    Lines rolled up before (tagged with their resolution) are merged by their means weighted by their samples,
+    so frames can be compacted again at a coarser resolution.  Text points keep their last value, lines
+    that are not line protocol are kept as they are.
+    """
+
+    def __init__(self, resolution: int):
+        self.resolution = resolution
+        self.mode = FORMAT_LINE_PROTOCOL
+        self.series: Dict[str, _Series] = {}
+        self.passthrough: List[str] = []
+
+    def add(self, telemetry_data: Dict[str, Any], weight: int = 1):
+        """ Add a frame standing for weight frames (see TelemetryQueue downsampling) """
+        self.mode = telemetry_data.get("mode", self.mode)
+        for line in telemetry_data.get("data", []):
+            parsed = parse_line(line)
+            if parsed is None:
+                self.passthrough.append(line)
+                continue
+            series_key, fields, _ = parsed
+            tags = series_key.split(",")
+            rolled = [t for t in tags if t.startswith(RESOLUTION_TAG + "=")]
+            if rolled:
+                series_key = ",".join(t for t in tags if t not in rolled)
+                self._add_rolled(self.series.setdefault(series_key, _Series()), fields)
+            else:
+                self._add_raw(self.series.setdefault(series_key, _Series()), fields, weight)
+
+    @staticmethod
+    def _add_raw(series: _Series, fields: Dict[str, str], weight: int):
+        series.samples += weight
+        for name, text in fields.items():
+            value = _number(text)
+            if value is None:
+                series.text[name] = text
+            else:
+                series.points.setdefault(name, _PointStats()).add(value, value, value, weight)
+
+    @staticmethod
+    def _add_rolled(series: _Series, fields: Dict[str, str]):
+        samples = int(_number(fields.pop(SAMPLES_FIELD, "1")) or 1)
+        series.samples += samples
+        # A point always has both companions, which tells point_min apart from a point named that way
+        points = {name for name in fields if name + MIN_SUFFIX in fields and name + MAX_SUFFIX in fields}
+        companions = {name + suffix for name in points for suffix in (MIN_SUFFIX, MAX_SUFFIX)}
+        for name, text in fields.items():
+            if name in points and (mean := _number(text)) is not None:
+                minimum = _number(fields[name + MIN_SUFFIX])
+                maximum = _number(fields[name + MAX_SUFFIX])
+                series.points.setdefault(name, _PointStats()).add(
+                    mean, mean if minimum is None else minimum, mean if maximum is None else maximum, samples)
+            elif name not in companions:
+                series.text[name] = text
+
+    def frame(self, timestamp: float) -> Dict[str, Any]:
+        """ The rolled up frame, its lines stamped with timestamp (seconds) """
+        stamp = int(timestamp * 1000000000)
+        lines = []
+        for series_key, series in self.series.items():
+            fields = []
+            for name, stats in series.points.items():
+                fields += [f"{name}={stats.total / stats.samples}", f"{name}{MIN_SUFFIX}={stats.minimum}",
+                           f"{name}{MAX_SUFFIX}={stats.maximum}"]
+            fields += [f"{name}={text}" for name, text in series.text.items()]
+            fields.append(f"{SAMPLES_FIELD}={series.samples}")
+            lines.append(f"{series_key},{RESOLUTION_TAG}={self.resolution} {','.join(fields)} {stamp}")
+        return {"mode": self.mode, "data": lines + self.passthrough}
@@ -0,0 +1,111 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Any, Tuple
+
+# (scan group, system, hardware_id, device_id, point)
+PointKey = Tuple[str, str, str, Any, str]
+
+
+@dataclass(frozen=True)
+class Deadband:
+    """
+    Report-by-exception band of one point.  A value is reported when it moved more than the wider of
+    the absolute and percent (of the last reported value) bands, or when it has not been reported for
+    max_silence seconds (heartbeat).
+    """
+    absolute: Optional[float] = None
+    percent: Optional[float] = None
+    max_silence: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Deadband':
+        def optional_float(key: str) -> Optional[float]:
+            return float(data[key]) if data.get(key) is not None else None
+        return cls(absolute=optional_float("absolute"), percent=optional_float("percent"),
+                   max_silence=optional_float("max_silence"))
+
+    def threshold(self, last_value: float) -> float:
+        band = self.absolute or 0.0
+        if self.percent:
+            band = max(band, abs(last_value) * self.percent / 100.0)
+        return band
+
+
+@dataclass
+class DeadbandConfig:
+    """ Deadbands of one deployment's scan group: per point, falling back to the scan group default """
+    points: Dict[str, Deadband] = field(default_factory=dict)
+    default: Optional[Deadband] = None
+
+    def for_point(self, point: str) -> Optional[Deadband]:
+        return self.points.get(point, self.default)
+
+    def __bool__(self):
+        return bool(self.points) or self.default is not None
+
+
+class DeadbandFilter:
+    """
+    Drops the points of an aggregated frame that stayed within their deadband since they were last
+    reported.  Points without a deadband are always reported.
+    """
+
+    def __init__(self, default_max_silence: Optional[float] = 900.0):
+        self.default_max_silence = default_max_silence
+        self._reported: Dict[PointKey, Tuple[float, float]] = {}
+        self.last_stats: Dict[str, int] = {"points": 0, "suppressed": 0, "bytes_saved": 0}
+        self.total_suppressed = 0
+        self.total_bytes_saved = 0
+
+    def _should_report(self, key: PointKey, value: float, deadband: Deadband, now: float) -> bool:
+        last = self._reported.get(key)
+        if last is None:
+            return True
+        last_value, last_time = last
+        max_silence = deadband.max_silence if deadband.max_silence is not None else self.default_max_silence
+        if max_silence is not None and now - last_time >= max_silence:
+            return True
+        return abs(value - last_value) > deadband.threshold(last_value)
+
+    def filter(self, scan_group: str, measurements: Dict[str, Any], configs: Dict[str, DeadbandConfig],
+               now: float) -> Dict[str, Any]:
+        """
+        :param measurements: {system: {hardware_id: {device_id: {point: value}}}}
+        :param configs: {hardware_id: DeadbandConfig}
+        :return: the measurements to report, same structure
+        """
+        points = suppressed = bytes_saved = 0
+        reported: Dict[str, Any] = {}
+        for system, system_data in measurements.items():
+            reported_system = reported.setdefault(system, {})
+            for hardware_id, hardware_data in system_data.items():
+                config = configs.get(hardware_id)
+                if not config:
+                    reported_system[hardware_id] = hardware_data
+                    points += sum(len(d) for d in hardware_data.values() if isinstance(d, dict))
+                    continue
+                reported_hardware = reported_system.setdefault(hardware_id, {})
+                for device_id, device_data in hardware_data.items():
+                    reported_device = reported_hardware.setdefault(device_id, {})
+                    for point, value in device_data.items():
+                        points += 1
+                        deadband = config.for_point(point)
+                        if deadband is None or not isinstance(value, (int, float)):
+                            reported_device[point] = value
+                            continue
+                        key = (scan_group, system, hardware_id, device_id, point)
+                        if self._should_report(key, value, deadband, now):
+                            self._reported[key] = (value, now)
+                            reported_device[point] = value
+                        else:
+                            suppressed += 1
+                            # Line protocol field "point=value" plus its separator
+                            bytes_saved += len(point) + len(str(value)) + 2
+
+        self.last_stats = {"points": points, "suppressed": suppressed, "bytes_saved": bytes_saved}
+        self.total_suppressed += suppressed
+        self.total_bytes_saved += bytes_saved
+        return reported
+
+    def reset(self):
+        """ Forget what was reported, every point is sent with the next frame """
+        self._reported.clear()
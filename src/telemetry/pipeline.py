@@ -0,0 +1,145 @@
+import asyncio
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Optional, List, Dict
+
+from utils import LogManager
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"                # backpressure: the producer waits for room
+    DROP_OLDEST = "drop_oldest"    # make room by discarding the oldest queued item
+    DROP_NEWEST = "drop_newest"    # discard the incoming item
+
+
+@dataclass
+class TelemetryFrame:
+    """ One completed scan group window on its way through the pipeline """
+    scan_group: str
+    completed_at: float
+    window: Any = None
+    measurements: dict = field(default_factory=dict)
+    # The measurements left to report once the deadbands are applied, None to report them all
+    reported: Optional[dict] = None
+    telemetry_data: Dict[str, Any] = field(default_factory=dict)
+    # {hardware_id: {device_id: health fields}} snapshot taken when the window completed
+    device_health: Dict[str, Any] = field(default_factory=dict)
+    # {resource: {block: latency fields}} of the Modbus transactions since the previous one, when due
+    modbus_stats: Dict[str, Any] = field(default_factory=dict)
+    # {"queue": {"0": backlog fields}} while telemetry is waiting for upload
+    telemetry_backlog: Dict[str, Any] = field(default_factory=dict)
+
+
+class PipelineStage:
+    """
+    One stage of the telemetry pipeline: a bounded queue and a worker task running the handler on
+    each item.  A handler returning None ends the item's trip, anything else is passed downstream.
+    Handlers of blocking stages run in the given executor, coroutine handlers hand their blocking work
+    (SQLite, CSV, psutil) to it themselves, so neither stalls the loop.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Any], maxsize: int = 8,
+                 overflow: OverflowPolicy = OverflowPolicy.BLOCK, executor: Optional[Executor] = None,
+                 blocking: bool = False):
+        self.logger = LogManager().get_logger("TelemetryPipeline")
+        self.name = name
+        self.handler = handler
+        self.overflow = overflow
+        self.executor = executor
+        self.blocking = blocking
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.downstream: Optional['PipelineStage'] = None
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_s = 0.0
+        self.total_s = 0.0
+        self.max_depth = 0
+
+    async def put(self, item: Any) -> bool:
+        """ Queue an item according to the overflow policy, False if an item was dropped """
+        if self.overflow == OverflowPolicy.BLOCK:
+            await self.queue.put(item)
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+            return True
+
+        accepted = True
+        if self.queue.full():
+            self.dropped += 1
+            if self.overflow == OverflowPolicy.DROP_NEWEST:
+                self.logger.warning(f"Stage {self.name} full, dropping incoming item")
+                return False
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.logger.warning(f"Stage {self.name} full, dropping oldest item")
+            accepted = False
+        self.queue.put_nowait(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return accepted
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            start = time.perf_counter()
+            try:
+                if self.blocking:
+                    result = await loop.run_in_executor(self.executor, self.handler, item)
+                else:
+                    result = self.handler(item)
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                self.processed += 1
+                self.last_s = time.perf_counter() - start
+                self.total_s += self.last_s
+                if result is not None and self.downstream:
+                    await self.downstream.put(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.logger.error(f"Stage {self.name} failed to process item: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queue_depth": self.queue.qsize(), "max_depth": self.max_depth,
+                "capacity": self.queue.maxsize, "processed": self.processed, "dropped": self.dropped,
+                "errors": self.errors, "last_ms": self.last_s * 1000,
+                "avg_ms": (self.total_s / self.processed * 1000) if self.processed else 0.0}
+
+
+class TelemetryPipeline:
+    """ A chain of PipelineStages, each running as its own asyncio task """
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.logger = LogManager().get_logger("TelemetryPipeline")
+        self.stages = stages
+        for stage, downstream in zip(stages, stages[1:]):
+            stage.downstream = downstream
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(stage.run(), name=f"pipeline-{stage.name}") for stage in self.stages]
+
+    async def submit(self, item: Any) -> bool:
+        return await self.stages[0].put(item)
+
+    async def drain(self, timeout: float = 10.0):
+        """ Wait (bounded) for queued items to work through every stage """
+        try:
+            for stage in self.stages:
+                await asyncio.wait_for(stage.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning("Timed out draining telemetry pipeline")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.stats() for stage in self.stages}
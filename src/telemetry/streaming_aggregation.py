@@ -0,0 +1,185 @@
+import math
+import statistics
+from typing import Dict, List, Optional, Any
+
+from .aggregation import ColumnarAggregator, STREAMING_PREFIX
+
+STREAMING_METHODS = ["streaming_mean", "streaming_median", "streaming_min", "streaming_max",
+                     "streaming_std", "streaming_last"]
+
+
+class P2Quantile:
+    """
+    P-square streaming quantile estimator (Jain & Chlamtac), constant memory: five markers.
+    Exact for the first five observations.
+    """
+    __slots__ = ("p", "heights", "positions", "desired", "increments", "initial")
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self.initial: Optional[List[float]] = []
+        self.heights: List[float] = []
+        self.positions: List[int] = []
+        self.desired: List[float] = []
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float):
+        if self.initial is not None:
+            self.initial.append(x)
+            if len(self.initial) == 5:
+                self.initial.sort()
+                self.heights = self.initial
+                self.positions = [0, 1, 2, 3, 4]
+                self.desired = [0, 2 * self.p, 4 * self.p, 2 + 2 * self.p, 4]
+                self.initial = None
+            return
+
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Adjust the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                        (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                        (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # Parabolic prediction out of order, use linear
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self) -> float:
+        if self.initial is not None:
+            if self.p == 0.5:
+                return statistics.median(self.initial)
+            ordered = sorted(self.initial)
+            return ordered[min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))]
+        return self.heights[2]
+
+
+class PointStatistics:
+    """ Online statistics of one point: Welford mean/variance, min/max, last and optionally the median """
+    __slots__ = ("count", "mean", "m2", "min", "max", "last", "median")
+
+    def __init__(self, track_median: bool = False):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = None
+        self.median = P2Quantile(0.5) if track_median else None
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        self.last = x
+        if self.median is not None:
+            self.median.add(x)
+
+    @property
+    def std(self) -> float:
+        """ Population standard deviation (same as the columnar 'std') """
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def value(self, method: str) -> float:
+        if method == "median" and self.median is not None:
+            return self.median.value()
+        if method == "min":
+            return self.min
+        if method == "max":
+            return self.max
+        if method == "std":
+            return self.std
+        if method == "last":
+            return self.last
+        return self.mean
+
+
+class StreamingAggregator:
+    """
+    Folds each {system: {hardware: {device: {point: value}}}} sample into per point statistics as it
+    arrives, so memory stays constant whatever the number of samples per interval.
+    """
+
+    def __init__(self, averaging_method: str = "streaming_mean"):
+        self.method = averaging_method[len(STREAMING_PREFIX):] \
+            if averaging_method.startswith(STREAMING_PREFIX) else averaging_method
+        self._track_median = self.method == "median"
+        self._points: Dict[str, Dict[str, Dict[Any, Dict[str, PointStatistics]]]] = {}
+        self.count = 0
+
+    def add(self, sample: dict):
+        self.count += 1
+        for system, system_data in sample.items():
+            system_points = self._points.setdefault(system, {})
+            for hardware_id, hardware_data in system_data.items():
+                hardware_points = system_points.setdefault(hardware_id, {})
+                for device_id, device_data in hardware_data.items():
+                    if not isinstance(device_data, dict):
+                        continue
+                    device_points = hardware_points.setdefault(device_id, {})
+                    for point, value in device_data.items():
+                        if isinstance(value, (int, float)):
+                            stats = device_points.get(point)
+                            if stats is None:
+                                stats = device_points[point] = PointStatistics(self._track_median)
+                            stats.add(value)
+
+    def result(self) -> dict:
+        return {system: {hardware_id: {device_id: {point: stats.value(self.method)
+                                                   for point, stats in device_points.items()}
+                                       for device_id, device_points in hardware_points.items()}
+                         for hardware_id, hardware_points in system_points.items()}
+                for system, system_points in self._points.items()}
+
+    def __len__(self):
+        return self.count
+
+
+class BufferedAggregator:
+    """ Keeps every sample of the window and reduces them at the end with the ColumnarAggregator """
+
+    def __init__(self, aggregator: ColumnarAggregator, averaging_method: Optional[str] = None):
+        self.aggregator = aggregator
+        self.averaging_method = averaging_method
+        self.samples: List[dict] = []
+
+    def add(self, sample: dict):
+        self.samples.append(sample)
+
+    def result(self) -> dict:
+        return self.aggregator.aggregate(self.samples, self.averaging_method)
+
+    def __len__(self):
+        return len(self.samples)
+
+
+def create_window_aggregator(averaging_method: Optional[str], aggregator: ColumnarAggregator):
+    """ Streaming methods fold samples in as they arrive, the others buffer the window """
+    averaging_method = averaging_method or aggregator.averaging_method
+    if averaging_method.startswith(STREAMING_PREFIX):
+        return StreamingAggregator(averaging_method)
+    return BufferedAggregator(aggregator, averaging_method)
@@ -34,6 +34,12 @@ class EnvVars(metaclass=Singleton):
         self.debug = self.get_bool('DEBUG', "False")
         self.log_level = self.get_env('LOG_LEVEL', 'INFO')
         self.enable_simulators = self.get_bool("RAPTOR_SIMULATOR", "False")
+        # Compiled Modbus maps for a faster start, disabled when unset
+        self.modbus_map_cache_dir = self.get_env("MODBUS_MAP_CACHE_DIR")
+        # Modbus transaction latency totals written by the IoT controller, read by the UI
+        self.modbus_stats_path = self.get_env("MODBUS_STATS_PATH", os.path.join(self.log_path, "modbus_stats.json"))
+        # Unix socket of the bus broker owning the Modbus buses, unset lets every process open them directly
+        self.bus_broker_socket = self.get_env("BUS_BROKER_SOCKET")
         
 
 
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+import unittest
+from collections import Counter
+
+from hardware.acquisition_scheduler import AcquisitionScheduler
+
+
+class BusDeployment:
+    """ Deployment on a shared bus, records how many reads run on its resource at once """
+    has_native_async = False
+    active = Counter()
+    overlapping = Counter()
+    lock = threading.Lock()
+
+    def __init__(self, hardware_id: str, resource_key: str, barrier: threading.Barrier = None, fail: bool = False):
+        self.hardware_id = hardware_id
+        self.resource_key = resource_key
+        self.barrier = barrier
+        self.fail = fail
+
+    def data_acquisition(self, scan_group, deadline=None):
+        with self.lock:
+            self.active[self.resource_key] += 1
+            if self.active[self.resource_key] > 1:
+                self.overlapping[self.resource_key] += 1
+        try:
+            if self.barrier is not None:
+                # Only passes when the other resource is being read at the same time
+                self.barrier.wait(timeout=2)
+            time.sleep(0.01)
+            if self.fail:
+                raise IOError("No response from slave")
+            return {"device": {"hardware_id": self.hardware_id}}
+        finally:
+            with self.lock:
+                self.active[self.resource_key] -= 1
+
+
+class AcquisitionSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        BusDeployment.active.clear()
+        BusDeployment.overlapping.clear()
+        self.scheduler = AcquisitionScheduler(max_workers=4)
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_resources_in_parallel_devices_of_a_resource_in_series(self):
+        barrier = threading.Barrier(2)
+        deployments = {"BMS": {f"bms-{i}": BusDeployment(f"bms-{i}", "/dev/ttyUSB0", barrier if i == 0 else None)
+                               for i in range(3)},
+                       "PV": {"pv-0": BusDeployment("pv-0", "10.0.0.5:502", barrier)}}
+        measurements, timing = asyncio.run(self.scheduler.acquire(deployments))
+        self.assertEqual({"bms-0", "bms-1", "bms-2"}, set(measurements["BMS"]))
+        self.assertEqual({"pv-0"}, set(measurements["PV"]))
+        self.assertFalse(barrier.broken)
+        self.assertEqual(Counter(), BusDeployment.overlapping)
+        self.assertEqual({"/dev/ttyUSB0": 3, "10.0.0.5:502": 1},
+                         {resource: t["deployments"] for resource, t in timing.items()})
+
+    def test_failing_resource_keeps_the_others_results(self):
+        deployments = {"BMS": {"bms-0": BusDeployment("bms-0", "/dev/ttyUSB0", fail=True),
+                               "bms-1": BusDeployment("bms-1", "/dev/ttyUSB0")},
+                       "PV": {"pv-0": BusDeployment("pv-0", "10.0.0.5:502", fail=True),
+                              "pv-1": BusDeployment("pv-1", "10.0.0.6:502")}}
+        measurements, timing = asyncio.run(self.scheduler.acquire(deployments))
+        self.assertEqual({"BMS": ["bms-1"], "PV": ["pv-1"]}, {s: list(m) for s, m in measurements.items()})
+        self.assertEqual({"/dev/ttyUSB0": 1, "10.0.0.5:502": 1, "10.0.0.6:502": 0},
+                         {resource: t["errors"] for resource, t in timing.items()})
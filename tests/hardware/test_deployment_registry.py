@@ -0,0 +1,51 @@
+import logging
+import unittest
+from unittest import mock
+
+from hardware import deployment_registry
+from hardware.deployment_registry import DeploymentRegistry
+
+
+class FakeDatabase:
+    """ get_hardware_systems of DatabaseManager over in-memory rows """
+
+    def __init__(self, rows: dict):
+        self.rows = rows
+
+    def get_hardware_systems(self, system: str) -> list:
+        return [dict(row) for row in self.rows.get(system, [])]
+
+
+def row(external_ref: str, port: str = "/dev/ttyUSB0") -> dict:
+    return {"external_ref": external_ref, "type": "Modbus", "parameters": {"port": port},
+            "scan_groups": {"DATA": {"registers": ["SOC"]}}, "devices": [{"slave_id": 1}]}
+
+
+class DeploymentRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(deployment_registry, "instantiate_hardware_from_dict",
+                                    side_effect=lambda hardware, logger: object())
+        self.instantiate = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = DeploymentRegistry(["BMS", "PV"], logging.getLogger())
+
+    def test_unchanged_rows_reuse_their_deployments(self):
+        db = FakeDatabase({"BMS": [row("bms-1"), row("bms-2")], "PV": [row("pv-1")]})
+        first = self.registry.refresh(db)
+        second = self.registry.refresh(db)
+        self.assertEqual(3, self.instantiate.call_count)
+        self.assertTrue(all(second[s][ref] is first[s][ref] for s in first for ref in first[s]))
+        self.assertEqual((0, 3), (self.registry.last_refresh["built"], self.registry.last_refresh["reused"]))
+
+    def test_changed_row_rebuilds_only_its_deployment(self):
+        db = FakeDatabase({"BMS": [row("bms-1"), row("bms-2")], "PV": [row("pv-1")]})
+        first = self.registry.refresh(db)
+        db.rows["BMS"][1] = row("bms-2", port="/dev/ttyUSB1")
+        del db.rows["PV"][0]
+        second = self.registry.refresh(db)
+        self.assertIs(first["BMS"]["bms-1"], second["BMS"]["bms-1"])
+        self.assertIsNot(first["BMS"]["bms-2"], second["BMS"]["bms-2"])
+        self.assertEqual({}, second["PV"])
+        self.assertEqual({"built": 1, "reused": 1, "removed": 1, "failed": 0},
+                         {k: self.registry.last_refresh[k] for k in ("built", "reused", "removed", "failed")})
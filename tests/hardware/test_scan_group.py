@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+
+from hardware.acquisition_scheduler import AcquisitionScheduler
+from hardware.scan_group import ScanGroupScheduler, DATA_GROUP, ALARM_GROUP
+
+
+class FakeDeployment:
+    """ Only what the schedulers use of a HardwareDeployment """
+    has_native_async = False
+
+    def __init__(self, hardware_id: str, scan_groups: dict, resource_key: str = "fake"):
+        self.hardware_id = hardware_id
+        self.scan_groups = scan_groups
+        self.resource_key = resource_key
+
+    def data_acquisition(self, scan_group, deadline=None):
+        return {"device": {"scan_group": scan_group}}
+
+
+class ListWindow(list):
+
+    def __init__(self, averaging=None):
+        super().__init__()
+        self.averaging = averaging
+
+    def add(self, sample):
+        self.append(sample)
+
+    def result(self):
+        return list(self)
+
+
+class ScanGroupSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.acquisition = AcquisitionScheduler(max_workers=2)
+        self.scheduler = ScanGroupScheduler(self.acquisition, default_period=10, default_sampling=2,
+                                            window_factory=ListWindow)
+
+    def tearDown(self):
+        self.acquisition.shutdown()
+
+    def run_at(self, *times):
+        """ :return: the scan groups completed at each time """
+        async def run():
+            return [[w.scan_group for w in await self.scheduler.run_due(now)] for now in times]
+        return asyncio.run(run())
+
+    def slot(self, name):
+        return next(slot for key, slot in self.scheduler.slots.items() if key[0] == name)
+
+    def test_groups_fire_at_their_own_rate_without_drift(self):
+        deployment = FakeDeployment("1", {ALARM_GROUP: {"period": 1, "registers": ["Alarm"]}})
+        self.scheduler.update({"BMS": {"1": deployment}}, now=1000.0)
+        # Late samples keep the schedule: DATA samples every 5s, ALARM every second
+        completed = self.run_at(*(1000.2 + t for t in range(11)))
+        self.assertEqual([[ALARM_GROUP]] * 5 + [[DATA_GROUP, ALARM_GROUP]] + [[ALARM_GROUP]] * 5, completed)
+        self.assertEqual(1011.0, self.slot(ALARM_GROUP).next_due)
+        self.assertEqual(1015.0, self.slot(DATA_GROUP).next_due)
+        self.assertEqual(1011.0, self.scheduler.next_due())
+
+        # Missed samples are not caught up on
+        self.run_at(1030.5)
+        self.assertEqual(1031.5, self.slot(ALARM_GROUP).next_due)
+
+    def test_slots_are_keyed_by_name_and_timing(self):
+        deployments = {
+            "BMS": {"1": FakeDeployment("1", {}), "2": FakeDeployment("2", {DATA_GROUP: {"registers": ["SOC"]}})},
+            "PV": {"3": FakeDeployment("3", {DATA_GROUP: {"sampling": 2, "averaging": "max"}}),
+                   "4": FakeDeployment("4", {DATA_GROUP: {"period": 60, "sampling": 3}})},
+        }
+        self.scheduler.update(deployments, now=1000.0)
+        self.assertEqual({(DATA_GROUP, 10.0, 2, None): ["1", "2"], (DATA_GROUP, 10.0, 2, "max"): ["3"],
+                          (DATA_GROUP, 60.0, 3, None): ["4"]},
+                         {key: [d.hardware_id for _, d in slot.members]
+                          for key, slot in self.scheduler.slots.items()})
+
+    def test_slots_follow_the_deployment_changes(self):
+        alarms = {ALARM_GROUP: {"period": 1}}
+        self.scheduler.update({"BMS": {"1": FakeDeployment("1", alarms)}}, now=1000.0)
+        self.run_at(1000.0)
+        data_slot = self.slot(DATA_GROUP)
+
+        # New hardware joins the running DATA slot, the ALARM group is gone with its only deployment
+        self.scheduler.update({"BMS": {"2": FakeDeployment("2", {})}, "PV": {"3": FakeDeployment("3", {})}},
+                              now=1003.0)
+        self.assertEqual([(DATA_GROUP, 10.0, 2, None)], list(self.scheduler.slots))
+        self.assertIs(data_slot, self.slot(DATA_GROUP))
+        self.assertEqual(1005.0, data_slot.next_due)
+        self.assertEqual(["2", "3"], [d.hardware_id for _, d in data_slot.members])
@@ -0,0 +1,52 @@
+""" pymodbus client stand-ins shared by the Modbus tests """
+from typing import Dict, List, Optional
+
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+
+
+class FakeResult:
+    def __init__(self, registers):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+
+class FakeClient:
+    """
+    Sync client answering holding register reads from {address: value}: a missing address times out and
+    None answers with an illegal data address exception.  Counts its connects and records its reads.
+    """
+
+    def __init__(self, values: Optional[Dict[int, Optional[int]]] = None):
+        self.values = {} if values is None else values
+        self.connected = False
+        self.connects = 0
+        self.read_addresses: List[int] = []
+
+    @property
+    def reads(self) -> int:
+        return len(self.read_addresses)
+
+    def connect(self):
+        self.connects += 1
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def read_holding_registers(self, address, count, slave):
+        self.read_addresses.append(address)
+        addresses = range(address, address + count)
+        if any(a not in self.values for a in addresses):
+            raise ModbusIOException("No response received")
+        if any(self.values[a] is None for a in addresses):
+            return ExceptionResponse(0x03, 0x02)
+        return FakeResult([self.values[a] for a in addresses])
+
+
+class FakeAsyncClient(FakeClient):
+    async def connect(self):
+        return super().connect()
@@ -0,0 +1,49 @@
+import random
+import unittest
+
+from hardware.modbus.block_decoder import BlockDecoder, decoder_for
+from hardware.modbus.modbus_hardware import convert_register_value
+from hardware.modbus.modbus_map import ModbusRegister
+from hardware.modbus.read_planner import plan_reads
+
+REGISTERS = [
+    ModbusRegister("u16", 0, "uint16", conversion_factor=0.1),
+    ModbusRegister("i16", 1, "int16", conversion_factor=0.01),
+    ModbusRegister("u8", 2, "uint8", conversion_factor=1),
+    ModbusRegister("i8", 3, "int8"),
+    ModbusRegister("flags", 4, "flag16", conversion_factor=1),
+    ModbusRegister("serial", 5, "ascii16", range_size=3),
+    ModbusRegister("letter", 8, "ascii8"),
+    ModbusRegister("count", 10, "uint16", conversion_factor=2),
+    ModbusRegister("mode", 11, "enum"),
+]
+
+
+class BlockDecoderTests(unittest.TestCase):
+
+    def test_matches_per_register_decoding(self):
+        block = plan_reads(REGISTERS, max_gap=4)[0]
+        for vectorized in (False, True):
+            decoder = BlockDecoder(block)
+            decoder.vectorized = vectorized
+            self.check_decoder(decoder, block)
+        self.assertEqual(["mode"], [r.name for r in decoder.fallback])
+
+    def check_decoder(self, decoder: BlockDecoder, block):
+        rng = random.Random(7)
+        for words in ([0] * block.count, [0xFFFF] * block.count, [0x8080] * block.count,
+                      *([rng.randrange(0x10000) for _ in range(block.count)] for _ in range(50))):
+            expected = {r.name: convert_register_value(block.slice(words, r), r)
+                        for r in block.registers if r.name != "mode"}
+            decoded = decoder.decode(words)
+            self.assertEqual(expected, decoded)
+            self.assertEqual({k: type(v) for k, v in expected.items()}, {k: type(v) for k, v in decoded.items()})
+
+    def test_short_block_is_rejected(self):
+        block = plan_reads(REGISTERS, max_gap=4)[0]
+        with self.assertRaises(ValueError):
+            decoder_for(block).decode([0] * (block.count - 1))
+
+    def test_decoder_is_cached_per_block(self):
+        registers = REGISTERS[:3]
+        self.assertIs(decoder_for(plan_reads(registers)[0]), decoder_for(plan_reads(registers)[0]))
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hardware.modbus.block_layouts import BlockLayouts, SQLiteBlockLayoutStore
+from hardware.modbus.client_pool import ModbusClientPool
+from hardware.modbus.modbus_hardware import ModbusHardware, ModbusClientType
+from hardware.modbus.read_planner import plan_reads, UNREADABLE_REFUSALS, UNREADABLE_REPROBE
+from hardware.modbus.simulator import ModbusSimulator, SimulatedBus, SIMULATED_MAPS
+
+
+class BlockLayoutLearningTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.layouts = BlockLayouts()
+        self.layouts.clear()
+        self.layouts.store = SQLiteBlockLayoutStore(os.path.join(self.tmp, "raptor.db"))
+        # Every address missing from the map is refused, even inside a block
+        self.bus = SimulatedBus.from_map("esslix", strict=True)
+        self.simulator = ModbusSimulator.tcp(self.bus, port=0).start()
+        self.hardware = ModbusHardware(client_type=ModbusClientType.TCP, host=self.simulator.host,
+                                       port=self.simulator.port, modbus_map_path=str(SIMULATED_MAPS["esslix"]),
+                                       max_read_gap=8)
+        self.registers = list(self.hardware.modbus_map.registers)
+
+    def tearDown(self):
+        ModbusClientPool().close_all()
+        self.simulator.stop()
+        self.layouts.clear()
+        self.layouts.store = None
+        shutil.rmtree(self.tmp)
+
+    def read(self) -> dict:
+        return self.hardware.data_acquisition([{"slave_id": 1, "mac": "bms"}], self.registers, None)["bms"]
+
+    def cycle(self) -> int:
+        """ :return: the transactions of one full map read """
+        requests = self.bus.requests
+        self.assertEqual(len(self.registers), len(self.read()))
+        return self.bus.requests - requests
+
+    def layout(self, map_version=None):
+        return self.layouts.layout(self.hardware.get_resource_key(), 1,
+                                   map_version or self.hardware.modbus_map.version)
+
+    def test_refused_blocks_are_bisected_and_the_layout_reused(self):
+        # Only the registers without unmapped addresses between them can be read together
+        minimum = len(plan_reads(self.hardware.modbus_map.resolve(), max_gap=0))
+        transactions = [self.cycle() for _ in range(6)]
+        self.assertGreater(transactions[0], minimum)
+        # Every refused block teaches at least one join per cycle
+        self.assertEqual(minimum, transactions[-1], transactions)
+
+        # A restart loads the learned layout
+        self.layouts.clear()
+        self.assertEqual(minimum, self.cycle())
+
+    def test_layout_is_not_reused_for_another_map_version(self):
+        self.cycle()
+        self.assertTrue(self.layout().cuts)
+        self.layouts.clear()
+        self.assertFalse(self.layout("other").cuts)
+
+    def test_refused_register_is_left_out_then_read_again(self):
+        register = self.hardware.modbus_map.registers[self.registers[0]]
+        table = self.bus.devices[1].tables[register.type.value]
+        value = table.pop(int(register.address))
+        # A register refused once may only have been busy
+        for _ in range(UNREADABLE_REFUSALS - 1):
+            self.assertNotIn(register.name, self.read())
+            self.assertFalse(self.layout().is_unreadable(register))
+        self.read()
+        self.assertTrue(self.layout().is_unreadable(register))
+        self.layouts.clear()
+        self.assertTrue(self.layout().is_unreadable(register))
+
+        # Served again: once the refusal has aged it is planned and forgotten
+        table[int(register.address)] = value
+        self.assertNotIn(register.name, self.read())
+        key = next(iter(self.layout().unreadable))
+        self.layout().unreadable[key] -= UNREADABLE_REPROBE
+        self.assertIn(register.name, self.read())
+        self.layouts.clear()
+        self.assertEqual({}, self.layout().unreadable)
+
+    def test_reset_forgets_the_device_layout(self):
+        self.cycle()
+        self.assertTrue(self.layout().cuts)
+        self.layouts.reset(self.hardware.get_resource_key(), 1)
+        self.assertFalse(self.layout().cuts)
+        self.layouts.clear()
+        self.assertFalse(self.layout().cuts)
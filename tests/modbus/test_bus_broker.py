@@ -0,0 +1,159 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from hardware.modbus.bus_broker import (BusBroker, BusBrokerSettings, BrokerBus, BrokerRequest, PRIORITIES,
+                                        PRIORITY_ACQUISITION, PRIORITY_UI, PRIORITY_COMMAND)
+from hardware.modbus.client_pool import ModbusClientPool
+from hardware.modbus.modbus import modbus_data_write_many
+from hardware.modbus.modbus_hardware import ModbusHardware, ModbusClientType
+from hardware.modbus.simulator import ModbusSimulator, SimulatedBus, SIMULATED_MAPS
+from modbus_fakes import FakeClient
+
+
+class RecordingBus(BrokerBus):
+    """ Answers from memory, recording the order requests reach the bus """
+
+    def __init__(self, **kwargs):
+        super().__init__("fake", {"type": "tcp", "host": "fake", "port": 502}, **kwargs)
+        self.served = []
+
+    def _transact(self, request):
+        self.served.append((request.connection, request.address))
+        return {"registers": [request.address] * request.count} if request.is_read else {}
+
+
+class BrokenPipeClient(FakeClient):
+    """ Sync client whose socket breaks on the first read """
+
+    def __init__(self):
+        super().__init__({address: address for address in range(16)})
+        self.connected = True
+        self.closed_after = []
+
+    def read_holding_registers(self, address, count, slave):
+        if not self.read_addresses:
+            self.read_addresses.append(address)
+            raise BrokenPipeError(32, "Broken pipe")
+        return super().read_holding_registers(address, count, slave)
+
+    def close(self):
+        self.closed_after.append(self.reads)
+        super().close()
+
+
+class BrokenPipeBus(BrokerBus):
+
+    def __init__(self):
+        super().__init__("fake", {"type": "tcp", "host": "fake", "port": 502})
+        self.client = BrokenPipeClient()
+
+    def _connect(self):
+        self._client = self.client
+        return self.client
+
+
+def request(connection, priority, address, op="read_holding", max_age=0.0):
+    return BrokerRequest(op, 1, address, 1, [0], PRIORITIES[priority], max_age, connection, time.monotonic() + 10)
+
+
+class BrokerSchedulingTests(unittest.TestCase):
+
+    def run_requests(self, bus, *batches):
+        """ :return: the answers of each batch, the requests of a batch are queued together """
+        async def run():
+            bus.start()
+            try:
+                return [await asyncio.gather(*(bus.transact(r) for r in batch)) for batch in batches]
+            finally:
+                await bus.stop()
+        return asyncio.run(run())
+
+    def test_priority_classes_and_round_robin(self):
+        bus = RecordingBus()
+        self.run_requests(bus, [request(1, PRIORITY_ACQUISITION, a) for a in range(3)]
+                          + [request(2, PRIORITY_ACQUISITION, 10), request(3, PRIORITY_UI, 20),
+                             request(4, PRIORITY_COMMAND, 30)])
+        self.assertEqual([(4, 30), (3, 20), (1, 0), (2, 10), (1, 1), (1, 2)], bus.served)
+
+    def test_starved_request_goes_first(self):
+        bus = RecordingBus(max_wait=1.0)
+        starved = request(1, PRIORITY_ACQUISITION, 0)
+        starved.enqueued -= 2.0
+        self.run_requests(bus, [starved, request(2, PRIORITY_UI, 10)])
+        self.assertEqual([(1, 0), (2, 10)], bus.served)
+
+    def test_cache_coalescing_and_write_invalidation(self):
+        bus = RecordingBus()
+        shared, [cached], _, [reread] = self.run_requests(
+            bus, [request(1, PRIORITY_ACQUISITION, 5), request(2, PRIORITY_ACQUISITION, 5)],
+            [request(3, PRIORITY_UI, 5, max_age=2.0)], [request(1, PRIORITY_COMMAND, 5, op="write_register")],
+            [request(3, PRIORITY_UI, 5, max_age=2.0)])
+        self.assertEqual([{"registers": [5]}] * 2, shared)
+        self.assertEqual((1, 1), (bus.coalesced, bus.cache_hits))
+        self.assertTrue(cached["cached"])
+        # The write dropped the cached register
+        self.assertNotIn("cached", reread)
+        self.assertEqual(3, len(bus.served))
+
+    def test_bus_survives_a_broken_connection(self):
+        bus = BrokenPipeBus()
+        [[broken], [answered]] = self.run_requests(bus, [request(1, PRIORITY_ACQUISITION, 5)],
+                                                   [request(1, PRIORITY_ACQUISITION, 5)])
+        self.assertIn("Broken pipe", broken["error"])
+        # Closed after the broken read to reconnect, then when the bus stopped
+        self.assertEqual([1, 2], bus.client.closed_after)
+        self.assertEqual({"registers": [5]}, answered)
+
+    def test_unexpected_failure_does_not_end_the_worker(self):
+        bus = RecordingBus()
+        bus._transact = lambda r: 1 / 0 if r.address == 0 else {"registers": [r.address]}
+        [[failed, answered]] = self.run_requests(bus, [request(1, PRIORITY_ACQUISITION, 0),
+                                                       request(2, PRIORITY_ACQUISITION, 7)])
+        self.assertIn("division", failed["error"])
+        self.assertEqual({"registers": [7]}, answered)
+
+
+class BrokerClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.bus = SimulatedBus.from_map("esslix")
+        self.simulator = ModbusSimulator.tcp(self.bus).start()
+        self.broker = BusBroker(os.path.join(self.tmp, "broker.sock")).start()
+        self.hardware = ModbusHardware(client_type=ModbusClientType.TCP, host=self.simulator.host,
+                                       port=self.simulator.port, modbus_map_path=str(SIMULATED_MAPS["esslix"]),
+                                       adaptive_blocks=False)
+        self.registers = list(self.hardware.modbus_map.registers)
+
+    def tearDown(self):
+        ModbusClientPool().close_all()
+        BusBrokerSettings().configure(None)
+        self.broker.stop()
+        self.simulator.stop()
+        shutil.rmtree(self.tmp)
+
+    def acquire(self):
+        return self.hardware.data_acquisition([{"slave_id": 1, "mac": "bms"}], self.registers, None)["bms"]
+
+    def test_reads_and_writes_through_the_broker(self):
+        direct = self.acquire()
+        BusBrokerSettings().configure(self.broker.socket_path, PRIORITY_ACQUISITION)
+        self.assertEqual(direct, self.acquire())
+        self.assertEqual(1, len(self.broker.buses))
+
+        name = next(name for name, r in self.hardware.modbus_map.registers.items() if r.access == "RW")
+        result = modbus_data_write_many(self.hardware, self.hardware.modbus_map, 1, {name: 7}, verify=True)
+        self.assertTrue(result.success, result.to_dict())
+
+    def test_ui_reads_are_served_from_the_cache(self):
+        BusBrokerSettings().configure(self.broker.socket_path, PRIORITY_ACQUISITION)
+        values = self.acquire()
+        ModbusClientPool().close_all()
+        BusBrokerSettings().configure(self.broker.socket_path, PRIORITY_UI, max_age=5.0)
+        requests = self.bus.requests
+        self.assertEqual(values, self.acquire())
+        self.assertEqual(requests, self.bus.requests)
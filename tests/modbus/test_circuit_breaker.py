@@ -0,0 +1,79 @@
+import time
+import unittest
+
+from hardware.device_health import CircuitBreaker, BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN
+from hardware.modbus.client_pool import ModbusClientPool
+from hardware.modbus.modbus_hardware import modbus_data_acquisition
+from hardware.modbus.modbus_map import ModbusRegister
+from modbus_fakes import FakeClient
+
+
+class FakeHardware:
+    port = "/dev/null"
+    max_read_gap = 0
+    max_read_registers = 125
+    adaptive_blocks = False
+    modbus_map = None
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_resource_key(self):
+        return f"fake:{id(self.client)}"
+
+    def client_settings(self):
+        return id(self.client),
+
+    def get_modbus_client(self):
+        return self.client
+
+    def reset_hardware(self):
+        pass
+
+
+REGISTERS = [ModbusRegister(f"r{i}", i, "uint16") for i in range(10)]
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def tearDown(self):
+        ModbusClientPool().close_all()
+
+    def test_opens_after_threshold_and_probes_after_backoff(self):
+        breaker = CircuitBreaker(failure_threshold=2, base_backoff=10.0, max_backoff=15.0)
+        self.assertFalse(breaker.record_failure(now=0.0))
+        self.assertTrue(breaker.record_failure(now=0.0))
+        self.assertEqual(BREAKER_OPEN, breaker.state)
+        self.assertFalse(breaker.allow_request(now=5.0))
+        self.assertTrue(breaker.allow_request(now=10.0))
+        self.assertEqual(BREAKER_HALF_OPEN, breaker.state)
+
+        # A failed probe re-opens immediately with a longer (capped) backoff
+        self.assertTrue(breaker.record_failure(now=10.0))
+        self.assertEqual(25.0, breaker.retry_at)
+        breaker.allow_request(now=25.0)
+        breaker.record_success()
+        self.assertEqual(BREAKER_CLOSED, breaker.state)
+        self.assertEqual({"breaker_state": 0, "consecutive_failures": 0, "breaker_trips": 2}, breaker.status())
+
+    def test_dead_slave_aborts_remaining_registers(self):
+        client = FakeClient({})
+        breaker = CircuitBreaker(failure_threshold=3)
+        output = modbus_data_acquisition(FakeHardware(client), REGISTERS, 1, breaker=breaker)
+        self.assertEqual({}, output)
+        self.assertEqual(3, client.reads)
+        self.assertTrue(breaker.is_open)
+
+    def test_exception_responses_keep_breaker_closed(self):
+        client = FakeClient({i: None for i in range(10)})
+        client.values[9] = 42
+        breaker = CircuitBreaker(failure_threshold=3)
+        output = modbus_data_acquisition(FakeHardware(client), REGISTERS, 1, breaker=breaker)
+        self.assertEqual({"r9": 42}, output)
+        self.assertEqual(BREAKER_CLOSED, breaker.state)
+
+    def test_deadline_stops_reading(self):
+        client = FakeClient({i: i for i in range(10)})
+        output = modbus_data_acquisition(FakeHardware(client), REGISTERS, 1, deadline=time.monotonic() - 1)
+        self.assertEqual({}, output)
+        self.assertEqual(0, client.reads)
@@ -0,0 +1,118 @@
+import asyncio
+import unittest
+
+from hardware.modbus.client_pool import ModbusClientPool, AsyncModbusClientPool
+from hardware.modbus.modbus_hardware import ModbusHardware, ModbusClientType
+from hardware.modbus.simulator import SIMULATED_MAPS
+from modbus_fakes import FakeClient, FakeAsyncClient
+
+
+class FakeHardware:
+    def __init__(self, key: str = "tcp:10.0.0.2:502", settings: tuple = ("tcp",), pipeline_window: int = 1):
+        self.key = key
+        self.settings = settings
+        self.pipeline_window = pipeline_window
+        self.clients = []
+        self.windows = []
+
+    def get_resource_key(self):
+        return self.key
+
+    def client_settings(self):
+        return self.settings
+
+    def get_modbus_client(self):
+        self.clients.append(FakeClient())
+        return self.clients[-1]
+
+    def get_async_modbus_client(self, window=None):
+        self.windows.append(window)
+        self.clients.append(FakeAsyncClient())
+        return self.clients[-1]
+
+    def reset_hardware(self):
+        pass
+
+
+class ModbusClientPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ModbusClientPool()
+        self.pool.close_all()
+
+    def tearDown(self):
+        self.pool.close_all()
+
+    def test_connection_is_reused_across_calls(self):
+        hardware = FakeHardware()
+        for _ in range(5):
+            with self.pool.connection(hardware) as pooled:
+                self.assertTrue(pooled.client.connected)
+        self.assertEqual(1, len(hardware.clients))
+        self.assertEqual(1, hardware.clients[0].connects)
+
+    def test_reconnects_after_error(self):
+        hardware = FakeHardware()
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection(hardware):
+                raise RuntimeError("broken pipe")
+        with self.pool.connection(hardware) as pooled:
+            self.assertTrue(pooled.client.connected)
+        self.assertEqual(2, hardware.clients[0].connects)
+        self.assertEqual(1, pooled.resets)
+
+    def test_settings_change_replaces_client(self):
+        with self.pool.connection(FakeHardware(settings=("rtu", 9600))):
+            pass
+        other = FakeHardware(settings=("rtu", 19200))
+        with self.pool.connection(other) as pooled:
+            self.assertIs(other.clients[0], pooled.client)
+
+    def test_pipeline_window_does_not_split_the_sync_client(self):
+        gateway = [ModbusHardware(client_type=ModbusClientType.TCP, host="10.0.0.2", port=502, pipeline_window=window,
+                                  modbus_map_path=str(SIMULATED_MAPS["esslix"])) for window in (1, 4)]
+        self.assertEqual(gateway[0].client_settings(), gateway[1].client_settings())
+
+    def test_idle_connection_is_reopened(self):
+        hardware = FakeHardware()
+        with self.pool.connection(hardware) as pooled:
+            pass
+        pooled.last_used -= self.pool.max_idle + 1
+        with self.pool.connection(hardware):
+            pass
+        self.assertEqual(2, hardware.clients[0].connects)
+
+
+class AsyncModbusClientPoolTests(unittest.TestCase):
+
+    def tearDown(self):
+        AsyncModbusClientPool().close_all()
+
+    def test_client_is_bound_to_its_event_loop(self):
+        hardware = FakeHardware()
+        pool = AsyncModbusClientPool()
+
+        async def acquire():
+            for _ in range(3):
+                async with pool.connection(hardware) as pooled:
+                    self.assertTrue(pooled.client.connected)
+
+        asyncio.run(acquire())
+        self.assertEqual(1, len(hardware.clients))
+        asyncio.run(acquire())
+        self.assertEqual(2, len(hardware.clients))
+
+    def test_resource_gets_the_largest_pipeline_window(self):
+        plain, pipelined = FakeHardware(), FakeHardware(pipeline_window=4)
+        pool = AsyncModbusClientPool()
+
+        async def acquire():
+            for _ in range(3):
+                for hardware in (plain, pipelined):
+                    async with pool.connection(hardware):
+                        pass
+
+        asyncio.run(acquire())
+        # Replaced once when the larger window shows up, then shared
+        self.assertEqual([1], plain.windows)
+        self.assertEqual([4], pipelined.windows)
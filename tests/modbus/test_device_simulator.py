@@ -0,0 +1,47 @@
+import unittest
+
+from hardware.modbus.client_pool import ModbusClientPool
+from hardware.modbus.modbus_hardware import ModbusHardware, ModbusClientType
+from hardware.modbus.simulator import ModbusSimulator, SimulatedBus, SIMULATED_MAPS
+
+
+class DeviceSimulatorTests(unittest.TestCase):
+
+    def tearDown(self):
+        ModbusClientPool().close_all()
+
+    def acquire(self, simulator: ModbusSimulator, client_type: ModbusClientType) -> dict:
+        hardware = ModbusHardware(client_type=client_type, host=simulator.host, port=simulator.port,
+                                  baudrate=115200, modbus_map_path=str(SIMULATED_MAPS["esslix"]))
+        devices = [{"slave_id": s, "mac": f"sim-{s}"} for s in (1, 2)]
+        return hardware.data_acquisition(devices, ["Pack_Voltage", "SOC", "Current"], None)
+
+    def check_values(self, output: dict):
+        for values in output.values():
+            self.assertTrue(11.5 <= values["Pack_Voltage"] <= 58.0)
+            self.assertTrue(20 <= values["State_of_Charge"] <= 100)
+        # Every slave has its own values
+        self.assertNotEqual(output["sim-1"], output["sim-2"])
+
+    def test_tcp_serves_the_register_map(self):
+        bus = SimulatedBus.from_map("esslix", slave_ids=(1, 2))
+        with ModbusSimulator.tcp(bus) as simulator:
+            self.check_values(self.acquire(simulator, ModbusClientType.TCP))
+        self.assertGreaterEqual(bus.requests, 2)
+
+    def test_rtu_serves_the_register_map(self):
+        bus = SimulatedBus.from_map("esslix", slave_ids=(1, 2), baudrate=115200)
+        with ModbusSimulator.rtu(bus) as simulator:
+            self.check_values(self.acquire(simulator, ModbusClientType.RTU))
+
+    def test_strict_device_refuses_unmapped_addresses(self):
+        bus = SimulatedBus.from_map("renogy", strict=True)
+        device = bus.devices[1]
+        address = min(device.tables["holding"])
+        self.assertIsNotNone(device.read("holding", address, 1))
+        self.assertIsNone(device.read("holding", max(device.tables["holding"]) + 1, 2))
+
+    def test_transaction_time_models_the_serial_link(self):
+        bus = SimulatedBus({}, latency=0.01, baudrate=9600)
+        # 8 byte request and a 9 byte response of 10 bits at 9600 baud
+        self.assertAlmostEqual(0.01 + 170 / 9600, bus.transaction_time(8, 9))
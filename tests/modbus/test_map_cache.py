@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from hardware.modbus.map_cache import ModbusMapCache
+from hardware.modbus.modbus_map import ModbusMap, ModbusRegisterType
+
+TRISTAR_MAP = Path(__file__).parents[2] / "data" / "MorningStar" / "tristar_v11_modbus_map.json"
+
+
+class ModbusMapCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.map_path = os.path.join(self.tmp, "map.json")
+        shutil.copy(TRISTAR_MAP, self.map_path)
+        self.cache = ModbusMapCache()
+        self.cache.clear()
+        self.cache.cache_dir = None
+
+    def tearDown(self):
+        self.cache.clear()
+        self.cache.cache_dir = None
+        shutil.rmtree(self.tmp)
+
+    def test_map_is_shared_until_the_file_changes(self):
+        first = self.cache.load(self.map_path)
+        self.assertIs(first, self.cache.load(self.map_path))
+        stat = os.stat(self.map_path)
+        os.utime(self.map_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertIsNot(first, self.cache.load(self.map_path))
+
+    def test_compiled_map_is_reloaded_from_disk(self):
+        self.cache.cache_dir = os.path.join(self.tmp, "compiled")
+        parsed = self.cache.load(self.map_path)
+        self.cache.clear()
+        loaded = self.cache.load(self.map_path)
+        self.assertIsNot(parsed, loaded)
+        self.assertEqual(parsed.registers, loaded.registers)
+        self.assertEqual(1, len(os.listdir(self.cache.cache_dir)))
+
+    def test_resolve_and_address_index(self):
+        modbus_map = ModbusMap.from_json(str(TRISTAR_MAP))
+        names = ["Charging_Current", "Battery_Voltage", "missing"]
+        self.assertIs(modbus_map.resolve(names), modbus_map.resolve(list(names)))
+        self.assertEqual(["Charging_Current", "Battery_Voltage"], [r.name for r in modbus_map.resolve(names)])
+        self.assertEqual(len(modbus_map.registers), len(list(modbus_map.register_iterator())))
+        self.assertEqual(["Array_Voltage", "Charging_Current", "Array_Current"],
+                         [r.name for r in modbus_map.registers_between(27, 30, ModbusRegisterType.HOLDING)])
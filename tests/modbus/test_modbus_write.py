@@ -0,0 +1,40 @@
+import unittest
+
+from hardware.modbus.client_pool import ModbusClientPool
+from hardware.modbus.modbus import modbus_data_write_many, plan_writes
+from hardware.modbus.modbus_hardware import ModbusHardware, ModbusClientType
+from hardware.modbus.simulator import ModbusSimulator, SimulatedBus, SIMULATED_MAPS
+
+
+class ModbusWriteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = SimulatedBus.from_map("esslix", strict=True)
+        self.simulator = ModbusSimulator.tcp(self.bus).start()
+        self.hardware = ModbusHardware(client_type=ModbusClientType.TCP, host=self.simulator.host,
+                                       port=self.simulator.port, modbus_map_path=str(SIMULATED_MAPS["esslix"]))
+
+    def tearDown(self):
+        ModbusClientPool().close_all()
+        self.simulator.stop()
+
+    def write(self, values, verify=True):
+        return modbus_data_write_many(self.hardware, self.hardware.modbus_map, 1, values, verify=verify)
+
+    def test_contiguous_registers_are_written_together_and_verified(self):
+        values = {"Pack OV Alarm": 5600, "Pack OV Protection": 5700, "Pack OV Release": 5500,
+                  "Charging OT Alarm": -5, "Balance Start Voltage": 3400}
+        result = self.write(values)
+        self.assertTrue(result.success, result.to_dict())
+        self.assertEqual(set(values), {name for name, ok in result.verified.items() if ok})
+        # One FC16 for 60..62 and one FC06 each for 84 and 105, the read-back coalesces the same way
+        holding = self.bus.devices[1].tables["holding"]
+        self.assertEqual([5600, 5700, 5500, 0xFFFB], [holding[a] for a in (60, 61, 62, 84)])
+        self.assertEqual(6, self.bus.requests)
+        self.assertEqual(3, len(plan_writes([(self.hardware.modbus_map.registers[name], 0, 1) for name in values])))
+
+    def test_nothing_is_written_when_a_register_is_refused(self):
+        result = self.write({"Pack OV Alarm": 1, "Current": 5, "Pack OV Delay": 300})
+        self.assertFalse(result.success)
+        self.assertEqual({"Current", "Pack OV Delay"}, set(result.errors))
+        self.assertEqual(0, self.bus.requests)
@@ -0,0 +1,80 @@
+import asyncio
+import struct
+import unittest
+
+from hardware.modbus.pipelined_client import PipelinedModbusTcpClient, MBAP_HEADER
+
+
+class FakeGateway:
+    """
+    Modbus TCP server answering FC3 with register value = address.  Requests are collected until `batch`
+    are pending and answered in reverse order; with drop_queued only the first of a batch is answered.
+    """
+
+    def __init__(self, batch: int = 1, drop_queued: bool = False):
+        self.batch = batch
+        self.drop_queued = drop_queued
+        self.max_pending = 0
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        pending = []
+        try:
+            while True:
+                try:
+                    header = await asyncio.wait_for(reader.readexactly(MBAP_HEADER.size), 0.05)
+                except asyncio.TimeoutError:
+                    header = None
+                if header:
+                    tid, _, length, unit = MBAP_HEADER.unpack(header)
+                    _, address, count = struct.unpack(">BHH", await reader.readexactly(length - 1))
+                    pending.append((tid, unit, address, count))
+                    self.max_pending = max(self.max_pending, len(pending))
+                if pending and (len(pending) >= self.batch or header is None):
+                    answered = pending[:1] if self.drop_queued else reversed(pending)
+                    for tid, unit, address, count in answered:
+                        pdu = struct.pack(f">BB{count}H", 3, 2 * count, *range(address, address + count))
+                        writer.write(MBAP_HEADER.pack(tid, 0, len(pdu) + 1, unit) + pdu)
+                    pending = []
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+
+class PipelinedClientTests(unittest.TestCase):
+
+    def run_reads(self, gateway: FakeGateway, window: int, reads: int = 4, timeout: float = 1.0):
+        async def scenario():
+            port = await gateway.start()
+            client = PipelinedModbusTcpClient("127.0.0.1", port, window=window, timeout=timeout)
+            try:
+                return client, await asyncio.gather(*(client.read_holding_registers(10 * i, 2, slave=1)
+                                                      for i in range(reads)))
+            finally:
+                client.close()
+                gateway.server.close()
+
+        return asyncio.run(scenario())
+
+    def test_out_of_order_responses_are_matched(self):
+        gateway = FakeGateway(batch=4)
+        client, responses = self.run_reads(gateway, window=4)
+        self.assertEqual([[10 * i, 10 * i + 1] for i in range(4)], [r.registers for r in responses])
+        self.assertEqual(4, gateway.max_pending)
+        self.assertFalse(client.downgraded)
+
+    def test_window_limits_requests_in_flight(self):
+        gateway = FakeGateway(batch=8)
+        client, responses = self.run_reads(gateway, window=2, reads=6)
+        self.assertEqual(6, len(responses))
+        self.assertEqual(2, client.max_in_flight)
+
+    def test_falls_back_when_gateway_drops_pipelined_requests(self):
+        gateway = FakeGateway(batch=2, drop_queued=True)
+        client, responses = self.run_reads(gateway, window=4, timeout=0.3)
+        self.assertTrue(client.downgraded)
+        self.assertEqual(1, client.window)
+        self.assertEqual([[10 * i, 10 * i + 1] for i in range(4)], [r.registers for r in responses])
@@ -0,0 +1,62 @@
+import unittest
+from pathlib import Path
+
+from hardware.modbus.modbus_map import ModbusMap, ModbusRegister, ModbusRegisterType
+from hardware.modbus.read_planner import plan_reads, split_block
+
+DATA_PATH = Path(__file__).parents[2] / "data"
+
+
+def register(name: str, address: int, range_size: int = 1, **kwargs) -> ModbusRegister:
+    return ModbusRegister(name, address, "uint16", range_size=range_size, **kwargs)
+
+
+class ReadPlannerTests(unittest.TestCase):
+
+    def test_contiguous_registers_are_merged(self):
+        blocks = plan_reads([register("c", 2), register("a", 0), register("b", 1, range_size=1)])
+        self.assertEqual(1, len(blocks))
+        self.assertEqual((0, 3), (blocks[0].start, blocks[0].count))
+
+    def test_gap_allowance(self):
+        registers = [register("a", 0), register("b", 3), register("c", 20)]
+        self.assertEqual(3, len(plan_reads(registers, max_gap=0)))
+        blocks = plan_reads(registers, max_gap=2)
+        self.assertEqual([(0, 4), (20, 1)], [(b.start, b.count) for b in blocks])
+
+    def test_block_size_limit(self):
+        registers = [register(f"r{i}", i) for i in range(300)]
+        blocks = plan_reads(registers)
+        self.assertEqual([125, 125, 50], [b.count for b in blocks])
+
+    def test_grouped_by_slave_and_type(self):
+        registers = [register("a", 0), register("b", 1, type="input"), register("c", 2, slave_id=3),
+                     register("d", 3)]
+        blocks = plan_reads(registers, max_gap=4)
+        self.assertEqual({(None, ModbusRegisterType.HOLDING): ["a", "d"],
+                          (None, ModbusRegisterType.INPUT): ["b"],
+                          (3, ModbusRegisterType.HOLDING): ["c"]},
+                         {(b.slave_id, b.register_type): [r.name for r in b.registers] for b in blocks})
+
+    def test_slice_and_split(self):
+        serial = register("serial", 5, range_size=3)
+        block = plan_reads([register("a", 4), serial])[0]
+        self.assertEqual([11, 12, 13], block.slice([10, 11, 12, 13], serial))
+        self.assertEqual([(4, 1), (5, 3)], [(b.start, b.count) for b in split_block(block)])
+
+    def test_tristar_map_transactions(self):
+        modbus_map = ModbusMap.from_json(str(DATA_PATH / "MorningStar" / "tristar_v11_modbus_map.json"))
+        registers = list(modbus_map.registers.values())
+        blocks = plan_reads(registers, max_gap=4)
+        self.assertLessEqual(len(blocks) * 5, len(registers))
+        covered = {r.name for b in blocks for r in b.registers}
+        self.assertEqual({r.name for r in registers}, covered)
+
+    def test_map_index_gives_the_same_blocks(self):
+        modbus_map = ModbusMap.from_json(str(DATA_PATH / "MorningStar" / "tristar_v11_modbus_map.json"))
+        registers = modbus_map.resolve()[::2]
+        planned = plan_reads(registers, max_gap=4, modbus_map=modbus_map)
+        self.assertEqual(plan_reads(registers, max_gap=4), planned)
+        # Registers that are not the map's are planned without the index
+        foreign = registers + [register("x", 9000)]
+        self.assertEqual(plan_reads(foreign, max_gap=4), plan_reads(foreign, max_gap=4, modbus_map=modbus_map))
@@ -0,0 +1,63 @@
+import unittest
+
+from hardware.modbus.client_pool import ModbusClientPool
+from hardware.modbus.modbus_hardware import ModbusHardware, ModbusClientType
+from hardware.modbus.simulator import ModbusSimulator, SimulatedBus, SIMULATED_MAPS
+from hardware.modbus.transaction_stats import (ModbusTransactionStats, LatencyHistogram, TransactionKey,
+                                               telemetry_measurement)
+
+
+class LatencyHistogramTests(unittest.TestCase):
+
+    def test_percentiles_are_bucket_bounds(self):
+        histogram = LatencyHistogram()
+        for ms in [0.5] * 90 + [15.0] * 9 + [700.0]:
+            histogram.add(ms)
+        self.assertEqual(1, histogram.percentile(0.5))
+        self.assertEqual(20, histogram.percentile(0.95))
+        self.assertEqual(700.0, histogram.percentile(1.0))
+        self.assertAlmostEqual((45 + 135 + 700) / 100, histogram.mean_ms)
+
+
+class TransactionStatsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = ModbusTransactionStats()
+        self.stats.clear()
+
+    def tearDown(self):
+        ModbusClientPool().close_all()
+        self.stats.clear()
+
+    def test_refused_gap_is_traced_with_its_exception_and_retry(self):
+        # The Renogy daily registers 0x10F, 0x111 and 0x113 are read as one block, a strict device refuses the gaps
+        bus = SimulatedBus.from_map("renogy", strict=True)
+        with ModbusSimulator.tcp(bus) as simulator:
+            hardware = ModbusHardware(client_type=ModbusClientType.TCP, host=simulator.host, port=simulator.port,
+                                      modbus_map_path=str(SIMULATED_MAPS["renogy"]))
+            values = hardware.data_acquisition([{"slave_id": 1, "mac": "rover"}], [
+                "Daily_Max_Charging_Power", "Daily_Charging_AH", "Daily_Power_Generation"], None)
+        self.assertEqual(3, len(values["rover"]))
+
+        rows = {(row["start"], row["count"]): row for row in self.stats.summary()}
+        block = rows[(0x10F, 5)]
+        self.assertEqual((1, 1, 1, 0), (block["requests"], block["exceptions"], block["retries"], block["timeouts"]))
+        self.assertEqual({"02": 1}, block["exception_codes"])
+        self.assertEqual("read_holding", block["function"])
+        for start in (0x10F, 0x111, 0x113):
+            self.assertEqual(0, rows[(start, 1)]["exceptions"])
+
+        measurement = telemetry_measurement(self.stats.take_window())
+        self.assertIn("1/fc3/271+5", measurement[hardware.get_resource_key()])
+        self.assertEqual({}, self.stats.take_window())
+
+    def test_timeouts_and_key_limit(self):
+        self.stats.max_keys = 1
+        try:
+            self.stats.record(TransactionKey("serial:/dev/ttyS1", 1, 3, 0, 10), 0.2, False)
+            self.stats.record(TransactionKey("serial:/dev/ttyS1", 2, 3, 0, 10), 0.01, True)
+        finally:
+            self.stats.max_keys = 1024
+        [row] = self.stats.summary()
+        self.assertEqual((1, 1, 0.0), (row["requests"], row["timeouts"], row["max_ms"]))
+        self.assertEqual(2, self.stats.dropped)
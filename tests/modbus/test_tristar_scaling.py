@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+from pathlib import Path
+
+from hardware.modbus.client_pool import ModbusClientPool, AsyncModbusClientPool
+from hardware.modbus.simulator import ModbusSimulator, SimulatedBus, SIMULATED_MAPS
+from hardware.modbus.tristar import Tristar
+from modbus_fakes import FakeClient
+
+DATA_PATH = Path(__file__).parents[2] / "data"
+
+# V_PU = 180 + 0.5, I_PU = 80
+VALUES = {0: 180, 1: 0x8000, 2: 80, 3: 0, 24: 13000, 28: 4000, 35: 25}
+# The other registers of the map read 0
+REGISTER_SPACE = 256
+
+
+class TristarScalingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient({a: VALUES.get(a, 0) for a in range(REGISTER_SPACE)})
+        self.tristar = Tristar(host="10.0.0.9", port=502,
+                               modbus_map_path=str(DATA_PATH / "MorningStar" / "tristar_v11_modbus_map.json"))
+        self.tristar.get_modbus_client = lambda: self.client
+        self.devices = [{"slave_id": 1, "mac": "tristar-1"}]
+        self.registers = ["Battery_Voltage", "Charging_Current", "T_hs"]
+
+    def tearDown(self):
+        ModbusClientPool().close_all()
+
+    def acquire(self):
+        return self.tristar.data_acquisition(self.devices, self.registers, None)["tristar-1"]
+
+    def test_scaling_is_folded_into_decoding(self):
+        values = self.acquire()
+        v_pu = 180 + 0x8000 * Tristar.TWO_NEG_16
+        self.assertAlmostEqual(13000 * v_pu * Tristar.TWO_NEG_15, values["Battery_Voltage"], places=9)
+        self.assertAlmostEqual(4000 * 80 * Tristar.TWO_NEG_15, values["Charging_Current"], places=9)
+        self.assertEqual(25.0, values["Heatsink_Temperature"])
+
+    def test_scaling_is_read_once(self):
+        for _ in range(3):
+            self.acquire()
+        self.assertEqual(1, self.client.read_addresses.count(0))
+
+    def test_scaling_is_re_read_after_reconnect_and_expiry(self):
+        self.acquire()
+        self.client.close()
+        self.acquire()
+        self.assertEqual(2, self.client.read_addresses.count(0))
+        self.tristar.scaling_ttl = 0.0
+        self.acquire()
+        self.assertEqual(3, self.client.read_addresses.count(0))
+
+
+class TristarPathTests(unittest.TestCase):
+
+    def test_async_path_reads_like_the_sync_path(self):
+        simulator = ModbusSimulator.tcp(SimulatedBus.from_map("tristar")).start()
+        try:
+            tristar = Tristar(host=simulator.host, port=simulator.port,
+                              modbus_map_path=str(SIMULATED_MAPS["tristar"]))
+            devices = [{"slave_id": 1, "mac": "tristar-1"}]
+            registers = ["Battery_Voltage", "Charging_Current", "T_hs"]
+            expected = tristar.data_acquisition(devices, registers, None)
+            self.assertEqual(3, len(expected["tristar-1"]))
+
+            async def acquire():
+                try:
+                    return await tristar.async_data_acquisition(devices, registers, None)
+                finally:
+                    # The async clients are bound to this loop
+                    AsyncModbusClientPool().close_all()
+            self.assertEqual(expected, asyncio.run(acquire()))
+        finally:
+            ModbusClientPool().close_all()
+            simulator.stop()
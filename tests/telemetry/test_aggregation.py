@@ -0,0 +1,99 @@
+import math
+import random
+import statistics
+import unittest
+
+from telemetry.aggregation import ColumnarAggregator, average_synchronized_samples
+from telemetry.streaming_aggregation import (StreamingAggregator, BufferedAggregator, P2Quantile,
+                                             create_window_aggregator)
+
+
+def make_samples(n_samples: int, n_devices: int = 3, n_points: int = 10, seed: int = 7):
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(n_samples):
+        bms = {f"dev{d}": {f"p{p}": rng.randint(0, 5) if p % 2 else rng.uniform(-10, 10)
+                           for p in range(n_points)} for d in range(n_devices)}
+        bms["dev0"]["Model_SN"] = "ESSLIX 1234"
+        samples.append({"BMS": {"hw1": bms}, "PV": {"ct": {"ct1": {"Current": rng.uniform(0, 50)}}}})
+    return samples
+
+
+class ColumnarAggregatorTests(unittest.TestCase):
+
+    def assert_same(self, expected: dict, actual: dict):
+        self.assertEqual(expected.keys(), actual.keys())
+        for system in expected:
+            self.assertEqual(expected[system].keys(), actual[system].keys())
+            for hardware_id in expected[system]:
+                self.assertEqual(expected[system][hardware_id].keys(), actual[system][hardware_id].keys())
+                for device_id, points in expected[system][hardware_id].items():
+                    self.assertEqual(points.keys(), actual[system][hardware_id][device_id].keys())
+                    for point, value in points.items():
+                        self.assertTrue(math.isclose(value, actual[system][hardware_id][device_id][point],
+                                                     rel_tol=1e-9, abs_tol=1e-9), f"{point}: {value}")
+
+    def test_matches_reference(self):
+        samples = make_samples(5)
+        aggregator = ColumnarAggregator()
+        for method in ["mean", "median", "mode", "min", "max", "std", "last"]:
+            self.assert_same(average_synchronized_samples(samples, method), aggregator.aggregate(samples, method))
+
+    def test_missing_points_and_devices(self):
+        samples = make_samples(4)
+        del samples[1]["BMS"]["hw1"]["dev2"]
+        del samples[2]["BMS"]["hw1"]["dev1"]["p3"]
+        samples[3]["BMS"]["hw1"]["dev1"]["p4"] = None
+        samples[0]["BMS"]["hw2"] = {"devX": {"v": 1.0}}
+        aggregator = ColumnarAggregator()
+        for method in ["mean", "last"]:
+            self.assert_same(average_synchronized_samples(samples, method), aggregator.aggregate(samples, method))
+
+    def test_non_numeric_points_are_dropped(self):
+        result = ColumnarAggregator().aggregate(make_samples(2))
+        self.assertNotIn("Model_SN", result["BMS"]["hw1"]["dev0"])
+
+    def test_point_index_is_stable_across_cycles(self):
+        aggregator = ColumnarAggregator()
+        aggregator.aggregate(make_samples(3))
+        index = dict(aggregator.point_index(("BMS", "hw1", "dev1")))
+        aggregator.aggregate(make_samples(6, seed=3))
+        self.assertEqual(index, aggregator.point_index(("BMS", "hw1", "dev1")))
+
+    def test_empty(self):
+        self.assertEqual({}, ColumnarAggregator().aggregate([]))
+
+
+class StreamingAggregatorTests(unittest.TestCase):
+
+    def test_matches_columnar_for_exact_statistics(self):
+        samples = make_samples(12)
+        columnar = ColumnarAggregator()
+        for method in ["mean", "min", "max", "std", "last"]:
+            streaming = StreamingAggregator(f"streaming_{method}")
+            for sample in samples:
+                streaming.add(sample)
+            expected = columnar.aggregate(samples, method)
+            actual = streaming.result()
+            for device_id, points in expected["BMS"]["hw1"].items():
+                for point, value in points.items():
+                    self.assertAlmostEqual(value, actual["BMS"]["hw1"][device_id][point], places=9)
+
+    def test_median_estimate(self):
+        rng = random.Random(1)
+        values = [rng.gauss(50.0, 5.0) for _ in range(2000)]
+        estimator = P2Quantile(0.5)
+        for value in values:
+            estimator.add(value)
+        self.assertAlmostEqual(statistics.median(values), estimator.value(), delta=0.5)
+
+    def test_median_exact_for_few_samples(self):
+        estimator = P2Quantile(0.5)
+        for value in [3.0, 1.0, 2.0, 10.0]:
+            estimator.add(value)
+        self.assertEqual(2.5, estimator.value())
+
+    def test_window_factory(self):
+        columnar = ColumnarAggregator("mean")
+        self.assertIsInstance(create_window_aggregator("streaming_median", columnar), StreamingAggregator)
+        self.assertIsInstance(create_window_aggregator(None, columnar), BufferedAggregator)
@@ -0,0 +1,46 @@
+import unittest
+
+from telemetry.deadband import Deadband, DeadbandConfig, DeadbandFilter
+
+
+def frame(voltage: float, current: float, soc: float = 50.0) -> dict:
+    return {"BMS": {"hw1": {"dev0": {"Voltage": voltage, "Current": current, "SOC": soc}}}}
+
+
+class DeadbandTests(unittest.TestCase):
+
+    def setUp(self):
+        self.configs = {"hw1": DeadbandConfig({"Voltage": Deadband(absolute=0.5)}, Deadband(percent=10.0))}
+        self.filter = DeadbandFilter(default_max_silence=None)
+
+    def reported(self, measurements: dict, now: float) -> dict:
+        return self.filter.filter("DATA", measurements, self.configs, now)["BMS"]["hw1"]["dev0"]
+
+    def test_first_frame_reports_everything(self):
+        self.assertEqual(frame(52.0, 10.0), self.filter.filter("DATA", frame(52.0, 10.0), self.configs, 0))
+        self.assertEqual(0, self.filter.last_stats["suppressed"])
+
+    def test_values_inside_band_are_suppressed(self):
+        self.reported(frame(52.0, 10.0), 0)
+        self.assertEqual({}, self.reported(frame(52.4, 10.9, 54.0), 10))
+        self.assertEqual({"Voltage": 52.6, "Current": 11.5}, self.reported(frame(52.6, 11.5, 54.0), 20))
+        self.assertEqual(3, self.filter.last_stats["points"])
+        self.assertEqual(1, self.filter.last_stats["suppressed"])
+        self.assertEqual(len("SOC") + len("54.0") + 2, self.filter.last_stats["bytes_saved"])
+
+    def test_band_is_relative_to_last_reported_value(self):
+        self.reported(frame(52.0, 10.0), 0)
+        self.reported(frame(52.3, 10.0), 10)
+        # Slow drift is reported once it adds up past the band
+        self.assertIn("Voltage", self.reported(frame(52.6, 10.0), 20))
+
+    def test_heartbeat(self):
+        self.configs["hw1"].points["Voltage"] = Deadband(absolute=0.5, max_silence=60)
+        self.reported(frame(52.0, 10.0), 0)
+        self.assertEqual({}, self.reported(frame(52.0, 10.0), 30))
+        self.assertEqual({"Voltage": 52.0}, self.reported(frame(52.0, 10.0), 60))
+
+    def test_points_without_deadband_always_reported(self):
+        self.configs["hw1"] = DeadbandConfig({"Voltage": Deadband(absolute=0.5)})
+        self.reported(frame(52.0, 10.0), 0)
+        self.assertEqual({"Current": 10.0, "SOC": 50.0}, self.reported(frame(52.0, 10.0), 10))
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import unittest
+from unittest import mock
+
+import aiomqtt
+
+from cloud import mqtt_comms
+from cloud.mqtt_comms import MqttPublisher, publish_payload
+from config.mqtt_config import MQTTConfig
+
+
+class FakeClient:
+    """ aiomqtt.Client stand-in, the broker is down while refuse is set and drops sessions on drop """
+    connects = 0
+    refuse = False
+    drop = False
+    published = []
+    last_identifier = None
+
+    def __init__(self, **kwargs):
+        FakeClient.last_identifier = kwargs.get("identifier")
+
+    async def __aenter__(self):
+        if FakeClient.refuse:
+            raise aiomqtt.MqttError("Connection refused")
+        FakeClient.connects += 1
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def publish(self, topic, payload, qos):
+        if FakeClient.drop:
+            FakeClient.drop = False
+            raise aiomqtt.MqttCodeError(4, "Could not publish message")
+        FakeClient.published.append((topic, payload.decode()))
+
+
+class MqttPublisherTests(unittest.TestCase):
+
+    def setUp(self):
+        FakeClient.connects, FakeClient.refuse, FakeClient.drop, FakeClient.published = 0, False, False, []
+        MqttPublisher.delete_instance()
+        mqtt_comms._connection_failures = mqtt_comms._last_connection_attempt = 0
+        self.config = MQTTConfig("broker", 8883, "user", "secret", "raptor-1", "line")
+        self.logger = logging.getLogger()
+
+    def tearDown(self):
+        MqttPublisher.delete_instance()
+        mqtt_comms._connection_failures = mqtt_comms._last_connection_attempt = 0
+
+    def publish(self, *payloads):
+        async def run():
+            try:
+                return await asyncio.gather(*(publish_payload(self.config, "raptor/telemetry", p, self.logger)
+                                              for p in payloads))
+            finally:
+                await MqttPublisher().close()
+        with mock.patch.object(mqtt_comms.aiomqtt, "Client", FakeClient):
+            return asyncio.run(run())
+
+    def test_one_session_for_many_publishes(self):
+        self.assertEqual([True] * 3, self.publish("a", "b", "c"))
+        self.assertEqual([("raptor/telemetry", p) for p in "abc"], FakeClient.published)
+        self.assertEqual(1, FakeClient.connects)
+
+    def test_lost_session_is_reopened_for_the_message(self):
+        FakeClient.drop = True
+        self.assertEqual([True, True], self.publish("a", "b"))
+        self.assertEqual([("raptor/telemetry", p) for p in "ab"], FakeClient.published)
+        self.assertEqual(2, FakeClient.connects)
+        self.assertEqual(0, mqtt_comms._connection_failures)
+
+    def test_broker_down_fails_fast_with_backoff(self):
+        FakeClient.refuse = True
+        self.assertEqual([False, False], self.publish("a", "b"))
+        self.assertEqual(1, mqtt_comms._connection_failures)
+        # Within the backoff the publish fails without connecting
+        FakeClient.refuse = False
+        self.assertEqual([False], self.publish("c"))
+        self.assertEqual(0, FakeClient.connects)
+
+    def test_services_do_not_share_a_client_id(self):
+        identifiers = set()
+        for service in ("iot-controller", "cmd-controller"):
+            MqttPublisher.delete_instance()
+            MqttPublisher().configure(service)
+            identifiers.add(MqttPublisher().identifier(self.config))
+        MqttPublisher.delete_instance()
+        identifiers.add(MqttPublisher().identifier(self.config))
+        self.assertEqual(3, len(identifiers))
+        self.assertNotIn(self.config.client_id, identifiers)
+        self.publish("a")
+        self.assertEqual(MqttPublisher().identifier(self.config), FakeClient.last_identifier)
@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+
+from telemetry.pipeline import TelemetryPipeline, PipelineStage, OverflowPolicy
+
+
+class PipelineTests(unittest.TestCase):
+
+    def test_items_flow_through_stages(self):
+        results = []
+
+        async def run():
+            pipeline = TelemetryPipeline([PipelineStage("double", lambda x: x * 2),
+                                          PipelineStage("blocking", lambda x: x + 1, blocking=True),
+                                          PipelineStage("collect", results.append)])
+            pipeline.start()
+            for i in range(5):
+                await pipeline.submit(i)
+            await pipeline.drain()
+            await pipeline.stop()
+            return pipeline.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual([1, 3, 5, 7, 9], results)
+        self.assertEqual(5, stats["collect"]["processed"])
+        self.assertEqual(0, stats["double"]["queue_depth"])
+
+    def test_overflow_policies(self):
+        async def run(policy):
+            stage = PipelineStage("stage", lambda x: x, maxsize=2, overflow=policy)
+            accepted = [await stage.put(i) for i in range(4)]
+            queued = [stage.queue.get_nowait() for _ in range(stage.queue.qsize())]
+            return accepted, queued, stage.dropped
+
+        self.assertEqual(([True, True, False, False], [2, 3], 2), asyncio.run(run(OverflowPolicy.DROP_OLDEST)))
+        self.assertEqual(([True, True, False, False], [0, 1], 2), asyncio.run(run(OverflowPolicy.DROP_NEWEST)))
+
+    def test_handler_errors_do_not_stop_the_stage(self):
+        results = []
+
+        async def run():
+            pipeline = TelemetryPipeline([PipelineStage("invert", lambda x: 1 / x),
+                                          PipelineStage("collect", results.append)])
+            pipeline.start()
+            for value in [1, 0, 2]:
+                await pipeline.submit(value)
+            await pipeline.drain()
+            await pipeline.stop()
+            return pipeline.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual([1.0, 0.5], results)
+        self.assertEqual(1, stats["invert"]["errors"])
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from cloud import mqtt_comms
+from config.telemetry_config import TelemetryConfig
+from telemetry.compaction import parse_line
+from database.database_migrator import DatabaseMigrator
+from database.telemetry_queue import TelemetryQueue, EVICT_DOWNSAMPLE, EVICT_OLDEST, MAX_WEIGHT
+
+
+def frame(cycle: int, points: int = 40) -> dict:
+    rng = random.Random(cycle)
+    lines = [f"BMS,raptor=r1,hardware_id=1,device_id={d} SOC={rng.uniform(20, 90):.2f},"
+             f"Voltage={rng.uniform(48, 56):.3f} {1700000000000000000 + cycle * 10 ** 10}" for d in range(points)]
+    return {"mode": "line_protocol", "data": lines}
+
+
+class TelemetryQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, "raptor.db")
+        TelemetryQueue.delete_instance()
+
+    def tearDown(self):
+        TelemetryQueue.delete_instance()
+        shutil.rmtree(self.tmp)
+
+    def queue(self, max_bytes: int = 10 ** 9, eviction: str = EVICT_OLDEST) -> TelemetryQueue:
+        return TelemetryQueue(self.db_path, max_bytes, eviction)
+
+    def test_frames_are_compressed_and_legacy_rows_moved(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE telemetry_data (id INTEGER PRIMARY KEY, data TEXT, "
+                     "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+        conn.execute("INSERT INTO telemetry_data (data, timestamp) VALUES (?, '2024-05-01 10:00:00')",
+                     (json.dumps(frame(0)),))
+        conn.commit()
+        conn.close()
+
+        queue = self.queue()
+        queue.put(frame(1), created_at=1714557610.0)
+        newest, legacy = queue.read_all()
+        self.assertEqual(dict(frame(1), timestamp="2024-05-01 10:00:10"), newest)
+        self.assertEqual(dict(frame(0), timestamp="2024-05-01 10:00:00"), legacy)
+        self.assertEqual((2, 80), (queue.frames, queue.lines))
+        self.assertLess(queue.bytes, len(json.dumps([frame(0), frame(1)])) / 2)
+
+        queue.clear()
+        self.assertEqual({"frames": 0, "bytes": 0, "oldest_age_s": 0.0},
+                         {k: queue.stats()[k] for k in ("frames", "bytes", "oldest_age_s")})
+
+    def test_oldest_frames_are_evicted_over_budget(self):
+        queue = self.queue()
+        for cycle in range(20):
+            queue.put(frame(cycle), created_at=1000.0 + cycle)
+        budget = queue.bytes // 2
+        queue.configure(budget, EVICT_OLDEST)
+        self.assertLessEqual(queue.bytes, budget)
+        kept = queue.read_all()
+        self.assertEqual(frame(19)["data"], kept[0]["data"])
+        # The newest half is kept, contiguous
+        self.assertEqual([frame(c)["data"] for c in range(19, 19 - len(kept), -1)], [f["data"] for f in kept])
+        self.assertEqual(20 - len(kept), queue.stats()["evicted_frames"])
+
+    def test_downsampling_thins_the_oldest_frames_first(self):
+        queue = self.queue()
+        for cycle in range(32):
+            queue.put(frame(cycle), created_at=1000.0 + cycle)
+        budget = queue.bytes * 3 // 4
+        queue.configure(budget, EVICT_DOWNSAMPLE)
+        self.assertLessEqual(queue.bytes, budget)
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT created_at, weight FROM telemetry_queue ORDER BY id").fetchall()
+        conn.close()
+        # The oldest frame survives, standing for the ones dropped next to it
+        self.assertEqual((1000.0, 2), rows[0])
+        self.assertEqual(1031.0, rows[-1][0])
+        self.assertEqual(32, sum(weight for _, weight in rows))
+        self.assertTrue(all(weight <= MAX_WEIGHT for _, weight in rows))
+
+    def test_aged_frames_are_compacted_to_min_max_mean(self):
+        queue = self.queue()
+        frames = [frame(cycle, points=2) for cycle in range(30)]
+        for cycle, telemetry_data in enumerate(frames):
+            queue.put(telemetry_data, created_at=1200.0 + cycle * 10)
+        size = queue.bytes
+        # The period still running is left alone
+        self.assertEqual(20, queue.compact(60, 0, now=1480.0))
+        self.assertEqual(0, queue.compact(300, 0, now=1480.0))
+        self.assertEqual(5, queue.compact(60, 0, now=1500.0))
+        self.assertEqual(4, queue.compact(300, 0, now=1500.0))
+        self.assertEqual(1, queue.frames)
+        self.assertLess(queue.bytes, size / 10)
+
+        rolled = [line for line in queue.read_all()[0]["data"] if "device_id=0" in line]
+        self.assertEqual(1, len(rolled))
+        series, fields, timestamp = parse_line(rolled[0])
+        self.assertEqual("BMS,raptor=r1,hardware_id=1,device_id=0,resolution=300", series)
+        self.assertEqual(1200 * 10 ** 9, timestamp)
+        socs = [float(parse_line(f["data"][0])[1]["SOC"]) for f in frames]
+        self.assertEqual(str(min(socs)), fields["SOC_min"])
+        self.assertEqual(str(max(socs)), fields["SOC_max"])
+        self.assertAlmostEqual(sum(socs) / 30, float(fields["SOC"]))
+        self.assertEqual("30", fields["samples"])
+
+    def test_compacted_frames_keep_their_eviction_weight(self):
+        queue = self.queue()
+        for cycle in range(32):
+            queue.put(frame(cycle, points=2), created_at=1200.0 + cycle * 10)
+        queue.compact(60, 0, now=1560.0)
+        queue.configure(queue.bytes // 2, EVICT_DOWNSAMPLE)
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT weight, resolution FROM telemetry_queue ORDER BY id").fetchall()
+        conn.close()
+        # Compacted frames count their samples in their lines, they are dropped rather than thinned
+        self.assertEqual([(1, 60)] * len(rows), rows)
+        self.assertLess(len(rows), 6)
+
+    def migrate(self):
+        migrator = DatabaseMigrator()
+        migrator.db_path = self.db_path
+        self.assertTrue(migrator.migrate_to_latest())
+
+    def test_migrations_keep_the_compacted_frames(self):
+        queue = self.queue()
+        for cycle in range(5):
+            queue.put(frame(cycle, points=1), created_at=1200.0 + cycle * 10)
+        queue.compact(60, 0, now=1300.0)
+        TelemetryQueue.delete_instance()
+        self.migrate()
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual([(1, 60)], conn.execute("SELECT id, resolution FROM telemetry_queue").fetchall())
+        conn.close()
+
+    def test_migrations_add_the_resolution_column(self):
+        conn = sqlite3.connect(self.db_path)
+        # telemetry_queue as created by migration 5
+        conn.execute("CREATE TABLE telemetry_queue (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, "
+                     "weight INTEGER NOT NULL DEFAULT 1, lines INTEGER NOT NULL, size INTEGER NOT NULL, "
+                     "payload BLOB NOT NULL)")
+        conn.commit()
+        conn.close()
+        self.migrate()
+        queue = self.queue()
+        queue.put(frame(0, points=1), created_at=1200.0)
+        queue.put(frame(1, points=1), created_at=1210.0)
+        self.assertEqual(1, queue.compact(60, 0, now=1300.0))
+
+
+class FakeBroker:
+    """ Acknowledges publishes until the given one, which fails """
+
+    def __init__(self, fail_at: int = -1):
+        self.fail_at = fail_at
+        self.payloads = []
+
+    async def publish(self, mqtt_config, topic, payload, logger):
+        if len(self.payloads) == self.fail_at:
+            self.fail_at = -1
+            return False
+        self.payloads.append(json.loads(payload))
+        return True
+
+
+class BatchUploadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        TelemetryQueue.delete_instance()
+        # The uploader reaches the queue through DatabaseManager, the singleton is this one
+        self.queue = TelemetryQueue(os.path.join(self.tmp, "raptor.db"))
+        self.config = TelemetryConfig.from_dict({"mode": "mqtt", "interval": 10, "root_path": "raptor",
+                                                 "telemetry_path": "telemetry", "messages_path": "messages",
+                                                 "upload_batch_frames": 4})
+
+    def tearDown(self):
+        TelemetryQueue.delete_instance()
+        shutil.rmtree(self.tmp)
+
+    def upload(self, broker: FakeBroker) -> bool:
+        with mock.patch.object(mqtt_comms, "publish_payload", broker.publish):
+            return asyncio.run(mqtt_comms.upload_telemetry_data_mqtt(None, self.config, logging.getLogger()))
+
+    def upload_range(self, broker: FakeBroker, after_id: int, until_id: int, max_batches=None):
+        with mock.patch.object(mqtt_comms, "publish_payload", broker.publish):
+            return asyncio.run(mqtt_comms.upload_telemetry_batches(None, self.config, logging.getLogger(), after_id,
+                                                                   until_id, max_batches))
+
+    def test_acknowledged_batches_are_deleted_and_the_rest_kept(self):
+        for cycle in range(10):
+            self.queue.put(frame(cycle, points=2), created_at=1000.0 + cycle)
+        broker = FakeBroker(fail_at=1)
+        self.assertFalse(self.upload(broker))
+        self.assertEqual([frame(c, points=2)["data"] for c in range(4)], [f["data"] for f in broker.payloads[0]])
+        self.assertEqual(6, self.queue.frames)
+
+        self.assertTrue(self.upload(broker))
+        self.assertEqual([4, 4, 2], [len(batch) for batch in broker.payloads])
+        self.assertEqual((0, 0), (self.queue.frames, self.queue.bytes))
+
+    def test_live_frames_go_before_the_backlog(self):
+        ids = [self.queue.put(frame(cycle, points=1), created_at=1000.0 + cycle) for cycle in range(10)]
+        live_after = ids[7]
+        broker = FakeBroker()
+        # The live path sends the newest frames, the backfill the backlog one batch at a time, oldest first
+        self.assertTrue(self.upload_range(broker, live_after, ids[-1])[0])
+        success, sent = self.upload_range(broker, 0, live_after, max_batches=1)
+        self.assertTrue(success)
+        self.assertGreater(sent, 0)
+        self.assertEqual([[frame(8, 1)["data"], frame(9, 1)["data"]], [frame(c, 1)["data"] for c in range(4)]],
+                         [[f["data"] for f in batch] for batch in broker.payloads])
+        self.assertEqual(4, self.queue.frames)
+
+    def test_batches_are_bounded_by_bytes(self):
+        for cycle in range(3):
+            self.queue.put(frame(cycle), created_at=1000.0 + cycle)
+        frames = self.queue.read_batch(0, 10)
+        payload, count = mqtt_comms.batch_payload(frames, len(json.dumps(frames[0].to_payload())) + 10)
+        self.assertEqual(1, count)
+        self.assertEqual([frames[0].to_payload()], json.loads(payload))